@@ -5,542 +5,794 @@ author      = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.e
 
 #-------------------------------------------------
 
-import json
 import sys
 import os
-import glob
-
-from collections import defaultdict
-
 import time
-from lal import gpstime as lal_gpstime
-
-from glue.ligolw import ligolw
-from glue.ligolw import table
-from glue.ligolw import lsctables
-from glue.ligolw import utils as ligolw_utils
 
-from ligo.gracedb.rest import GraceDb
-
-import subprocess as sp
-
-from ConfigParser import SafeConfigParser
 from optparse import OptionParser
 
-#-------------------------------------------------
-
-def flag2filename( flag, start, dur, output_dir="." ):
-    flag = flag.split(":")
-    flag = "%s-%s"%(flag[0], "_".join(f.replace("-","_") for f in flag[1:]))
-    return "%s/%s-%d-%d.xml.gz"%(output_dir, flag, start, dur)
-
-def segDBcmd( url, flag, start, end, outfilename, dmt=False ):
-    ### ligolw_segment_query_dqsegdb -t https://segments.ligo.org -q -a H1:DMT-ANALYSIS_READY:1 -s 1130950800 -e 1131559200
-    if dmt:
-        return "ligolw_segment_query --dmt-files -q -a %s -s %d -e %d -o %s"%(flag, start, end, outfilename)
-    else:
-        return "ligolw_segment_query_dqsegdb -t %s -q -a %s -s %d -e %d -o %s"%(url, flag, start, end, outfilename)
-
-#-----------
-
-def segDBvetoDefcmd( url, vetoDef, start, end, output_dir=".", dmt=False ):
-    ### ligolw_segments_from_cats_dqsegdb
-    if dmt:
-        return "ligolw_segments_from_cats_dqsegdb --dmt-file -v %s -s %d -e %d -i -p -o %s"%(vetoDef, start, end, output_dir)
-    else:
-        return "ligolw_segments_from_cats_dqsegdb -t %s -v %s -s %d -e %d -i -p -o %s"%(url, vetoDef, start, end, output_dir)
-
-#-----------
+from segDb2grcDb import alerts
+from segDb2grcDb.gpstime import gps_time_now
 
-def allActivefilename( start, dur, output_dir="."):
-    return "%s/allActive-%d-%d.json"%(output_dir, start, dur)
+### everything else (including numpy and the GraceDb client) is imported below, once we know we have an event to process
+### this lets us reject alerts we do not care about without paying for those imports
 
-def segDBallActivecmd( url, gps, start_pad, end_pad, outfilename, activeOnly=False ):
-    cmd = "ligolw_dq_query_dqsegdb -t %s -s %d -e %d -o %s %d"%(url, start_pad, end_pad, outfilename, gps)
-    if activeOnly:
-        cmd += " -a"
-    return cmd
+#-------------------------------------------------
 
-#-----------
+def pollAgain( deadline ):
+    '''
+    whether we are polling for data (deadline is not None) and there is still time to try again before deadline
+    '''
+    return (deadline is not None) and (gps_time_now() < deadline)
 
-def writeLog( gdb, graceid, message, filename=None, tagname=[] ):
+def earlyMessage( deadline ):
     '''
-    delegates to gdb.writeLog but incorporates a common tagname for all uploads
+    a note about how long before deadline we were able to report, if we were polling for data
     '''
-    gdb.writeLog( graceid, message=message, filename=filename, tagname=['segDb2grcDb']+tagname )
+    if deadline is None:
+        return ""
+    return "<br>&nbsp;&nbsp;reported %.1f sec before the configured wait expired"%max(0, deadline-gps_time_now())
 
-def writeLabel( gdb, graceid, labels ):
+def instrument( func, scheduled, **tags ):
+    '''
+    wrap func so that every measurement made while it runs (in whichever thread the scheduler picks) is tagged with tags (see segDb2grcDb.metrics)
+    once func is done (rather than polling again), we also record how long after scheduled (time.time()) its last attempt started
     '''
-    delegates to gdb.writeLabel but is smart about handling cases where label was already applied
-    (turns out GraceDb is very friendly and doesn't raise an error if a label is already present)
+    def job( *args, **kwargs ):
+        start = time.time()
+        with metrics.context( **tags ):
+            ans = func( *args, **kwargs )
+            if ans is not False:
+                metrics.record( 'wait', start-scheduled )
+        return ans
+    job.__name__ = func.__name__ ### the scheduler reports errors by name
+    return job
+
+def hedgedFetch( query, flags, dmt, segdb_url, output_dir, deadline=None, hedge_budget=None, timeouts={}, verbose=False ):
     '''
-    for label in labels:
-        gracedb.writeLabel( opts.graceid, label ) ### GraceDb doesn't raise an error if label is already present, it only warns us
+    build a fetch (see fetchSegments) from query(start, end, output_dir, dmt, timeout, cancel), which retrieves flags from the DMT files in dmt or from segdb_url if dmt is None
+    flags are retrieved from their own source (dmt if supplied, otherwise SegDb) and queries are killed after that source's timeout
+    if hedge_budget is not None, flags read from DMT files are also requested from SegDb if the DMT files have not given a complete answer within hedge_budget seconds (see segDb2grcDb.hedge)
+    we only hedge once we've stopped polling, since incomplete answers are expected until then
+    the fetch also returns the source (dmt or segdb_url) that answered, so SegDb's answers are not cached as if they came from the DMT files
+    '''
+    primary = "dmt" if dmt else "segdb"
+    sources = [(primary, lambda start, end, cancel: query( start, end, output_dir, dmt, timeouts.get(primary), cancel ), timeouts.get(primary))]
+    if dmt and (hedge_budget is not None) and (not pollAgain( deadline )):
+        segdb_dir = os.path.join(output_dir, "segdb") ### keep the two queries from writing the same files
+        if not archive.inMemory():
+            makedirs( segdb_dir )
+        sources.append( ("segdb", lambda start, end, cancel: query( start, end, segdb_dir, None, timeouts.get('segdb'), cancel ), timeouts.get('segdb')) )
+    hedge = Hedge( sources, flags, budget=hedge_budget, verbose=verbose )
+
+    def fetch( start, end ):
+        outfilename, results, name = hedge( start, end )
+        return outfilename, results, dmt if name=="dmt" else segdb_url
+    return fetch
 
 #-------------------------------------------------
 
-parser = OptionParser(usage=usage, description=description)
+def processQuery( gracedb, graceid, gpstime, name, sections, fetch, start, end, outfilename, g_tags=[], qtags=[], skip_gracedb_upload=False, deadline=None, cache=None, source=None, collect=None, verbose=False ):
+    '''
+    retrieve segments for the flags described by sections (a list of segDb2grcDb.plan.SectionPlan) with fetch (see fetchSegments) and report the results for each flag to GraceDb
+    outfilename is where we record the results if they did not come entirely from a single query
+    if deadline is supplied, we are polling for data and return False without reporting anything if the window is not completely known for every flag before deadline
+    if collect is supplied, it is called with (flags, start, end, results) once we are done so that expressions can be evaluated (see segDb2grcDb.expressions.ExpressionCollector)
+    '''
+    flags = [section.name for section in sections]
+    dur = end - start
 
-parser.add_option("-v", "--verbose", default=False, action="store_true")
+    ### actually perform the query
+    try:
+        queryfilename, results, origin = fetchSegments( fetch, flags, start, end, cache=cache, source=source, verbose=verbose )
+    except QueryError as e: ### something went wrong with the query!
+        if pollAgain( deadline ): ### the data may simply not be available yet
+            return False
 
-parser.add_option("-g", "--graceid", default=None, type="string", help="if not supplied, looks for lvalert through sys.stdin and blocks")
+        if verbose:
+            print "\tWARNING: an error occured while querying for %s!\n%s"%(name, e)
 
-parser.add_option('-n', '--skip-gracedb-upload', default=False, action='store_true')
+        if not skip_gracedb_upload:
+            for flag in flags:
+                message = "%s<br>&nbsp;&nbsp;<strong>WARNING</strong>: an error occured while querying for this flag!"%flag
+                writeLog( gracedb, graceid, message=message, tagname=qtags )
 
-opts, args = parser.parse_args()
+        if collect is not None:
+            collect( flags, start, end, {} )
 
-if len(args)!=1:
-    raise ValueError("please exactly one config file as an input argument")
+        return ### skip the rest, there is nothing to report
 
-#------------------------
+    if pollAgain( deadline ) and not allKnown( results, flags, dur ):
+        if verbose:
+            print "        %s : not all flags are known throughout [%d, %d], polling again"%(name, start, end)
+        return False
 
-### extract data from LVAlert through stdin if needed
-if not opts.graceid:
-    alert = sys.stdin.read()
-    if opts.verbose:
-        print "alert received:\n%s"%alert
-    alert = json.loads(alert)
-    if alert['alert_type'] != 'new':
-        if opts.verbose:
-            print "alert_type!=new, ignoring..."
-        sys.exit(0)
-    opts.graceid = alert['uid']
+    ### record what we found if it did not all come from a single query
+    if origin=="query":
+        outfilename = queryfilename
+    else:
+        outfilename = recordSegments( outfilename, [(flag,)+results[flag] for flag in flags if flag in results], comment=origin )
 
-#------------------------
+    ### report to GraceDb
+    if not skip_gracedb_upload:
+        ### report query results
+        message = "SegDb query for %s within [%d, %d]"%(", ".join(flags), start, end)
+        if origin=="cache":
+            message += "<br>&nbsp;&nbsp;answered from the local segment cache"
+        elif origin=="cache+query":
+            message += "<br>&nbsp;&nbsp;partially answered from the local segment cache"
+        elif origin=="shared":
+            message += "<br>&nbsp;&nbsp;answered by a query made at the same time for another event"
+        elif origin=="shared+query":
+            message += "<br>&nbsp;&nbsp;partially answered by a query made at the same time for another event"
+        message += earlyMessage( deadline )
+        if verbose:
+            print "        %s"%message
+        writeLog( gracedb, graceid, message=message, filename=outfilename, tagname=qtags )
 
-### read in config file
-if opts.verbose:
-    print "reading config from : %s"%args[0]
-config = SafeConfigParser()
-config.read( args[0] )
+        ### report each flag separately
+        reportResults( gracedb, graceid, gpstime, dict((section.name, section) for section in sections), flags, results, dur, g_tags=g_tags, qtags=qtags, verbose=verbose )
 
-#-------------------------------------------------
+    ### evaluate any expressions that depend on these flags
+    if collect is not None:
+        collect( flags, start, end, results )
 
-### figure out where we're writing segment files locally
-output_dir = config.get('general', 'output-dir')
-if not os.path.exists(output_dir):
-    os.makedirs( output_dir )
+#------------------------
 
-### find which GraceDb we're using and pull out parameters of this event
-if config.has_option('general', 'gracedb_url'):
-    gracedb = GraceDb( config.get('general', 'gracedb_url') )
-else:
-    gracedb = GraceDb()
+def processFlag( gracedb, graceid, gpstime, section, segdb_url, output_dir, g_tags=[], g_qtags=[], skip_gracedb_upload=False, deadline=None, cache=None, collect=None, hedge_budget=None, timeouts={}, verbose=False ):
+    '''
+    query for a single flag (described by its segDb2grcDb.plan.SectionPlan) and report the results to GraceDb
+    this is called by the scheduler once data should be available
+    if deadline is supplied, we are polling for data and return False without reporting anything if the window is not completely known before deadline
+    if cache is supplied (see segDb2grcDb.cache.SegmentCache), we only query for the part of the window that is not already cached
+    collect is passed to processQuery, hedge_budget and timeouts to hedgedFetch
+    '''
+    flag = section.name
+    if verbose:
+        print "    %s"%flag
 
-event = gracedb.event( opts.graceid ).json() ### query for this event
-gpstime = float(event['gpstime'])
-if opts.verbose:
-    print "processing %s -> %.6f"%(opts.graceid, gpstime)
+    ### figure out queryTags
+    qtags = g_qtags + section.extra_queryTags
 
-### find which segDB we're using
-if config.has_option('general', 'segdb-url'):
-    segdb_url = config.get('general', 'segdb-url')
-else:
-    segdb_url = 'https://segments.ligo.org'
-if opts.verbose:
-    print "searching for segments in : %s"%segdb_url
+    ### figure out bounds for the query
+    start, end, dur = queryWindow( gpstime, section.look_left, section.look_right )
 
-### figure out global tags and queryTags
-g_tags  = config.get('general', 'tags').split()
-g_qtags = config.get('general', 'queryTags').split()
+    ### set environment for this query
+    dmt = section.dmt
 
-### report that we started searching
-if not opts.skip_gracedb_upload:
-    message = "began searching for segments in : %s"%(segdb_url)
-    writeLog( gracedb, opts.graceid, message=message, tagname=g_tags )    
+    def query( start, end, output_dir, dmt, timeout, cancel ):
+        return queryFlag( flag, start, end, segdb_url, output_dir, dmt=dmt, timeout=timeout, cancel=cancel, verbose=verbose )
+    fetch = hedgedFetch( query, [flag], dmt, segdb_url, output_dir, deadline=deadline, hedge_budget=hedge_budget, timeouts=timeouts, verbose=verbose )
 
-#---------------------------------------------------------------------------------------------------
+    return processQuery( gracedb, graceid, gpstime, flag, [section], fetch, start, end, flag2filename( flag, start, dur, output_dir ), g_tags=g_tags, qtags=qtags, skip_gracedb_upload=skip_gracedb_upload, deadline=deadline, cache=cache, source=dmt or segdb_url, collect=collect, verbose=verbose )
 
-### iterate through flags, uploading each to GraceDB in turn
-flags = config.get( 'general', 'flags' ).split()
-flags.sort( key=lambda l: config.getfloat(l,'wait')+config.getfloat(l,'look_right') ) ### sort by how soon we can launch query
+#------------------------
 
-for flag in flags:
-    if opts.verbose:
-        print "    %s"%flag
+def processFlagGroup( gracedb, graceid, gpstime, name, sections, segdb_url, output_dir, g_tags=[], g_qtags=[], skip_gracedb_upload=False, deadline=None, cache=None, collect=None, hedge_budget=None, timeouts={}, verbose=False ):
+    '''
+    query for several compatible flags (see segDb2grcDb.plan.QueryPlan.groups), described by their segDb2grcDb.plan.SectionPlan, at once and report the results for each flag to GraceDb
+    we do this by writing a veto definer containing all the flags and requesting individual results
+    this is called by the scheduler once data should be available
+    if deadline is supplied, we are polling for data and return False without reporting anything if the window is not completely known for every flag before deadline
+    if cache is supplied (see segDb2grcDb.cache.SegmentCache), we only query for the part of the window that is not already cached
+    collect is passed to processQuery, hedge_budget and timeouts to hedgedFetch
+    '''
+    if len(sections)==1: ### nothing to batch
+        return processFlag( gracedb, graceid, gpstime, sections[0], segdb_url, output_dir, g_tags=g_tags, g_qtags=g_qtags, skip_gracedb_upload=skip_gracedb_upload, deadline=deadline, cache=cache, collect=collect, hedge_budget=hedge_budget, timeouts=timeouts, verbose=verbose )
 
-    ### figure out global tags and queryTags
-    tags  = g_tags + config.get(flag, 'extra_tags').split()
-    qtags = g_qtags + config.get(flag, 'extra_queryTags').split()
+    flags = [section.name for section in sections]
+    if verbose:
+        print "    %s : %s"%(name, ", ".join(flags))
 
-    ### figure out bounds for the query
-    start = int(gpstime-config.getfloat(flag, 'look_left'))
-    end = gpstime+config.getfloat(flag, 'look_right')
-    if end%1:
-        end = int(end) + 1
-    else:
-        end = int(end)
-    dur = end-start
+    ### figure out queryTags (tags are handled separately for each flag)
+    qtags = g_qtags + sorted(set(sum([section.extra_queryTags for section in sections], [])))
+
+    ### figure out bounds for the query, which are shared by all flags in the group
+    start, end, dur = queryWindow( gpstime, sections[0].look_left, sections[0].look_right )
 
     ### set environment for this query
-    dmt = config.has_option(flag, 'dmt')
-    if dmt:
-        os.environ['ONLINEDQ'] = config.get(flag, 'dmt')
+    dmt = sections[0].dmt
 
-    ### wait until data becomes available
-    wait = end + config.getfloat(flag, 'wait') - lal_gpstime.gps_time_now()
-    if wait > 0:
-        if opts.verbose:
-            print "        waiting %.3f sec"%(wait)
-        time.sleep( wait )
+    def query( start, end, output_dir, dmt, timeout, cancel ):
+        return queryFlagGroup( name, flags, start, end, segdb_url, output_dir, dmt=dmt, timeout=timeout, cancel=cancel, verbose=verbose )
+    fetch = hedgedFetch( query, flags, dmt, segdb_url, output_dir, deadline=deadline, hedge_budget=hedge_budget, timeouts=timeouts, verbose=verbose )
 
-    ### actually perform the query
-    outfilename = flag2filename( flag, start, dur, output_dir)
-    cmd = segDBcmd( segdb_url, flag, start, end, outfilename, dmt=dmt )
-    if opts.verbose:
-        print "        %s"%cmd
-    proc = sp.Popen( cmd.split(), stdout=sp.PIPE, stderr=sp.PIPE )
-    output = proc.communicate()
+    return processQuery( gracedb, graceid, gpstime, name, sections, fetch, start, end, "%s/%s-%d-%d.xml.gz"%(output_dir, name, start, dur), g_tags=g_tags, qtags=qtags, skip_gracedb_upload=skip_gracedb_upload, deadline=deadline, cache=cache, source=dmt or segdb_url, collect=collect, verbose=verbose )
 
-    ### check returncode for errors
-    if proc.returncode: ### something went wrong with the query!
-        if opts.verbose:
-            print "\tWARNING: an error occured while querying for this flag!\n%s"%output[1]
+#------------------------
 
-        if not opts.skip_gracedb_upload:
-            message = "%s<br>&nbsp;&nbsp;<strong>WARNING</strong>: an error occured while querying for this flag!"%flag
-            writeLog( gracedb, opts.graceid, message=message, tagname=qtags )
+def processDMTFlags( gracedb, graceid, gpstime, name, sections, segdb_url, output_dir, g_tags=[], g_qtags=[], skip_gracedb_upload=False, deadline=None, cache=None, collect=None, hedge_budget=None, timeouts={}, verbose=False ):
+    '''
+    read segments for flags (described by their segDb2grcDb.plan.SectionPlan) that share a DMT directory and window directly from the DMT files and report the results for each flag to GraceDb
+    this avoids launching ligolw_segment_query --dmt-files and scanning the whole directory for each query
+    this is called by the scheduler once data should be available
+    if deadline is supplied, we are polling for data and return False without reporting anything if the window is not completely known for every flag before deadline
+    if cache is supplied (see segDb2grcDb.cache.SegmentCache), we only read the part of the window that is not already cached
+    collect is passed to processQuery, hedge_budget and timeouts to hedgedFetch (which may also query segdb_url)
+    '''
+    flags = [section.name for section in sections]
+    if verbose:
+        print "    %s : %s"%(name, ", ".join(flags))
 
-        continue ### skip the rest, it doesn't make sense to process a non-existant file
+    ### figure out queryTags (tags are handled separately for each flag)
+    qtags = g_qtags + sorted(set(sum([section.extra_queryTags for section in sections], [])))
 
-    ### report to GraceDb
-    if not opts.skip_gracedb_upload:
-        ### set up labels
-        actvLabels = config.get(flag, 'activeLabels').split()
-        inactvLabels = config.get(flag, 'inactiveLabels').split()
-        flagLabels = config.get(flag, 'flaggedLabels').split()
-        unflagLabels = config.get(flag, 'unflaggedLabels').split()
+    ### figure out bounds for the query, which are shared by all flags
+    start, end, dur = queryWindow( gpstime, sections[0].look_left, sections[0].look_right )
 
-        ### report query results
-        message = "SegDb query for %s within [%d, %d]"%(flag, start, end)
-        if opts.verbose:
-            print "        %s"%message
-        writeLog( gracedb, opts.graceid, message=message, filename=outfilename, tagname=qtags )
-
-        ### process segments into summary statements
-        xmldoc = ligolw_utils.load_filename(outfilename, contenthandler=lsctables.use_in(ligolw.LIGOLWContentHandler))
-
-        sdef = table.get_table(xmldoc, lsctables.SegmentDefTable.tableName)
-        ssum = table.get_table(xmldoc, lsctables.SegmentSumTable.tableName)
-        seg = table.get_table(xmldoc, lsctables.SegmentTable.tableName)
-
-        ### get segdef_id
-#        segdef_id = next(a.segment_def_id for a in sdef if a.name==flag.split(":")[1])
-        segdef_id = next(a.segment_def_id for a in sdef if a.name=='RESULT')
-
-        ### write message as we process segments
-        message = "%s"%flag
-
-        ### define the fraction of the time this flag is defined
-        ### get list of defined times
-        defd = 0.0
-        for a in ssum:
-            if a.segment_def_id==segdef_id:
-                defd += a.end_time+1e-9*a.end_time_ns - a.start_time+1e-9*a.start_time_ns        
-        message += "<br>&nbsp;&nbsp;known : %.3f/%d=%.3f%s"%(defd, dur, defd/dur * 100, "%")
-
-        ### define the fraction of the time this flag is active?
-        # get list of  segments
-        actv = 0.0
-        flagged = 0
-        labels = [] ### labels to be applied
-        for a in seg:
-            if a.segment_def_id==segdef_id:
-                actv += a.end_time+1e-9*a.end_time_ns - a.start_time+1e-9*a.start_time_ns
-                if (a.end_time+1e-9*a.end_time_ns >= gpstime) and (gpstime >= a.start_time+1e-9*a.start_time_ns):
-                    flagged += 1
-
-        message += "<br>&nbsp;&nbsp;active : %.3f/%d=%.3f%s"%(actv, dur, actv/dur * 100, "%")
-        if actv:
-            if actvLabels:
-                message += " <strong>Will label as : %s.</strong>"%(", ".join(actvLabels))
-                labels += actvLabels
-        else:
-            if inactvLabels:
-                message += " <strong>Will label as : %s.</strong>"%(", ".join(inactvLabels))
-                labels += inactvLabels
+    dmt = sections[0].dmt
 
-        if flagged:
-            message += "<br>&nbsp;&nbsp;<strong>candidate is within these segments!</strong>"
-            if flagLabels:
-                message += " <strong>Will label as : %s.</strong>"%(", ".join(flagLabels))
-                labels += flagLabels
-            
+    def query( start, end, output_dir, source, timeout, cancel ):
+        if source: ### reading the files is quick, so there is nothing to time out or cancel
+            return queryDMTFlags( name, flags, start, end, source, output_dir, verbose=verbose )
+        elif len(flags)==1:
+            return queryFlag( flags[0], start, end, segdb_url, output_dir, timeout=timeout, cancel=cancel, verbose=verbose )
         else:
-            message += "<br>&nbsp;&nbsp;<strong>candidate is not within these segments!</strong>"
-            if unflagLabels:
-                message += " <strong>Will label as : %s.</strong>"%(", ".join(unflagLabels))
-                labels += unflagLabels
+            return queryFlagGroup( name, flags, start, end, segdb_url, output_dir, timeout=timeout, cancel=cancel, verbose=verbose )
+    fetch = hedgedFetch( query, flags, dmt, segdb_url, output_dir, deadline=deadline, hedge_budget=hedge_budget, timeouts=timeouts, verbose=verbose )
 
-        ### post message
-        if opts.verbose:
-            print "        %s"%message
-        writeLog( gracedb, opts.graceid, message, tagname=tags )
+    if len(flags)==1:
+        outfilename = flag2filename( flags[0], start, dur, output_dir )
+    else:
+        outfilename = "%s/%s-%d-%d.xml.gz"%(output_dir, name, start, dur)
+    return processQuery( gracedb, graceid, gpstime, name, sections, fetch, start, end, outfilename, g_tags=g_tags, qtags=qtags, skip_gracedb_upload=skip_gracedb_upload, deadline=deadline, cache=cache, source=dmt, collect=collect, verbose=verbose )
 
-        ### apply labels
-        writeLabel( gracedb, opts.graceid, set(labels) )
+#------------------------
 
-#---------------------------------------------------------------------------------------------------
+def reportExpression( gracedb, graceid, gpstime, section, expression, start, end, known, active, g_tags=[], g_qtags=[], skip_gracedb_upload=False, verbose=False ):
+    '''
+    report the result of an expression (see segDb2grcDb.expressions) within [start, end] to GraceDb just like we report a flag
+    section is the expression's segDb2grcDb.plan.SectionPlan
+    this is called once all of the flags it depends on have been retrieved, and does not require any more queries
+    '''
+    name = section.name
+    if verbose:
+        print "    %s = %s"%(name, expression.text)
 
-### iterate through veto definers
-vetoDefiners = config.get( 'general', 'vetoDefiners' ).split()
-vetoDefiners.sort( key=lambda l: config.getfloat(l,'wait')+config.getfloat(l,'look_right') ) ### sort by how soon we can launch query
+    if skip_gracedb_upload:
+        return
 
-for vetoDefiner in vetoDefiners:
-    if opts.verbose:
-        print "    %s"%vetoDefiner
+    qtags = g_qtags + section.extra_queryTags
+    if end <= start:
+        message = "%s = %s<br>&nbsp;&nbsp;<strong>WARNING</strong>: the windows for these flags do not overlap!"%(name, expression.text)
+        writeLog( gracedb, graceid, message=message, tagname=qtags )
+        return
 
-    ### set up tags
-    tags  = g_tags + config.get(vetoDefiner, 'extra_tags').split()
-    qtags = g_qtags + config.get(vetoDefiner, 'extra_queryTags').split()
+    message = "%s = %s within [%d, %d]<br>&nbsp;&nbsp;evaluated from the segments already retrieved for these flags"%(name, expression.text, start, end)
+    if verbose:
+        print "        %s"%message
+    writeLog( gracedb, graceid, message=message, tagname=qtags )
 
-    ### set up GraceDB upload info
-    message = "%s"%(vetoDefiner)
+    reportResults( gracedb, graceid, gpstime, {name:section}, [name], {name:(known, active)}, end-start, g_tags=g_tags, qtags=qtags, verbose=verbose )
 
-    ### figure out query range
-    start = int(gpstime-config.getfloat(vetoDefiner, 'look_left'))
-    end = gpstime+config.getfloat(vetoDefiner, 'look_right')
-    if end%1:
-        end = int(end) + 1
-    else:
-        end = int(end)
-    dur = end-start
+def reportMissingExpression( gracedb, graceid, section, expression, flags, g_tags=[], g_qtags=[], skip_gracedb_upload=False, verbose=False ):
+    '''
+    report that we could not evaluate an expression (described by its segDb2grcDb.plan.SectionPlan) because we could not retrieve some of the flags it depends on
+    '''
+    message = "%s = %s<br>&nbsp;&nbsp;<strong>WARNING</strong>: could not evaluate this expression without %s!"%(section.name, expression.text, ", ".join(flags))
+    if verbose:
+        print "    %s"%message
 
-    ### set environment for this query
-    dmt = config.has_option(vetoDefiner, 'dmt')
-    if dmt:
-        os.environ['ONLINEDQ'] = config.get(vetoDefiner, 'dmt')
+    if not skip_gracedb_upload:
+        writeLog( gracedb, graceid, message=message, tagname=g_qtags + section.extra_queryTags )
 
-    ### set up output dir
-    this_output_dir = "%s/%s"%(output_dir, vetoDefiner)
-    if not os.path.exists(this_output_dir):
-        os.makedirs(this_output_dir)
+#------------------------
 
-    ### wait for data to become available
-    wait = end + config.getfloat(vetoDefiner, 'wait') - lal_gpstime.gps_time_now() ### wait until we're past the end time
-    if wait > 0:
-        if opts.verbose:
-            print "        waiting %.3f sec"%(wait)
-        time.sleep( wait )
+def processVetoDefiner( gracedb, graceid, gpstime, section, segdb_url, output_dir, g_tags=[], g_qtags=[], skip_gracedb_upload=False, cache=None, native_dmt=False, timeouts={}, verbose=False ):
+    '''
+    retrieve all flags within a veto definer (described by its segDb2grcDb.plan.SectionPlan), apply padding and categories ourselves (see segDb2grcDb.vetodef) and report the results to GraceDb
+    the flags for each IFO are retrieved concurrently with the same queries (and cache) we use for individual flags, and each query is killed after its source's timeout
+    this is called by the scheduler once data should be available
+    '''
+    vetoDefiner = section.name
+    if verbose:
+        print "    %s"%vetoDefiner
 
-    ### run segDB query
-    cmd = segDBvetoDefcmd( segdb_url, config.get(vetoDefiner, 'path'), start, end, output_dir=this_output_dir, dmt=dmt )
-    if opts.verbose:
-        print "        %s"%cmd
-    proc = sp.Popen( cmd.split(), stdout=sp.PIPE, stderr=sp.PIPE )
-    output = proc.communicate()
+    ### set up tags
+    tags  = g_tags + section.extra_tags
+    qtags = g_qtags + section.extra_queryTags
 
-    ### check return code for errors
-    if proc.returncode: ### something went wrong with the query!
-        if opts.verbose:
-            print "        WARNING: an error occured while querying for this vetoDefiner!\n%s"%output[1]
+    ### figure out query range
+    start, end, dur = queryWindow( gpstime, section.look_left, section.look_right )
 
-        if not opts.skip_gracedb_upload:
-            querymessage = "%s<br>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp<strong>WARNING</strong>: an error occured while querying for this vetoDefiner!"%flag
-            writeLog( gracedb, opts.graceid, message=querymessage, tagname=qtags )
+    ### set environment for this query
+    dmt = section.dmt
 
-        continue ### skip the rest, it doesn't make sense to process a non-existant file
+    ### set up output dir
+    this_output_dir = "%s/%s"%(output_dir, vetoDefiner)
+    if not archive.inMemory():
+        makedirs( this_output_dir )
+
+    ### read the veto definer (only parsed again if it has changed) and figure out which flags we need
+    ### padding can reach outside of [start, end], so we retrieve flags over a wider window
+    try:
+        definer = vetodef.loadVetoDefiner( section.path )
+    except (IOError, OSError, ValueError) as e:
+        definer = None
+        error = str(e)
+    else:
+        qstart, qend = definer.window( start, end )
+        ifos = defaultdict( set )
+        for i in definer.rows( start, end ):
+            ifos[definer.ifos[i]].add( definer.flags[i] )
+
+        def query( ifo ):
+            flags = sorted(ifos[ifo])
+            name = "%s-%s"%(vetoDefiner, ifo)
+            if dmt and native_dmt: ### read DMT files ourselves
+                fetch = lambda s, e: queryDMTFlags( name, flags, s, e, dmt, this_output_dir, verbose=verbose )
+            else:
+                fetch = lambda s, e: queryFlagGroup( name, flags, s, e, segdb_url, this_output_dir, dmt=dmt, timeout=timeouts.get("dmt" if dmt else "segdb"), verbose=verbose )
+            with metrics.context( graceid=graceid, flag=vetoDefiner, source="dmt" if dmt else "segdb" ): ### the pool's threads do not inherit our tags
+                try:
+                    return fetchSegments( fetch, flags, qstart, qend, cache=cache, source=dmt or segdb_url, verbose=verbose )[1]
+                except QueryError as e:
+                    if verbose:
+                        print "        WARNING: an error occured while querying for %s -> %s!\n%s"%(vetoDefiner, ifo, e)
+                    return {}
+
+        results = {}
+        if ifos:
+            pool = ThreadPool( len(ifos) )
+            try:
+                for found in pool.map( query, sorted(ifos.keys()) ):
+                    results.update( found )
+            finally:
+                pool.close()
+
+        missing = sorted(set(sum([list(flags) for flags in ifos.values()], [])) - set(results.keys()))
+        error = "could not retrieve %s"%(", ".join(missing)) if missing else None
+
+    ### check for errors
+    if error: ### something went wrong with the query!
+        if verbose:
+            print "        WARNING: an error occured while querying for %s!\n%s"%(vetoDefiner, error)
+
+        if not skip_gracedb_upload:
+            querymessage = "%s<br>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp<strong>WARNING</strong>: an error occured while querying for this vetoDefiner!"%vetoDefiner
+            writeLog( gracedb, graceid, message=querymessage, tagname=qtags )
+
+        if definer is None:
+            return ### skip the rest, there is nothing to evaluate
+
+    ### apply padding and categories
+    with metrics.timer( 'summary', flag=vetoDefiner ):
+        categories = definer.evaluate( results, start, end, cumulative=section.cumulative )
+
+    ### record what we found
+    outfilename = "%s/%s-%d-%d.xml.gz"%(this_output_dir, vetoDefiner, start, dur)
+    rows = []
+    for ifo in sorted(categories.keys()):
+        for category in sorted(categories[ifo].keys()):
+            known, active, _ = categories[ifo][category]
+            rows.append( ("%s:VETO_%s:1"%(ifo, category), known, active) )
+    outfilename = recordSegments( outfilename, rows, comment=section.path )
 
     ### upload to GraceDb
-    if not opts.skip_gracedb_upload:
+    if not skip_gracedb_upload:
+        querymessage = "SegDb query for %s within [%d, %d]"%(vetoDefiner, start, end)
+        if verbose:
+            print "        %s"%querymessage
+        writeLog( gracedb, graceid, message=querymessage, filename=outfilename, tagname=qtags )
+
         ### set up labels
-        actvLabels = config.get(vetoDefiner, 'activeLabels').split()
-        flagLabels = config.get(vetoDefiner, 'flaggedLabels').split()
-
-        ### collect results of the query and format them into a reasonable data structure
-        ### figure out which IFOs are avaiable
-        ifos = defaultdict( list )
-        for xml in glob.glob("%s/*-VETOTIME_CAT*-%d-%d.xml"%(this_output_dir, start, dur)):
-            ifos[os.path.basename(xml).split('-')[0]].append( xml )
-
-        ### figure out which categories are available for each IFO
-        for ifo, val in ifos.items():
-            cats = defaultdict( list )
-            for xml in val:
-                cats[os.path.basename(xml).split("-")[1].split("_")[-1]].append( xml )
-            ifos[ifo] = cats
+        actvLabels = section.activeLabels
+        flagLabels = section.flaggedLabels
 
         ### iterate through IFOs and through Categories, extracting individual flags and summary statements
+        gps_ns = segments.gps2ns( gpstime )
         header = "%s"%vetoDefiner
         body = ""
         labels = []
-        for ifo in sorted(ifos.keys()):
-            if opts.verbose:
+        for ifo in sorted(categories.keys()):
+            if verbose:
                 print "    working on IFO : %s"%ifo
 
-            for category in sorted(ifos[ifo].keys()):
-                if opts.verbose:
+            for category in sorted(categories[ifo].keys()):
+                if verbose:
                     print "            working on category : %s"%category
 
-                for xml in ifos[ifo][category]:
-                    querymessage = "SegDb query for %s -> %s:%s within [%d, %d]"%(vetoDefiner, ifo, category, start, end)
-                    if opts.verbose:
-                        print "                %s"%querymessage
-                    writeLog( gracedb, opts.graceid, message=querymessage, filename=xml, tagname=qtags )
-
-                    if opts.verbose:
-                        print "                reading : %s"%xml
-                    xmldoc = ligolw_utils.load_filename(xml, contenthandler=lsctables.use_in(ligolw.LIGOLWContentHandler))
-                    
-                    sdef = table.get_table(xmldoc, lsctables.SegmentDefTable.tableName)
-                    ssum = table.get_table(xmldoc, lsctables.SegmentSumTable.tableName)
-                    seg = table.get_table(xmldoc, lsctables.SegmentTable.tableName)
-
-                    vetoDef = table.get_table(xmldoc, lsctables.VetoDefTable.tableName)
-
-                    ### extract info about all flags together (as a category)
-                    vetoCATname = 'VETO_%s'%category
-                    segdef_id = next(a.segment_def_id for a in sdef if a.name==vetoCATname)
-
-                    header += "<br>&nbsp;&nbsp;%s:%s"%(ifo, category)
-
-                    ### define the fraction of the time this flag is defined
-                    ### get list of defined times
-                    defd = 0.0
-                    for a in ssum:
-                        if a.segment_def_id==segdef_id:
-                            defd += a.end_time+1e-9*a.end_time_ns - a.start_time+1e-9*a.start_time_ns
-                    header += "<br>&nbsp;&nbsp;&nbsp;&nbsp;known : %.3f/%d=%.3f%s"%(defd, dur, defd/dur * 100, "%")
-
-                    ### define the fraction of the time this flag is active?
-                    # get list of  segments
-                    actv = 0.0
-                    flagged = 0
-                    for a in seg:
-                        if a.segment_def_id==segdef_id:
-                            actv += a.end_time+1e-9*a.end_time_ns - a.start_time+1e-9*a.start_time_ns
-                            if (a.end_time+1e-9*a.end_time_ns >= gpstime) and (gpstime >= a.start_time+1e-9*a.start_time_ns):
-                                flagged += 1
-
-                    header += "<br>&nbsp;&nbsp;&nbsp;&nbsp;active : %.3f/%d=%.3f%s"%(actv, dur, actv/dur * 100, "%")
-                    if actv:
-                        if actvLabels:
-                            header += " <strong>Will label as : %s</strong>"%(", ".join(actvLabels))
-                            labels += actvLabels
-
-                    if flagged:
-                        header += "<br>&nbsp;&nbsp;&nbsp;&nbsp;<strong>candidate FAILS %s:%s data quality checks</strong>"%(ifo, category)
-                        if flagLabels:
-                            header += " <strong>Will label as : %s.</strong>"%(", ".join(flagLabels))
-                            labels += flagLabels
+                known, active, flags = categories[ifo][category]
 
-                    else:
-                        header += "<br>&nbsp;&nbsp;&nbsp;&nbsp;<strong>candidate PASSES %s:%s data quality checks</strong>"%(ifo, category)
+                ### extract info about all flags together (as a category)
+                header += "<br>&nbsp;&nbsp;%s:%s"%(ifo, category)
 
-                    ### extract info about individual flags
-                    flags = {}
-                    for a in sdef: ### map flags to seg_def_id
-                        if a.name!=vetoCATname:
-                            flags["%s:%s:%s"%(a.ifos, a.name, a.version)] = a.segment_def_id
+                defd, actv = segments.ns2gps(segments.duration(known)), segments.ns2gps(segments.duration(active))
+                header += "<br>&nbsp;&nbsp;&nbsp;&nbsp;known : %.3f/%d=%.3f%s"%(defd, dur, defd/dur * 100, "%")
+                header += "<br>&nbsp;&nbsp;&nbsp;&nbsp;active : %.3f/%d=%.3f%s"%(actv, dur, actv/dur * 100, "%")
+                if actv:
+                    if actvLabels:
+                        header += " <strong>Will label as : %s</strong>"%(", ".join(actvLabels))
+                        labels += actvLabels
 
-                    for flag in sorted(flags.keys()): ### analyze each flag individually
-                        segdef_id = flags[flag]
+                if segments.contains( active, gps_ns ):
+                    header += "<br>&nbsp;&nbsp;&nbsp;&nbsp;<strong>candidate FAILS %s:%s data quality checks</strong>"%(ifo, category)
+                    if flagLabels:
+                        header += " <strong>Will label as : %s.</strong>"%(", ".join(flagLabels))
+                        labels += flagLabels
 
-                        body += "<br>%s (%s:%s)"%(flag, ifo, category)
+                else:
+                    header += "<br>&nbsp;&nbsp;&nbsp;&nbsp;<strong>candidate PASSES %s:%s data quality checks</strong>"%(ifo, category)
 
-                        ### define the fraction of the time this flag is defined
-                        ### get list of defined times
-                        defd = 0.0
-                        for a in ssum:
-                            if a.segment_def_id==segdef_id:
-                                defd += a.end_time+1e-9*a.end_time_ns - a.start_time+1e-9*a.start_time_ns
-                        body += "<br>&nbsp;&nbsp;known : %.3f/%d=%.3f%s"%(defd, dur, defd/dur * 100, "%")
+                ### extract info about individual flags
+                for flag in sorted(flags.keys()): ### analyze each flag individually
+                    known, active = flags[flag]
 
-                        ### define the fraction of the time this flag is active?
-                        # get list of  segments
-                        actv = 0.0
-                        flagged = 0
-                        for a in seg:
-                            if a.segment_def_id==segdef_id:
-                                actv += a.end_time+1e-9*a.end_time_ns - a.start_time+1e-9*a.start_time_ns
-                                if (a.end_time+1e-9*a.end_time_ns >= gpstime) and (gpstime >= a.start_time+1e-9*a.start_time_ns):
-                                    flagged += 1
+                    body += "<br>%s (%s:%s)"%(flag, ifo, category)
 
-                        body += "<br>&nbsp;&nbsp;active : %.3f/%d=%.3f%s"%(actv, dur, actv/dur * 100, "%")
+                    defd, actv = segments.ns2gps(segments.duration(known)), segments.ns2gps(segments.duration(active))
+                    body += "<br>&nbsp;&nbsp;known : %.3f/%d=%.3f%s"%(defd, dur, defd/dur * 100, "%")
+                    body += "<br>&nbsp;&nbsp;active : %.3f/%d=%.3f%s"%(actv, dur, actv/dur * 100, "%")
 
-                        if flagged:
-                            body += "<br>&nbsp;&nbsp;<strong>candidate IS within these segments</strong>"
+                    if segments.contains( active, gps_ns ):
+                        body += "<br>&nbsp;&nbsp;<strong>candidate IS within these segments</strong>"
 
-                        else:
-                            body += "<br>&nbsp;&nbsp;<strong>candidate IS NOT within these segments</strong>"
+                    else:
+                        body += "<br>&nbsp;&nbsp;<strong>candidate IS NOT within these segments</strong>"
 
         ### print the message
         message = header+"<br>"+body
-        if opts.verbose:
+        if verbose:
             print "        %s"%message
-        writeLog( gracedb, opts.graceid, message, tagname=tags )
+        writeLog( gracedb, graceid, message, tagname=tags )
 
         ### apply labels
-        writeLabel( gracedb, opts.graceid, set(labels) )
+        writeLabel( gracedb, graceid, set(labels) )
 
-#---------------------------------------------------------------------------------------------------
+#------------------------
 
-### report all active flags
-if config.getboolean("general", "allActive"):
-    if opts.verbose:
+def processAllActive( gracedb, graceid, gpstime, section, segdb_url, output_dir, g_tags=[], g_qtags=[], skip_gracedb_upload=False, timeouts={}, verbose=False ):
+    '''
+    find every active flag and report the results to GraceDb
+    section is the allActive section's segDb2grcDb.plan.SectionPlan
+    this is called by the scheduler once data should be available
+    flags are found with segDb2grcDb.allactive, reading the DMT files under the section's dmt directory if it has one and otherwise querying SegDb
+    we give up on anything still running after that source's timeout
+    '''
+    if verbose:
         print "    allActive"
 
     ### set up tags
-    tags  = g_tags + config.get('allActive', 'extra_tags').split()
-    qtags = g_qtags + config.get('allActive', 'extra_queryTags').split()
+    tags  = g_tags + section.extra_tags
+    qtags = g_qtags + section.extra_queryTags
 
     ### get query bounds
-    start = int(gpstime-config.getfloat('allActive', 'look_left'))
-    end   = gpstime+config.getfloat('allActive', 'look_right')
-    if end%1:
-        end = int(end) + 1
-    else:
-        end = int(end)
-    dur = end-start
-
-    gpstimeINT=int(gpstime) ### cast to int becuase the remaining query works only with ints
-
-    ### wait until data is available
-    wait = end + config.getfloat("allActive", 'wait') - lal_gpstime.gps_time_now() ### wait until we're past the end time
-    if wait > 0:
-        if opts.verbose:
-            print "        waiting %.3f sec"%(wait)
-        time.sleep( wait )
+    start, end, dur = queryWindow( gpstime, section.look_left, section.look_right )
+
+    ### find the active flags
+    dmt = section.dmt
+    try:
+        with metrics.timer( 'query' ):
+            found = allactive.findActive( start, end, segdb_url=segdb_url, dmt=dmt, include=section.include, workers=section.max_workers, ttl=section.catalogue_ttl, timeout=timeouts.get("dmt" if dmt else "segdb"), verbose=verbose )
+    except QueryError as e: ### something went wrong with the query!
+        if verbose:
+            print "        WARNING: an error occured while querying for all active flags!\n%s"%e
+
+        if not skip_gracedb_upload:
+            querymessage = "<strong>WARNING</strong>: an error occured while querying for all active flags!"
+            writeLog( gracedb, graceid, message=querymessage, tagname=qtags )
+        return
 
-    ### run segDB query
+    ### record what we found
     outfilename = allActivefilename(start, dur, output_dir=output_dir)
-    cmd = segDBallActivecmd( segdb_url, gpstimeINT, start-gpstimeINT, end-gpstimeINT, outfilename, activeOnly=False )
-    if opts.verbose:
-        print "        %s"%cmd
-    proc = sp.Popen( cmd.split(), stdout=sp.PIPE, stderr=sp.PIPE )
-    output = proc.communicate()
-
-    ### check return code for errors
-    if proc.returncode: ### something went wrong with the query!
-        if opts.verbose:
-            print "        WARNING: an error occured while querying for all active flags!\n%s"%output[1]
+    outfilename = archive.record( outfilename, archive.encode( outfilename, found.json() ) )
 
-        if not opts.skip_gracedb_upload:
-            querymessage = "<strong>WARNING</strong>: an error occured while querying for all active flags!"
-            writeLog( gracedb, opts.graceid, message=querymessage, tagname=qtags )
+    if verbose:
+        print "        found %d active flags out of %d"%(len(found), found.queried)
+        if found.failed:
+            print "        WARNING: could not check %d flags (or files) : %s"%(len(found.failed), ", ".join(found.failed))
 
     ### upload to GraceDb
-    elif not opts.skip_gracedb_upload:
+    if not skip_gracedb_upload:
 
         message = "SegDb query for all active flags within [%d, %d]"%(start, end)
-        if opts.verbose:
+        if found.failed:
+            message += "<br>&nbsp;&nbsp;&nbsp;&nbsp;<strong>WARNING</strong>: could not check %d flags (or files)"%len(found.failed)
+        if verbose:
             print "        %s"%message
-        writeLog( gracedb, opts.graceid, message=message, filename=outfilename, tagname=qtags )
+        writeLog( gracedb, graceid, message=message, filename=outfilename, tagname=qtags )
 
-        ### report a human readable list
-        if config.getboolean("allActive", "humanReadable"):
-            file_obj = open(outfilename, "r")
-            d=json.load(file_obj)
-            file_obj.close()
+        flagged = found.flagged( gpstime )
 
-            message = "active flags include:<br>"+", ".join(sorted(d['Active Results'].keys()))
-            if opts.verbose:
+        ### report a human readable list
+        if section.humanReadable:
+            message = "active flags include:<br>"+", ".join(found.flags)
+            if flagged:
+                message += "<br>flags active at the candidate's gpstime:<br>"+", ".join(flagged)
+            if verbose:
                 print "        %s"%message
-            writeLog( gracedb, opts.graceid, message=message, tagname=tags )
+            writeLog( gracedb, graceid, message=message, tagname=tags )
+
+        ### apply labels
+        labels = []
+        if len(found):
+            labels += section.activeLabels
+        if flagged:
+            labels += section.flaggedLabels
+        if labels:
+            writeLabel( gracedb, graceid, set(labels) )
+
+#-------------------------------------------------
+
+def processEvent( gracedb, graceid, queryplan, segdb_url, output_dir, skip_gracedb_upload=False, cache=None, verbose=False ):
+    '''
+    look up the event and schedule queries for every flag, veto definer and all active segments
+    queryplan is the compiled config (see segDb2grcDb.plan.QueryPlan)
+    blocks until all queries have finished and been reported to GraceDb
+    if cache is supplied (see segDb2grcDb.cache.SegmentCache), queries for individual flags are answered from it where possible
+    '''
+    t0 = time.time()
+    event = gracedb.event( graceid ).json() ### query for this event
+    gpstime = float(event['gpstime'])
+    if verbose:
+        print "processing %s -> %.6f"%(graceid, gpstime)
+
+    g_tags = queryplan.tags
+
+    ### report that we started searching
+    if not skip_gracedb_upload:
+        message = "began searching for segments in : %s"%(segdb_url)
+        writeLog( gracedb, graceid, message=message, tagname=g_tags )
+
+    ### set up the scheduler, which launches each query as soon as its data should be available
+    ### queries run concurrently (up to max-workers at a time) and each reports to GraceDb as soon as it finishes
+    scheduler = DeadlineScheduler( max_workers=queryplan.max_workers, clock=gps_time_now )
+
+    kwargs = {
+        'g_tags'              : g_tags,
+        'g_qtags'             : queryplan.queryTags,
+        'skip_gracedb_upload' : skip_gracedb_upload,
+        'verbose'             : verbose,
+    }
+
+    def schedule( section, name, poll, func, *args, **extra ):
+        ### the time after which data for this section should be available
+        end, deadline = queryplan.sections[section].window( gpstime )
+        func = instrument( func, time.time(), graceid=graceid, flag=name, source="dmt" if queryplan.sections[section].dmt else "segdb" )
+        if poll > 0: ### start polling as soon as the window ends and report once the data is known, waiting no longer than deadline
+            if verbose:
+                print "    polling %s every %.1f sec from %.3f until %.3f (in %.3f sec)"%(section, poll, end, deadline, end-gps_time_now())
+            scheduler.poll( end, deadline, poll, func, *args, deadline=deadline, **dict(kwargs, **extra) )
+        else:
+            if verbose:
+                print "    scheduling %s for %.3f (in %.3f sec)"%(section, deadline, deadline-gps_time_now())
+            scheduler.submit( deadline, func, *args, **dict(kwargs, **extra) )
+
+    ### evaluate expressions over flags as soon as all of the flags they depend on have been retrieved
+    if queryplan.expressions:
+        collector = ExpressionCollector(
+            queryplan.expressions,
+            lambda name, *args: reportExpression( gracedb, graceid, gpstime, queryplan.sections[name], *args, **kwargs ),
+            lambda name, *args: reportMissingExpression( gracedb, graceid, queryplan.sections[name], *args, **kwargs ),
+        )
+        collect = collector.add
+    else:
+        collector = collect = None
+
+    ### schedule queries for each (group of) flag(s)
+    ### we poll for data before the wait expires every poll-interval (or query-poll-interval) seconds, where 0 means we do not poll
+    ### reading DMT files ourselves is cheap, so we can poll much more often than we can launch queries
+    for key, group in queryplan.groups:
+        sections = [queryplan.sections[flag] for flag in group]
+        groupName = sections[0].groupName()
+        name = group[0] if len(group)==1 else groupName ### how measurements are tagged
+        if queryplan.native_dmt and sections[0].dmt: ### read DMT files ourselves
+            schedule( group[0], name, queryplan.poll_interval, processDMTFlags, gracedb, graceid, gpstime, groupName, sections, segdb_url, output_dir, cache=cache, collect=collect, hedge_budget=queryplan.hedge_budget, timeouts=queryplan.timeouts )
+        else:
+            schedule( group[0], name, queryplan.query_poll_interval, processFlagGroup, gracedb, graceid, gpstime, groupName, sections, segdb_url, output_dir, cache=cache, collect=collect, hedge_budget=queryplan.hedge_budget, timeouts=queryplan.timeouts )
+
+    ### schedule queries for each veto definer
+    for vetoDefiner in queryplan.vetoDefiners:
+        schedule( vetoDefiner, vetoDefiner, 0, processVetoDefiner, gracedb, graceid, gpstime, queryplan.sections[vetoDefiner], segdb_url, output_dir, cache=cache, native_dmt=queryplan.native_dmt, timeouts=queryplan.timeouts )
+
+    ### schedule the query for all active flags
+    if queryplan.allActive:
+        schedule( 'allActive', 'allActive', 0, processAllActive, gracedb, graceid, gpstime, queryplan.sections['allActive'], segdb_url, output_dir, timeouts=queryplan.timeouts )
+
+    ### wait for everything to finish
+    scheduler.join()
+    if collector is not None: ### report anything we could not evaluate
+        collector.finish()
+
+    ### keep the cache from growing without bound
+    if cache is not None:
+        removed = cache.evict()
+        if verbose and removed:
+            print "    evicted %d entries from the segment cache"%removed
+
+    ### report that we're done
+    if not skip_gracedb_upload:
+        message = "finished searching for segments in : %s"%(segdb_url)
+        writeLog( gracedb, graceid, message=message, tagname=g_tags )
+
+    metrics.record( 'total', time.time()-t0, graceid=graceid )
+
+#-------------------------------------------------
+
+parser = OptionParser(usage=usage, description=description)
+
+parser.add_option("-v", "--verbose", default=False, action="store_true")
+
+parser.add_option("-g", "--graceid", default=None, type="string", help="if not supplied, looks for lvalert through sys.stdin and blocks")
+
+parser.add_option('-n', '--skip-gracedb-upload', default=False, action='store_true')
+
+parser.add_option('-d', '--daemon', default=False, action='store_true', help='run as a long-lived daemon, receiving alerts over a local socket (see seglogic-client) instead of processing a single event')
+
+opts, args = parser.parse_args()
+
+if len(args)!=1:
+    raise ValueError("please exactly one config file as an input argument")
+
+if opts.daemon and opts.graceid:
+    raise ValueError("--daemon and --graceid are incompatible")
+
+#------------------------
+
+### extract data from LVAlert through stdin if needed
+alert_time = None
+if not (opts.graceid or opts.daemon):
+    alert = sys.stdin.read()
+    if opts.verbose:
+        print "alert received:\n%s"%alert
+    t0 = time.time()
+    opts.graceid = alerts.alert2graceid( alert )
+    alert_time = time.time()-t0 ### recorded once we know where to record it
+    if opts.graceid is None:
+        if opts.verbose:
+            print "alert_type!=new, ignoring..."
+        sys.exit(0)
+
+#------------------------
+
+### we have an event to process, so import everything else
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+from ligo.gracedb.rest import GraceDb
+
+from segDb2grcDb.schedule import DeadlineScheduler
+from segDb2grcDb.daemon import SeglogicDaemon
+from segDb2grcDb.admission import AdmissionPolicy
+from segDb2grcDb.upload import Uploader, keepAlive
+from segDb2grcDb.cache import SegmentCache, Leases
+from segDb2grcDb.hedge import Hedge
+from segDb2grcDb.expressions import ExpressionCollector
+from segDb2grcDb import metrics
+from segDb2grcDb import plan
+from segDb2grcDb import segments
+from segDb2grcDb import vetodef
+from segDb2grcDb import allactive
+from segDb2grcDb import archive
+from segDb2grcDb.query import flag2filename, allActivefilename, queryWindow, makedirs, recordSegments
+from segDb2grcDb.query import QueryError, queryFlag, queryFlagGroup, queryDMTFlags, fetchSegments, allKnown
+from segDb2grcDb.report import writeLog, writeLabel, reportResults
+
+#------------------------
+
+### read in config file
+if opts.verbose:
+    print "reading config from : %s"%args[0]
+queryplan = plan.loadPlan( args[0] ) ### compiled once, and recompiled (by the daemon) whenever the file changes
+config = queryplan.config
+
+### record how long each stage takes
+if config.has_section('metrics'):
+    metrics.configure(
+        jsonl=config.get('metrics', 'jsonl') if config.has_option('metrics', 'jsonl') else None,
+        textfile=config.get('metrics', 'textfile') if config.has_option('metrics', 'textfile') else None,
+    )
+if alert_time is not None:
+    metrics.record( 'alert', alert_time, graceid=opts.graceid )
+
+#-------------------------------------------------
+
+### figure out where we're writing segment files locally
+output_dir = config.get('general', 'output-dir')
+if not os.path.exists(output_dir):
+    os.makedirs( output_dir )
+
+### keep query results in memory, uploading them straight from memory and archiving them to output-dir in the background
+if config.has_section('archive') and config.has_option('archive', 'in-memory') and config.getboolean('archive', 'in-memory'):
+    archive.configure(
+        archive=config.getboolean('archive', 'archive') if config.has_option('archive', 'archive') else True,
+        retention=config.getfloat('archive', 'retention') if config.has_option('archive', 'retention') else None,
+        scratch=config.get('archive', 'scratch-dir') if config.has_option('archive', 'scratch-dir') else None,
+        verbose=opts.verbose,
+    )
+
+### find which GraceDb we're using
+gracedb_url = plan.gracedbUrl( config )
+if gracedb_url:
+    gracedb = GraceDb( gracedb_url )
+else:
+    gracedb = GraceDb()
+gracedb = keepAlive( gracedb ) ### reuse connections rather than connecting (and authenticating) for every request
+gracedb = metrics.TimedGraceDb( gracedb ) ### time the requests themselves, even when they're sent from the background
+
+### hand uploads to a background thread so that GraceDb never holds up our queries
+if (not config.has_section('upload')) or (not config.has_option('upload', 'async')) or config.getboolean('upload', 'async'):
+    upload_kwargs = {}
+    for option, key, get in [('retries', 'retries', config.getint), ('backoff', 'backoff', config.getfloat), ('max-backoff', 'max_backoff', config.getfloat), ('linger', 'linger', config.getfloat)]:
+        if config.has_option('upload', option):
+            upload_kwargs[key] = get('upload', option)
+    gracedb = Uploader( gracedb, verbose=opts.verbose, **upload_kwargs )
+
+### find which segDB we're using
+if config.has_option('general', 'segdb-url'):
+    segdb_url = config.get('general', 'segdb-url')
+else:
+    segdb_url = 'https://segments.ligo.org'
+if opts.verbose:
+    print "searching for segments in : %s"%segdb_url
+
+### set up a local cache of segments shared between events (and processes)
+if config.has_section('cache') and config.has_option('cache', 'enabled') and config.getboolean('cache', 'enabled'):
+    if config.has_option('cache', 'directory'):
+        cache_dir = config.get('cache', 'directory')
+    else:
+        cache_dir = os.path.join(output_dir, 'cache')
+    max_age = config.getfloat('cache', 'max-age') if config.has_option('cache', 'max-age') else None
+    max_bytes = int(config.getfloat('cache', 'max-mb')*1024**2) if config.has_option('cache', 'max-mb') else None
+    ### coalesce queries that are in flight at the same time for different events (and processes)
+    if config.has_option('cache', 'coalesce') and config.getboolean('cache', 'coalesce'):
+        leases = Leases(
+            os.path.join(cache_dir, 'leases'),
+            ttl=config.getfloat('cache', 'lease-ttl') if config.has_option('cache', 'lease-ttl') else 600,
+            max_wait=config.getfloat('cache', 'coalesce-wait') if config.has_option('cache', 'coalesce-wait') else None,
+        )
+    else:
+        leases = None
+    cache = SegmentCache( cache_dir, max_age=max_age, max_bytes=max_bytes, leases=leases )
+    if opts.verbose:
+        print "caching segments in : %s"%cache_dir
+        if leases is not None:
+            print "coalescing queries through : %s"%leases.directory
+else:
+    cache = None
 
 #---------------------------------------------------------------------------------------------------
 
-### report that we're done
-if not opts.skip_gracedb_upload:
-    message = "finished searching for segments in : %s"%(segdb_url)
-    writeLog( gracedb, opts.graceid, message=message, tagname=g_tags )
+if opts.daemon:
+    ### keep everything we've loaded warm and process events as they are handed to us over the socket
+    if config.has_option('daemon', 'socket'):
+        socket_path = config.get('daemon', 'socket')
+    else:
+        socket_path = os.path.join(output_dir, 'seglogic.sock')
+
+    if config.has_option('daemon', 'max-events'):
+        max_events = config.getint('daemon', 'max-events')
+    else:
+        max_events = 1
+
+    def process( graceid ):
+        ### pick up any changes to the flags, windows, labels, etc. (but not the GraceDb, SegDb, cache or daemon settings)
+        processEvent( gracedb, graceid, plan.loadPlan( args[0] ), segdb_url, output_dir, skip_gracedb_upload=opts.skip_gracedb_upload, cache=cache, verbose=opts.verbose )
+        if isinstance(gracedb, Uploader): ### finish this event's uploads, after which the uploader forgets about it
+            gracedb.flush( graceid=graceid )
+        metrics.flush()
+        sys.stdout.flush()
+
+    ### rank events so the most important are processed first and unimportant ones are shed under load
+    ### alerts usually describe their event, but otherwise we look it up (in the daemon's lookup threads, not while answering the alert)
+    policy = AdmissionPolicy.fromConfig( config )
+
+    def describe( graceid ):
+        return gracedb.event( graceid ).json()
+
+    try:
+        SeglogicDaemon( socket_path, process, max_events=max_events, policy=policy, describe=describe, verbose=opts.verbose ).serve_forever()
+    finally:
+        if isinstance(gracedb, Uploader): ### send anything that is still queued
+            gracedb.close()
+        archive.close()
+        metrics.close()
+
+else:
+    try:
+        processEvent( gracedb, opts.graceid, queryplan, segdb_url, output_dir, skip_gracedb_upload=opts.skip_gracedb_upload, cache=cache, verbose=opts.verbose )
+    finally:
+        if isinstance(gracedb, Uploader): ### send anything that is still queued
+            gracedb.close()
+        archive.close()
+        metrics.close()
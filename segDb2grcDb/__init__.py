@@ -0,0 +1,4 @@
+'''
+library code supporting seglogic.py
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
@@ -0,0 +1,127 @@
+'''
+admission control for bursts of alerts
+events are ranked by group, pipeline, search and FAR so that the most important events are processed first, some workers can be kept free for them and unimportant events are shed when the queue grows
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import fnmatch
+
+#-------------------------------------------------
+
+class Rule(object):
+    '''
+    matches events against group/pipeline/search[/far] (e.g. "CBC/gstlal/*/1e-7"), where fields may contain shell-style wildcards and far is the largest FAR (Hz) that matches
+    '''
+
+    def __init__( self, text, priority ):
+        self.text = text
+        self.priority = priority
+
+        fields = text.split('/')
+        if not (3 <= len(fields) <= 4):
+            raise ValueError("could not parse rule \"%s\" : expected group/pipeline/search[/far]"%text)
+        self.group, self.pipeline, self.search = [field.lower() for field in fields[:3]]
+        self.far = float(fields[3]) if len(fields)==4 else None
+
+    def match( self, event ):
+        if not fnmatch.fnmatchcase( str(event.get('group') or '').lower(), self.group ):
+            return False
+        if not fnmatch.fnmatchcase( str(event.get('pipeline') or '').lower(), self.pipeline ):
+            return False
+        if not fnmatch.fnmatchcase( str(event.get('search') or '').lower(), self.search ):
+            return False
+        if self.far is not None:
+            far = event.get('far')
+            return (far is not None) and (float(far) <= self.far)
+        return True
+
+def parseRules( text ):
+    '''
+    "Test/*/*:9 */*/*/1e-7:0 CBC/*/*:1" -> [Rule, Rule, Rule]
+    '''
+    rules = []
+    for token in text.split():
+        if ':' not in token:
+            raise ValueError("could not parse rule \"%s\" : expected group/pipeline/search[/far]:priority"%token)
+        rule, priority = token.rsplit(':', 1)
+        rules.append( Rule( rule, int(priority) ) )
+    return rules
+
+#-------------------------------------------------
+
+class AdmissionPolicy(object):
+    '''
+    decides how urgent each event is and which events to shed
+        rules : checked in order, and the first that matches an event sets its priority (lower is more urgent)
+        default_priority : the priority of events that do not match any rule
+        urgent_priority : events with priority <= urgent_priority may use the reserved_events workers that are kept free for them
+        max_queued : once this many events are waiting, the least urgent (newest) event is shed
+        shed_priority, shed_depth : events with priority >= shed_priority are shed instead of queued once shed_depth events are waiting
+        max_wait : events that waited longer than this many seconds are shed instead of processed
+    the default policy treats every event alike, just like a first-in-first-out queue
+    '''
+
+    def __init__( self, rules=[], default_priority=0, urgent_priority=0, reserved_events=0, max_queued=None, shed_priority=None, shed_depth=0, max_wait=None ):
+        self.rules = rules
+        self.default_priority = default_priority
+        self.urgent_priority = urgent_priority
+        self.reserved_events = reserved_events
+        self.max_queued = max_queued
+        self.shed_priority = shed_priority
+        self.shed_depth = shed_depth
+        self.max_wait = max_wait
+
+    @staticmethod
+    def fromConfig( config, section='admission' ):
+        '''
+        build the policy from the admission section of config, if there is one
+        '''
+        if not config.has_section(section):
+            return AdmissionPolicy()
+
+        def get( option, default, cast ):
+            if config.has_option(section, option):
+                return cast( config.get(section, option) )
+            return default
+
+        return AdmissionPolicy(
+            rules=parseRules( get('priorities', '', str) ),
+            default_priority=get('default-priority', 0, int),
+            urgent_priority=get('urgent-priority', 0, int),
+            reserved_events=get('reserved-events', 0, int),
+            max_queued=get('max-queued', None, int),
+            shed_priority=get('shed-priority', None, int),
+            shed_depth=get('shed-depth', 0, int),
+            max_wait=get('max-wait', None, float),
+        )
+
+    #---
+
+    def priority( self, event ):
+        '''
+        the priority of an event, described by the event's JSON from GraceDb (or the object in its LVAlert message)
+        '''
+        for rule in self.rules:
+            if rule.match( event ):
+                return rule.priority
+        return self.default_priority
+
+    def isUrgent( self, priority ):
+        return priority <= self.urgent_priority
+
+    def shedOnArrival( self, priority, depth ):
+        '''
+        whether to shed an event with priority instead of queueing it behind depth other events
+        '''
+        return (self.shed_priority is not None) and (priority >= self.shed_priority) and (depth >= self.shed_depth)
+
+    def isFull( self, depth ):
+        '''
+        whether we must shed something before queueing another event behind depth other events
+        '''
+        return (self.max_queued is not None) and (depth >= self.max_queued)
+
+    def isStale( self, wait ):
+        return (self.max_wait is not None) and (wait > self.max_wait)
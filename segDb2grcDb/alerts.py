@@ -0,0 +1,37 @@
+'''
+helpers for LVAlert messages
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import json
+
+#-------------------------------------------------
+
+def parseAlert( alert ):
+    '''
+    parse an LVAlert message (a JSON string or an already-parsed dictionary)
+    '''
+    if isinstance(alert, dict):
+        return alert
+    return json.loads(alert)
+
+def alert2graceid( alert ):
+    '''
+    return the graceid for an alert announcing a new event or None if we should ignore this alert
+    '''
+    alert = parseAlert( alert )
+    if alert['alert_type'] != 'new':
+        return None
+    return alert['uid']
+
+def alert2event( alert ):
+    '''
+    return the description of the event (group, pipeline, search, far, etc) included in an alert, which is empty if the alert does not include one
+    '''
+    alert = parseAlert( alert )
+    event = alert.get('object')
+    if isinstance(event, dict):
+        return event
+    return {}
@@ -0,0 +1,326 @@
+'''
+a built-in replacement for ligolw_dq_query_dqsegdb, which finds every flag that is active around an event
+flags are read either from the DMT segment files (through segDb2grcDb.dmt), in parallel, or from DQSegDB's report of every active flag, which takes a single request
+if DQSegDB cannot report active flags, each flag in its listing (which is cached between events) is queried in parallel instead
+only the active segments of flags that are active within the window are kept
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import ssl
+import json
+import time
+import fnmatch
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urllib2 import urlopen, quote
+except ImportError:
+    from urllib.request import urlopen
+    from urllib.parse import quote
+
+import numpy as np
+
+from segDb2grcDb import segments
+from segDb2grcDb import segxml
+from segDb2grcDb import dmt as dmtutils
+from segDb2grcDb.segtables import SegmentTables
+from segDb2grcDb.query import QueryError
+
+#-------------------------------------------------
+
+class ActiveFlags(object):
+    '''
+    the flags that are active within [start, end] (GPS seconds), sorted by flag
+        active maps each flag (IFO:NAME:VERSION) to its active segments (nanoseconds), and flags without any active time are dropped
+        queried is the number of flags we checked and failed lists what we could not check (flags from DQSegDB, files from DMT)
+    '''
+
+    def __init__( self, start, end, active, queried=0, failed=[] ):
+        self.start = start
+        self.end = end
+        self.flags = sorted(flag for flag, segs in active.items() if len(segs))
+        self.active = [active[flag] for flag in self.flags]
+        self.queried = queried
+        self.failed = sorted(failed)
+
+    def __len__( self ):
+        return len(self.flags)
+
+    def __iter__( self ):
+        return iter(zip(self.flags, self.active))
+
+    def durations( self ):
+        '''
+        the active time (nanoseconds) of each flag
+        '''
+        return np.array([segments.duration( segs ) for segs in self.active], dtype=np.int64)
+
+    def flagged( self, gpstime ):
+        '''
+        the flags whose active segments contain gpstime
+        '''
+        gps_ns = segments.gps2ns( gpstime )
+        return [flag for flag, segs in self if segments.contains( segs, gps_ns )]
+
+    def json( self ):
+        '''
+        the JSON we upload, laid out like ligolw_dq_query_dqsegdb's "Active Results" (segments in GPS seconds)
+        '''
+        return json.dumps( {
+            'Active Results' : dict((flag, segments.ns2gps( segs ).tolist()) for flag, segs in self),
+            'query_information' : {'start':self.start, 'end':self.end, 'flags_queried':self.queried, 'failed':self.failed},
+        }, sort_keys=True )
+
+#-------------------------------------------------
+
+def matches( flag, include ):
+    '''
+    whether flag matches any of the shell-style patterns in include (an empty include matches everything)
+    '''
+    return (not include) or any(fnmatch.fnmatchcase( flag, pattern ) for pattern in include)
+
+def _map( func, items, workers ):
+    '''
+    func applied to each item, using up to workers threads
+    '''
+    if (workers <= 1) or (len(items) <= 1):
+        return [func( item ) for item in items]
+    pool = ThreadPool( min(workers, len(items)) )
+    try:
+        return pool.map( func, items )
+    finally:
+        pool.close()
+
+#-------------------------------------------------
+
+_ssl_context = None
+
+def _context():
+    '''
+    an SSL context presenting the same X509 credentials ligolw_segment_query_dqsegdb would use
+    built once, since loading the CA certificates is much more expensive than a single request
+    '''
+    global _ssl_context
+    if _ssl_context is None:
+        context = ssl.create_default_context()
+        if os.environ.get('X509_USER_CERT'):
+            context.load_cert_chain( os.environ['X509_USER_CERT'], os.environ.get('X509_USER_KEY') )
+        else:
+            proxy = os.environ.get('X509_USER_PROXY', '/tmp/x509up_u%d'%os.getuid())
+            if os.path.exists(proxy):
+                context.load_cert_chain( proxy )
+        _ssl_context = context
+    return _ssl_context
+
+def _get( url, timeout=None ):
+    '''
+    GET url and parse the JSON it returns
+    '''
+    kwargs = {}
+    if timeout:
+        kwargs['timeout'] = timeout
+    if url.startswith('https'):
+        kwargs['context'] = _context()
+    response = urlopen( url, **kwargs )
+    try:
+        return json.loads( response.read().decode('utf-8') )
+    finally:
+        response.close()
+
+class SegDbCatalogue(object):
+    '''
+    the flags (IFO:NAME:VERSION) DQSegDB knows about, listed through its REST API (/dq, /dq/IFO and /dq/IFO/NAME)
+    listing every version of every flag takes thousands of requests, so the catalogue is kept until it is older than ttl seconds
+    '''
+
+    def __init__( self, url, ttl=3600, workers=8 ):
+        self.url = url.rstrip('/')
+        self.ttl = ttl
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._flags = None
+        self._listed = 0
+        self._listing = False ### whether some thread is listing flags right now
+
+    def flags( self, timeout=None, verbose=False ):
+        '''
+        return the (cached) catalogue, listing it again if it is older than ttl
+        the listing is done without holding the lock, and anyone who asks while another thread is listing gets the old catalogue (if there is one)
+        raises QueryError if the listing fails
+        '''
+        with self._lock:
+            if (self._flags is not None) and ((time.time()-self._listed < self.ttl) or self._listing):
+                return self._flags
+            self._listing = True
+
+        try:
+            t0 = time.time()
+            flags = self._list( timeout=timeout, verbose=verbose )
+        finally:
+            with self._lock:
+                self._listing = False
+
+        with self._lock:
+            if t0 >= self._listed: ### keep whichever listing is newest
+                self._flags = flags
+                self._listed = t0
+            return self._flags
+
+    def _list( self, timeout=None, verbose=False ):
+        '''
+        list every flag, which takes a request for each IFO and for each flag name
+        '''
+        if verbose:
+            print "        listing flags in %s"%self.url
+        t0 = time.time()
+        try:
+            ifos = _get( self.url+'/dq', timeout=timeout )['results']
+            names = _map( lambda ifo: [(ifo, name) for name in _get( "%s/dq/%s"%(self.url, quote(ifo)), timeout=timeout )['results']], ifos, self.workers )
+            names = sum(names, [])
+            versions = _map( lambda x: [(x[0], x[1], int(v)) for v in _get( "%s/dq/%s/%s"%(self.url, quote(x[0]), quote(x[1])), timeout=timeout )['version']], names, self.workers )
+        except Exception as e: ### urllib's errors (including timeouts) are IOErrors, but httplib raises HTTPExceptions for broken responses
+            raise QueryError( "could not list flags in %s : %s"%(self.url, e) )
+
+        flags = ["%s:%s:%d"%x for x in sum(versions, [])]
+        if verbose:
+            print "        found %d flags in %.3f sec"%(len(flags), time.time()-t0)
+        return flags
+
+### catalogues are shared within a process so a long-lived process (e.g. seglogic.py --daemon) only lists flags once every ttl seconds
+_catalogues = {}
+_catalogues_lock = threading.Lock()
+
+def getCatalogue( url, ttl=3600, workers=8 ):
+    '''
+    return the shared SegDbCatalogue for url
+    '''
+    with _catalogues_lock:
+        if url not in _catalogues:
+            _catalogues[url] = SegDbCatalogue( url, ttl=ttl, workers=workers )
+        catalogue = _catalogues[url]
+        catalogue.ttl = ttl ### pick up changes to the config
+        catalogue.workers = workers
+        return catalogue
+
+#-------------------------------------------------
+
+def _segs( pairs, start_ns, end_ns ):
+    '''
+    DQSegDB's [start, end] pairs (GPS seconds) as segments (nanoseconds) clipped to [start_ns, end_ns]
+    '''
+    return segments.clip( segments.coalesce( [[segments.gps2ns( float(s) ), segments.gps2ns( float(e) )] for s, e in pairs] ), start_ns, end_ns )
+
+def segdbActive( url, start, end, include=[], workers=8, ttl=3600, timeout=None, verbose=False ):
+    '''
+    find every flag in DQSegDB that is active within [start, end] (GPS seconds) and matches include
+    DQSegDB reports every active flag in response to a single request (/report/active), and only if that fails do we query each flag in the catalogue that matches include
+    we give up on whatever is still running after timeout seconds
+    returns ActiveFlags
+    raises QueryError if the catalogue cannot be listed when we need it
+    '''
+    t0 = time.time()
+    url = url.rstrip('/')
+    start_ns = segments.gps2ns( start )
+    end_ns = segments.gps2ns( end )
+
+    try:
+        report = _get( "%s/report/active?s=%d&e=%d"%(url, start, end), timeout=timeout )
+        found = {}
+        for result in report['results']:
+            reported = "%s:%s:%d"%(result['ifo'], result['name'], int(result['version']))
+            if matches( reported, include ):
+                found[reported] = _segs( result['active'], start_ns, end_ns )
+    except Exception as e: ### anything (a server without reports, a broken response, etc) means we fall back to querying each flag
+        if verbose:
+            print "        could not get a report of active flags from %s (%s: %s), querying each flag instead"%(url, type(e).__name__, e)
+    else:
+        if verbose:
+            print "        %d flags reported active in %s"%(len(found), url)
+        active = dict((flag, segs) for flag, segs in found.items() if len(segs))
+        return ActiveFlags( start, end, active, queried=len(found) )
+
+    flags = [flag for flag in getCatalogue( url, ttl=ttl, workers=workers ).flags( timeout=timeout, verbose=verbose ) if matches( flag, include )]
+    if verbose:
+        print "        querying %d flags in %s"%(len(flags), url)
+
+    def query( flag ):
+        remaining = (t0 + timeout - time.time()) if timeout else None
+        if (remaining is not None) and (remaining <= 0):
+            return flag, None
+        ifo, name, version = flag.split(':')
+        try:
+            ans = _get( "%s/dq/%s/%s/%s?s=%d&e=%d&include=active"%(url, quote(ifo), quote(name), version, start, end), timeout=remaining )
+            return flag, _segs( ans['active'], start_ns, end_ns )
+        except Exception: ### anything (e.g. httplib's BadStatusLine or IncompleteRead) only means we could not check this flag
+            return flag, None
+
+    active = {}
+    failed = []
+    for flag, segs in _map( query, flags, workers ):
+        if segs is None:
+            failed.append( flag )
+        elif len(segs): ### only keep flags that are actually active
+            active[flag] = segs
+
+    return ActiveFlags( start, end, active, queried=len(flags), failed=failed )
+
+def dmtActive( dmt, start, end, include=[], workers=8, timeout=None, verbose=False ):
+    '''
+    find every flag in the DMT files under dmt that is active within [start, end] (GPS seconds) and matches include
+    the index of the directory tree is shared between events (see segDb2grcDb.dmt.getIndex) and the files overlapping the window are read in parallel
+    returns ActiveFlags
+    raises QueryError if the directory tree cannot be listed
+    '''
+    t0 = time.time()
+    try:
+        paths = dmtutils.getIndex( dmt ).files( start, end )
+    except (IOError, OSError) as e:
+        raise QueryError( str(e) )
+    if verbose:
+        print "        reading %d DMT files from %s"%(len(paths), dmt)
+
+    start_ns = segments.gps2ns( start )
+    end_ns = segments.gps2ns( end )
+    def read( path ):
+        if timeout and (time.time()-t0 > timeout):
+            return path, None
+        try:
+            tables = SegmentTables.fromColumns( segxml.readColumns( path, ['segment_definer', 'segment'] ) )
+        except Exception: ### e.g. a file that is still being written, which only means we could not check it
+            return path, None
+        ans = {}
+        for i, (_, active) in enumerate(tables.split()):
+            flag = tables.flag( i )
+            if matches( flag, include ):
+                ans[flag] = segments.clip( active, start_ns, end_ns )
+        return path, ans
+
+    found = {}
+    queried = set()
+    failed = []
+    for path, ans in _map( read, paths, workers ):
+        if ans is None:
+            failed.append( os.path.basename(path) )
+            continue
+        for flag, segs in ans.items():
+            queried.add( flag )
+            if len(segs):
+                found.setdefault( flag, [] ).append( segs )
+
+    active = dict((flag, segments.coalesce( np.concatenate(segs) )) for flag, segs in found.items())
+    return ActiveFlags( start, end, active, queried=len(queried), failed=failed )
+
+def findActive( start, end, segdb_url=None, dmt=None, include=[], workers=8, ttl=3600, timeout=None, verbose=False ):
+    '''
+    find every flag that is active within [start, end] (GPS seconds), reading the DMT files under dmt if it is supplied and otherwise querying DQSegDB at segdb_url
+    returns ActiveFlags
+    '''
+    if dmt:
+        return dmtActive( dmt, start, end, include=include, workers=workers, timeout=timeout, verbose=verbose )
+    return segdbActive( segdb_url, start, end, include=include, workers=workers, ttl=ttl, timeout=timeout, verbose=verbose )
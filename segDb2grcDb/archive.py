@@ -0,0 +1,285 @@
+'''
+an in-memory path for query results
+results are kept as in-memory attachments, which are parsed and uploaded to GraceDb straight from memory, and written to output-dir (if at all) by a background thread
+this keeps the (shared, often slow) filesystem that holds output-dir off the critical path
+
+until configure is called, results are written directly to disk as they always were
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import io
+import os
+import sys
+import time
+import gzip
+import shutil
+import tempfile
+import threading
+import traceback
+
+from collections import deque
+
+#-------------------------------------------------
+
+class Attachment(object):
+    '''
+    the contents (bytes) of a file that is kept in memory
+    filename is where it would have been written, and where it is archived
+    '''
+
+    def __init__( self, filename, contents ):
+        self.filename = filename
+        self.contents = contents
+
+    @property
+    def name( self ):
+        return os.path.basename(self.filename)
+
+    def open( self ):
+        '''
+        a file object for reading the contents, transparently handling gzip compression like segDb2grcDb.segxml.open_xml
+        '''
+        file_obj = io.BytesIO( self.contents )
+        if self.filename.endswith(".gz"):
+            return gzip.GzipFile( fileobj=file_obj, mode="rb" )
+        return file_obj
+
+    def __str__( self ):
+        return self.filename
+
+def encode( filename, text ):
+    '''
+    the bytes we would store in filename for text, compressed if filename ends in .gz
+    '''
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    if not filename.endswith(".gz"):
+        return text
+    buf = io.BytesIO()
+    file_obj = gzip.GzipFile( fileobj=buf, mode="wb" )
+    file_obj.write( text )
+    file_obj.close()
+    return buf.getvalue()
+
+def _makedirs( path ):
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError: ### another process may have created it in the meantime
+            if not os.path.exists(path):
+                raise
+
+def write( filename, contents ):
+    '''
+    atomically replace filename with contents (bytes), so concurrent processes recording the same result never leave a mixture of the two behind
+    '''
+    fd, tmp = tempfile.mkstemp( dir=os.path.dirname(os.path.abspath(filename)), suffix='.tmp' )
+    try:
+        file_obj = os.fdopen( fd, 'wb' )
+        file_obj.write( contents )
+        file_obj.close()
+        os.chmod( tmp, 0o644 ) ### mkstemp only lets us read it
+        os.rename( tmp, filename )
+    except:
+        if os.path.exists(tmp):
+            os.unlink( tmp )
+        raise
+
+#-------------------------------------------------
+
+class Archiver(object):
+    '''
+    keeps results in memory and writes them to disk from a background thread
+        archive : whether to write results to disk at all
+        retention : results we wrote are removed after this many seconds (None keeps them forever)
+        scratch : where queries launched as subprocesses write their results before we read them into memory (defaults to the system's temporary directory, which should be local)
+    '''
+
+    def __init__( self, archive=True, retention=None, scratch=None, verbose=False ):
+        self.archive = archive
+        self.retention = retention
+        self.scratch = scratch
+        self.verbose = verbose
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._written = deque() ### (time written, path) in the order they were written
+        self.counts = {'archived':0, 'expired':0, 'failed':0}
+
+        self._thread = None
+        if archive:
+            self._thread = threading.Thread( target=self._work, name="seglogic-archive" )
+            self._thread.daemon = True
+            self._thread.start()
+
+    #---
+
+    def save( self, attachment ):
+        '''
+        queue attachment to be written to attachment.filename
+        '''
+        if not self.archive:
+            return
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("cannot archive with an Archiver that has been closed")
+            self._queue.append( attachment )
+            self._cond.notify_all()
+
+    def _work( self ):
+        while True:
+            with self._cond:
+                if not self._queue:
+                    if self._closed:
+                        return
+                    self._cond.wait( self._untilExpiry() ) ### wake up in time to remove old results even if nothing else arrives
+                attachment = self._queue.popleft() if self._queue else None
+
+            if attachment is not None:
+                try:
+                    self._write( attachment )
+                except Exception:
+                    traceback.print_exc()
+                    sys.stderr.flush()
+                    with self._cond:
+                        self.counts['failed'] += 1
+                else:
+                    with self._cond:
+                        self.counts['archived'] += 1
+
+            self.expire()
+
+    def _write( self, attachment ):
+        '''
+        (atomically) write attachment to disk
+        '''
+        _makedirs( os.path.dirname(os.path.abspath(attachment.filename)) )
+        write( attachment.filename, attachment.contents )
+        if self.retention is not None:
+            self._written.append( (time.time(), attachment.filename) )
+        if self.verbose:
+            print "archive: wrote %s"%attachment.filename
+            sys.stdout.flush()
+
+    def _untilExpiry( self ):
+        '''
+        how long until the oldest result we wrote should be removed (None if there is nothing to remove)
+        '''
+        if (self.retention is None) or (not self._written):
+            return None
+        return max(0.0, self._written[0][0] + self.retention - time.time())
+
+    def expire( self ):
+        '''
+        remove anything we wrote more than retention seconds ago
+        '''
+        if self.retention is None:
+            return
+        cutoff = time.time() - self.retention
+        while self._written and (self._written[0][0] < cutoff):
+            _, path = self._written.popleft()
+            try:
+                os.unlink( path )
+            except OSError: ### already gone
+                continue
+            self.counts['expired'] += 1
+
+    #---
+
+    def scratchDir( self ):
+        '''
+        a new local directory in which a subprocess can write its results
+        '''
+        if self.scratch:
+            _makedirs( self.scratch )
+        return tempfile.mkdtemp( prefix="seglogic-", dir=self.scratch )
+
+    def load( self, path, filename ):
+        '''
+        read the file at path (written by a subprocess) into memory as the result stored in filename and archive it
+        '''
+        file_obj = open(path, 'rb')
+        attachment = Attachment( filename, file_obj.read() )
+        file_obj.close()
+        self.save( attachment )
+        return attachment
+
+    #---
+
+    def close( self ):
+        '''
+        write everything that is still queued, stop the background thread and remove anything older than retention
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            while self._thread.is_alive():
+                self._thread.join( 1.0 )
+        self.expire() ### the background thread is gone, so nothing else touches what we wrote
+
+#-------------------------------------------------
+
+### shared by everything within a process, and None until configure is called (meaning results are written directly to disk)
+_archiver = None
+
+def configure( archive=True, retention=None, scratch=None, verbose=False ):
+    '''
+    keep results in memory from now on (see Archiver)
+    '''
+    global _archiver
+    close()
+    _archiver = Archiver( archive=archive, retention=retention, scratch=scratch, verbose=verbose )
+    return _archiver
+
+def getArchiver():
+    return _archiver
+
+def inMemory():
+    return _archiver is not None
+
+def record( filename, contents ):
+    '''
+    keep contents (bytes, see encode) that belong in filename
+    returns an Attachment if results are kept in memory (and archives it in the background), otherwise writes filename and returns filename
+    '''
+    if _archiver is None:
+        write( filename, contents )
+        return filename
+    attachment = Attachment( filename, contents )
+    _archiver.save( attachment )
+    return attachment
+
+def scratchDir( directory ):
+    '''
+    the directory in which a subprocess should write results that belong in directory
+    this is directory itself unless results are kept in memory, in which case it is a new local directory that should be removed with cleanup
+    '''
+    if _archiver is None:
+        return directory
+    return _archiver.scratchDir()
+
+def load( path, filename ):
+    '''
+    the result a subprocess wrote to path (within scratchDir) that belongs in filename
+    this is path itself unless results are kept in memory, in which case it is read into an Attachment
+    '''
+    if _archiver is None:
+        return path
+    return _archiver.load( path, filename )
+
+def cleanup( directory ):
+    '''
+    remove a directory returned by scratchDir
+    '''
+    if _archiver is not None:
+        shutil.rmtree( directory, ignore_errors=True )
+
+def close():
+    global _archiver
+    if _archiver is not None:
+        _archiver.close()
+        _archiver = None
@@ -0,0 +1,320 @@
+'''
+a persistent, on-disk cache of known and active segments for each flag
+events for the same signal are often uploaded by several pipelines within seconds of each other, and this lets us answer the repeated queries without going back to SegDb (or the DMT files)
+
+each flag (and source of segments) is stored in its own file as the coalesced known and active segments we have seen so far
+files are replaced atomically and updated while holding an exclusive lock on the directory, so the cache can be shared by concurrent processes
+
+near-coincident events also query the same flags at almost the same moment, before either query has reached the cache
+processes can therefore take leases on the queries they have in flight (see Leases), and any other process that wants an overlapping window waits for that query to finish and reads its result from the cache instead of issuing a duplicate query
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import json
+import time
+import uuid
+import errno
+import fcntl
+import socket
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+
+from segDb2grcDb import segments
+
+#-------------------------------------------------
+
+def _name( source, flag ):
+    '''
+    how files about flag from source are named
+    '''
+    digest = hashlib.md5( str(source).encode('utf-8') ).hexdigest()[:8]
+    return "%s-%s"%(digest, flag.replace(":", "-"))
+
+def _makedirs( path ):
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError: ### another process may have created it in the meantime
+            if not os.path.exists(path):
+                raise
+
+class _Lock(object):
+    '''
+    an exclusive lock on path held with flock, which works between processes as well as between threads within a process
+    '''
+
+    def __init__( self, path ):
+        self.path = path
+        self._file_obj = None
+
+    def __enter__( self ):
+        self._file_obj = open(self.path, 'a')
+        fcntl.flock( self._file_obj.fileno(), fcntl.LOCK_EX )
+        return self
+
+    def __exit__( self, *args ):
+        fcntl.flock( self._file_obj.fileno(), fcntl.LOCK_UN )
+        self._file_obj.close()
+        self._file_obj = None
+
+#-------------------------------------------------
+
+class SegmentCache(object):
+    '''
+    known and active segments for each (source, flag) stored under directory
+
+    entries that have not been updated within max_age seconds are evicted, as are the oldest entries once the cache holds more than max_bytes
+    either limit may be None, in which case it is not enforced
+
+    if leases is supplied (see Leases), queries in flight are coalesced between processes sharing the cache (see segDb2grcDb.query.fetchSegments)
+    '''
+
+    def __init__( self, directory, max_age=None, max_bytes=None, leases=None ):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.leases = leases
+        _makedirs( directory )
+
+        ### the contents of files we've already read, keyed by path and only trusted while the file is unchanged
+        self._lock = threading.Lock()
+        self._memory = {}
+
+    def _lock_path( self ):
+        '''
+        the lock held while updating (or removing) any file, shared by every entry so that lock files never pile up
+        '''
+        return os.path.join(self.directory, '.lock')
+
+    def _path( self, source, flag ):
+        '''
+        the file storing flag from source
+        '''
+        return os.path.join(self.directory, "%s.npz"%_name( source, flag ))
+
+    def _read( self, path ):
+        '''
+        return the known and active segments stored in path, both of which are empty if there is no such file
+        '''
+        try:
+            stat = os.stat( path )
+        except OSError:
+            return segments.empty(), segments.empty()
+        version = (stat.st_ino, stat.st_mtime, stat.st_size) ### files are replaced rather than modified, so this changes with every update
+
+        with self._lock:
+            if path in self._memory and self._memory[path][0]==version:
+                return self._memory[path][1:]
+
+        try:
+            data = np.load( path )
+            known, active = data['known'], data['active']
+            data.close()
+        except (IOError, OSError, ValueError, KeyError): ### the file disappeared or is corrupted, so we ignore it
+            return segments.empty(), segments.empty()
+
+        with self._lock:
+            self._memory[path] = (version, known, active)
+        return known, active
+
+    def _write( self, path, known, active ):
+        '''
+        atomically replace path
+        '''
+        fd, tmp = tempfile.mkstemp( dir=self.directory, suffix='.tmp' )
+        try:
+            file_obj = os.fdopen( fd, 'wb' )
+            np.savez( file_obj, known=known, active=active )
+            file_obj.close()
+            os.rename( tmp, path )
+        except:
+            if os.path.exists(tmp):
+                os.unlink( tmp )
+            raise
+
+    #---
+
+    def lookup( self, source, flags, start, end ):
+        '''
+        return a dictionary mapping each flag to the (known, active) segments we have between start and end (nanoseconds)
+        '''
+        ans = {}
+        for flag in flags:
+            known, active = self._read( self._path( source, flag ) )
+            ans[flag] = (segments.clip(known, start, end), segments.clip(active, start, end))
+        return ans
+
+    def store( self, source, results ):
+        '''
+        merge new results into the cache
+        results maps each flag to (known, active) segments (nanoseconds) and active segments within the new known segments replace anything we had before
+        '''
+        for flag, (known, active) in results.items():
+            path = self._path( source, flag )
+            known = segments.coalesce( known )
+            with _Lock( self._lock_path() ):
+                old_known, old_active = self._read( path )
+                self._write(
+                    path,
+                    segments.union( old_known, known ),
+                    segments.union( segments.difference( old_active, known ), segments.intersection( active, known ) ),
+                )
+
+    def evict( self ):
+        '''
+        remove entries that are too old and then the oldest entries until the cache is small enough
+        returns the number of entries removed
+        '''
+        now = time.time()
+        entries = [] ### (mtime, size, path)
+        for name in os.listdir( self.directory ):
+            if name.endswith('.npz.lock'): ### left behind by versions that locked each entry separately
+                try:
+                    os.unlink( os.path.join(self.directory, name) )
+                except OSError:
+                    pass
+                continue
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat( path )
+            except OSError: ### removed by someone else
+                continue
+            entries.append( (stat.st_mtime, stat.st_size, path) )
+        entries.sort()
+
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for mtime, nbytes, path in entries:
+            if not (((self.max_age is not None) and (now - mtime > self.max_age)) or ((self.max_bytes is not None) and (size > self.max_bytes))):
+                break ### entries are sorted by age, so everything else is newer
+
+            with _Lock( self._lock_path() ):
+                try:
+                    if os.stat( path ).st_mtime == mtime: ### make sure nobody updated it in the meantime
+                        os.unlink( path )
+                        removed += 1
+                except OSError: ### removed by someone else
+                    pass
+            size -= nbytes
+            with self._lock:
+                self._memory.pop( path, None )
+        return removed
+
+#-------------------------------------------------
+
+class Lease(object):
+    '''
+    the lease files a process holds on the flags it is querying, which are removed by release
+    '''
+
+    def __init__( self, paths ):
+        self.paths = paths
+
+    def release( self ):
+        for path in self.paths:
+            try:
+                os.unlink( path )
+            except OSError: ### already removed as stale
+                pass
+        self.paths = []
+
+class Leases(object):
+    '''
+    leases on queries in flight, stored as one small file per (source, flag, query) under directory
+    each lease records the window being queried, and a lease is ignored (and removed) once it is older than ttl seconds or the process holding it (on this host) has died
+    max_wait is the longest we wait for other processes' queries before issuing our own (None waits as long as their leases last)
+    '''
+
+    def __init__( self, directory, ttl=600, max_wait=None, poll=0.1 ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_wait = max_wait
+        self.poll = poll
+        self.host = socket.gethostname()
+        _makedirs( directory )
+
+    def _stale( self, info ):
+        '''
+        whether the lease described by info has expired or its process has died
+        '''
+        if time.time() > info['expires']:
+            return True
+        if info['host'] != self.host:
+            return False
+        try:
+            os.kill( info['pid'], 0 )
+        except OSError as e:
+            return e.errno == errno.ESRCH
+        return False
+
+    def _holders( self, source, flag ):
+        '''
+        the (path, info) of every live lease on flag from source, removing any that are stale
+        '''
+        prefix = _name( source, flag ) + "."
+        ans = []
+        for name in os.listdir( self.directory ):
+            if not (name.startswith(prefix) and name.endswith('.lease')):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                file_obj = open(path, 'r')
+                info = json.load( file_obj )
+                file_obj.close()
+            except (IOError, OSError, ValueError): ### released in the meantime
+                continue
+            if self._stale( info ):
+                try:
+                    os.unlink( path )
+                except OSError:
+                    pass
+            else:
+                ans.append( (path, info) )
+        return ans
+
+    def claim( self, source, flags, start, end ):
+        '''
+        take a lease on querying flags from source within [start, end] (GPS seconds)
+        returns (lease, busy)
+            lease is a Lease (to be released once the results are in the cache) or None if another query for an overlapping window of any of these flags is already in flight
+            busy lists the (path, info) of those other leases, which can be handed to wait
+        '''
+        with _Lock( os.path.join(self.directory, '.lock') ): ### nobody else may claim while we check for overlapping leases
+            busy = []
+            for flag in flags:
+                busy += [(path, info) for path, info in self._holders( source, flag ) if (info['start'] < end) and (start < info['end'])]
+            if busy:
+                return None, busy
+
+            info = {'host':self.host, 'pid':os.getpid(), 'start':start, 'end':end, 'expires':time.time()+self.ttl}
+            token = uuid.uuid4().hex
+            paths = []
+            for flag in flags:
+                path = os.path.join(self.directory, "%s.%s.lease"%(_name( source, flag ), token))
+                file_obj = open(path, 'w')
+                json.dump( dict(info, flag=flag), file_obj )
+                file_obj.close()
+                paths.append( path )
+        return Lease( paths ), []
+
+    def wait( self, busy, timeout=None ):
+        '''
+        block until every lease in busy has been released (or gone stale), giving up after timeout seconds
+        returns True if they were all released
+        '''
+        t0 = time.time()
+        while True:
+            busy = [(path, info) for path, info in busy if os.path.exists(path) and not self._stale( info )]
+            if not busy:
+                return True
+            if (timeout is not None) and (time.time()-t0 >= timeout):
+                return False
+            time.sleep( self.poll )
@@ -0,0 +1,348 @@
+'''
+a long-running worker for seglogic.py that receives alerts over a local (unix) socket
+this keeps the parsed config, GraceDb client and imported modules warm between events
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import heapq
+import socket
+import threading
+import traceback
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from segDb2grcDb import alerts
+from segDb2grcDb import metrics
+from segDb2grcDb.admission import AdmissionPolicy
+
+#-------------------------------------------------
+
+def send( path, request, timeout=None ):
+    '''
+    send a single request to the daemon listening on path and return its response
+    requests and responses are JSON dictionaries written on a single line
+    '''
+    sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    sock.settimeout( timeout )
+    try:
+        sock.connect( path )
+        sock.sendall( (json.dumps(request)+"\n").encode('utf-8') )
+        file_obj = sock.makefile('rb')
+        response = file_obj.readline()
+        file_obj.close()
+    finally:
+        sock.close()
+    if not response:
+        raise RuntimeError("no response from daemon at %s"%path)
+    return json.loads(response.decode('utf-8'))
+
+def isAlive( path, timeout=5.0 ):
+    '''
+    whether a daemon is listening on path
+    '''
+    try:
+        send( path, {'command':'status'}, timeout=timeout )
+    except (socket.error, RuntimeError, ValueError):
+        return False
+    return True
+
+#-------------------------------------------------
+
+class _Handler(socketserver.StreamRequestHandler):
+    '''
+    reads a single request and writes a single response
+    '''
+
+    def handle( self ):
+        line = self.rfile.readline()
+        try:
+            response = self.server.seglogic.handle( json.loads(line.decode('utf-8')) )
+        except Exception as e:
+            response = {'status':'error', 'error':"%s: %s"%(type(e).__name__, e)}
+        self.wfile.write( (json.dumps(response)+"\n").encode('utf-8') )
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+#-------------------------------------------------
+
+class SeglogicDaemon(object):
+    '''
+    accepts graceids over a unix socket and processes them with process(graceid) in a bounded pool of threads
+    events wait in a priority queue and may be shed under load according to policy (see segDb2grcDb.admission.AdmissionPolicy)
+    if an alert does not describe its event, describe(graceid) is called to look it up (e.g. from GraceDb) so that it can be ranked
+    lookups happen in up to max_lookups threads of their own, so that we respond to every request right away
+
+    supported requests are
+        {'command':'alert', 'alert':<LVAlert message>}
+        {'command':'graceid', 'graceid':<graceid>} (optionally with 'event':<description of the event>)
+        {'command':'status'}
+        {'command':'stop'}
+    '''
+
+    def __init__( self, path, process, max_events=1, policy=None, describe=None, max_lookups=4, verbose=False ):
+        if max_events < 1:
+            raise ValueError("max_events must be at least 1")
+        if max_lookups < 1:
+            raise ValueError("max_lookups must be at least 1")
+        self.path = path
+        self.process = process
+        self.max_events = max_events
+        self.policy = policy or AdmissionPolicy()
+        self.describe = describe
+        self.verbose = verbose
+
+        if self.policy.reserved_events >= max_events:
+            raise ValueError("reserved-events must be less than max_events, otherwise events that are not urgent are never processed")
+
+        self.start_time = time.time()
+        self._queue = [] ### heap of (priority, sequence, graceid, time received)
+        self._sequence = 0
+        self._stopping = False
+        self._lock = threading.Condition()
+        self._running = {} ### graceid -> (time processing started, priority)
+        self._lookups = queue.Queue() ### (graceid, time received) for events that must be described before they are ranked
+        self._describing = 0 ### number of events that are waiting for (or in the middle of) a lookup
+        self.counts = {'received':0, 'ignored':0, 'processed':0, 'failed':0, 'shed':0}
+
+        ### clean up after a daemon that did not exit cleanly, but refuse to step on a live one
+        if os.path.exists(path):
+            if isAlive( path ):
+                raise RuntimeError("a daemon is already listening on %s"%path)
+            os.unlink( path )
+
+        self._server = _Server( path, _Handler )
+        self._server.seglogic = self
+
+        ### the first reserved_events workers only process urgent events
+        self._workers = []
+        for i in range(max_events):
+            worker = threading.Thread( target=self._work, args=(i < self.policy.reserved_events,), name="seglogic-event-%d"%i )
+            worker.daemon = True
+            worker.start()
+            self._workers.append( worker )
+
+        self._lookers = []
+        for i in range(max_lookups):
+            looker = threading.Thread( target=self._lookup, name="seglogic-lookup-%d"%i )
+            looker.daemon = True
+            looker.start()
+            self._lookers.append( looker )
+
+    def priority( self, graceid, event=None ):
+        '''
+        rank an event, looking it up with describe if we were not told anything about it
+        '''
+        if self.policy.rules and (not event) and (self.describe is not None):
+            try:
+                event = self.describe( graceid )
+            except Exception:
+                traceback.print_exc()
+                sys.stderr.flush()
+        return self.policy.priority( event or {} )
+
+    def submit( self, graceid, event=None ):
+        '''
+        queue an event for processing, unless it is shed under load
+        events that have to be looked up before they can be ranked are handed to the lookup threads, which queue (or shed) them once they are described
+        returns status, priority where status is "queued", "shed" or "accepted" (meaning it is being looked up, in which case priority is None)
+        '''
+        received = time.time()
+        if self.policy.rules and (not event) and (self.describe is not None):
+            with self._lock:
+                self.counts['received'] += 1
+                self._describing += 1
+            self._lookups.put( (graceid, received) )
+            return 'accepted', None
+
+        with self._lock:
+            self.counts['received'] += 1
+            return self._admit( graceid, self.policy.priority( event or {} ), received )
+
+    def _admit( self, graceid, priority, received ):
+        '''
+        queue an event that has been ranked, or shed it (called with the lock held)
+        '''
+        depth = len(self._queue)
+        if self.policy.shedOnArrival( priority, depth ):
+            self._shed( graceid, priority, time.time()-received, "%d events are already queued"%depth )
+            return 'shed', priority
+
+        if self.policy.isFull( depth ): ### make room by shedding the least urgent event, which may be this one
+            worst = max(self._queue)
+            if worst[0] <= priority:
+                self._shed( graceid, priority, time.time()-received, "the queue is full" )
+                return 'shed', priority
+            self._queue.remove( worst )
+            heapq.heapify( self._queue )
+            self._shed( worst[2], worst[0], time.time()-worst[3], "the queue is full" )
+
+        heapq.heappush( self._queue, (priority, self._sequence, graceid, received) )
+        self._sequence += 1
+        self._lock.notify_all()
+        return 'queued', priority
+
+    def _lookup( self ):
+        while True:
+            job = self._lookups.get()
+            if job is None: ### signal to stop
+                return
+            graceid, received = job
+
+            priority = self.priority( graceid )
+            with self._lock:
+                self._describing -= 1
+                status, _ = self._admit( graceid, priority, received )
+            if self.verbose:
+                print "daemon: %s %s (priority=%d) after looking it up"%(status, graceid, priority)
+                sys.stdout.flush()
+
+    def _shed( self, graceid, priority, wait, reason ):
+        '''
+        give up on an event (called with the lock held)
+        '''
+        self.counts['shed'] += 1
+        metrics.record( 'shed', wait, graceid=graceid, priority=priority )
+        if self.verbose:
+            print "daemon: shedding %s (priority=%d) because %s"%(graceid, priority, reason)
+            sys.stdout.flush()
+
+    def _next( self, reserved ):
+        '''
+        block until there is an event this worker may process and return it, or return None once we are stopping and there is nothing left for this worker
+        '''
+        with self._lock:
+            while True:
+                if self._queue and ((not reserved) or self.policy.isUrgent( self._queue[0][0] )):
+                    priority, _, graceid, received = heapq.heappop( self._queue )
+                    wait = time.time()-received
+                    if self.policy.isStale( wait ):
+                        self._shed( graceid, priority, wait, "it waited for %.3f sec"%wait )
+                        continue
+                    self._running[graceid] = (time.time(), priority)
+                    return graceid, priority, wait
+                if self._stopping:
+                    return None
+                self._lock.wait()
+
+    def _work( self, reserved ):
+        while True:
+            job = self._next( reserved )
+            if job is None: ### signal to stop
+                return
+            graceid, priority, wait = job
+
+            metrics.record( 'queued', wait, graceid=graceid, priority=priority )
+            if self.verbose:
+                print "daemon: processing %s (priority=%d, queued for %.3f sec)"%(graceid, priority, wait)
+                sys.stdout.flush()
+
+            try:
+                self.process( graceid )
+            except Exception:
+                traceback.print_exc()
+                sys.stderr.flush()
+                with self._lock:
+                    self.counts['failed'] += 1
+            else:
+                with self._lock:
+                    self.counts['processed'] += 1
+            finally:
+                with self._lock:
+                    self._running.pop( graceid, None )
+
+    def status( self ):
+        '''
+        a summary of what the daemon is doing
+        '''
+        now = time.time()
+        with self._lock:
+            status = {
+                'status'     : 'ok',
+                'pid'        : os.getpid(),
+                'uptime'     : now - self.start_time,
+                'max-events' : self.max_events,
+                'reserved'   : self.policy.reserved_events,
+                'queued'     : len(self._queue),
+                'describing' : self._describing,
+                'queue'      : [{'graceid':graceid, 'priority':priority, 'wait':now-t} for priority, _, graceid, t in sorted(self._queue)],
+                'oldest-wait': max([now-t for _, _, _, t in self._queue] or [0.0]),
+                'running'    : dict((graceid, now-t) for graceid, (t, _) in self._running.items()),
+            }
+            status.update( self.counts )
+        return status
+
+    def handle( self, request ):
+        '''
+        respond to a single request
+        '''
+        command = request.get('command')
+        if command == 'alert':
+            with metrics.timer( 'alert' ) as timer:
+                alert = alerts.parseAlert( request['alert'] )
+                graceid = alerts.alert2graceid( alert )
+                timer.tags['graceid'] = graceid
+            if graceid is None:
+                with self._lock:
+                    self.counts['ignored'] += 1
+                return {'status':'ignored'}
+            status, priority = self.submit( graceid, alerts.alert2event( alert ) )
+            return {'status':status, 'graceid':graceid, 'priority':priority}
+
+        elif command == 'graceid':
+            status, priority = self.submit( request['graceid'], request.get('event') )
+            return {'status':status, 'graceid':request['graceid'], 'priority':priority}
+
+        elif command == 'status':
+            return self.status()
+
+        elif command == 'stop':
+            threading.Thread( target=self.shutdown ).start() ### shutdown blocks until serve_forever returns, so we can't call it from this thread
+            return {'status':'stopping'}
+
+        else:
+            raise ValueError("command=%s not understood"%command)
+
+    def serve_forever( self ):
+        if self.verbose:
+            print "daemon: listening on %s with max-events=%d"%(self.path, self.max_events)
+            sys.stdout.flush()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.path):
+                os.unlink( self.path )
+
+            ### let events that are already queued (or being looked up) finish
+            for _ in self._lookers:
+                self._lookups.put( None )
+            for looker in self._lookers:
+                while looker.is_alive():
+                    looker.join( 1.0 )
+            with self._lock:
+                self._stopping = True
+                self._lock.notify_all()
+            for worker in self._workers:
+                while worker.is_alive():
+                    worker.join( 1.0 ) ### join with a timeout so we remain responsive to KeyboardInterrupt
+
+    def shutdown( self ):
+        '''
+        stop accepting new requests, after which serve_forever returns once queued events finish
+        '''
+        self._server.shutdown()
@@ -0,0 +1,160 @@
+'''
+an in-process reader for the DMT segment files found under ONLINEDQ
+replaces "ligolw_segment_query --dmt-files" on the low-latency path
+
+files are expected to follow the same layout ligolw_segment_query assumes, namely
+    ${ONLINEDQ}/.../${OBS}-DQ_Segments-${GPS/100000}/${OBS}-DQ_Segments-${START}-${DUR}.xml
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import re
+import time
+import bisect
+import threading
+
+from collections import defaultdict
+
+import numpy as np
+
+from segDb2grcDb import segments
+from segDb2grcDb import segxml
+from segDb2grcDb.segtables import SegmentTables
+
+#-------------------------------------------------
+
+BUCKET = 100000 ### the span of GPS time stored in each "-NNNNN" directory
+
+_bucket = re.compile(r'.*-([0-9]{5})$')
+_file = re.compile(r'.*-([0-9]+)-([0-9]+)\.xml(\.gz)?$')
+
+#-------------------------------------------------
+
+def url2path( url ):
+    '''
+    file:///ifocache/DQ/H1/ -> /ifocache/DQ/H1/
+    '''
+    if url.startswith('file://'):
+        return url[len('file://'):]
+    return url
+
+#-------------------------------------------------
+
+class _Listing(object):
+    '''
+    the parsed contents of a single directory
+    '''
+
+    def __init__( self, path, mtime ):
+        self.mtime = mtime
+        self.listed = time.time()
+
+        self.buckets = [] ### (NNNNN, path) for directories that hold a single bucket of time
+        self.others = [] ### directories that we must recurse through (e.g. one per IFO)
+        files = [] ### (start, dur, path)
+        for name in os.listdir(path):
+            fullpath = os.path.join(path, name)
+            match = _file.match( name )
+            if match:
+                files.append( (int(match.group(1)), int(match.group(2)), fullpath) )
+                continue
+
+            match = _bucket.match( name )
+            if match:
+                self.buckets.append( (int(match.group(1)), fullpath) )
+            elif os.path.isdir(fullpath):
+                self.others.append( fullpath )
+
+        files.sort()
+        self.starts = [f[0] for f in files]
+        self.ends = [f[0]+f[1] for f in files]
+        self.paths = [f[2] for f in files]
+        self.maxdur = max([f[1] for f in files]) if files else 0
+
+    def files( self, start, end ):
+        '''
+        the files whose spans overlap [start, end]
+        '''
+        lo = bisect.bisect_left( self.starts, start-self.maxdur )
+        hi = bisect.bisect_right( self.starts, end )
+        return [self.paths[i] for i in range(lo, hi) if self.ends[i] > start]
+
+class DMTIndex(object):
+    '''
+    an index from GPS time to DMT segment files
+    directory listings are cached and only refreshed when a directory's mtime changes, so repeated queries only look at the few files they need
+    '''
+
+    def __init__( self, root ):
+        self.root = url2path( root )
+        self._lock = threading.Lock()
+        self._listings = {}
+
+    def _listing( self, path ):
+        '''
+        return the (cached) listing of path, refreshing it if the directory has changed
+        '''
+        mtime = os.stat(path).st_mtime
+        listing = self._listings.get(path, None)
+        ### also refresh if we listed the directory right as it was being modified, in case the filesystem's mtime resolution is coarse
+        if (listing is None) or (listing.mtime != mtime) or (listing.listed - mtime < 1.0):
+            listing = self._listings[path] = _Listing( path, mtime )
+        return listing
+
+    def files( self, start, end ):
+        '''
+        return the paths to all files overlapping [start, end] (GPS seconds)
+        '''
+        first = int(start)//BUCKET - 1 ### a file stored in the previous bucket may run across start
+        last = int(end)//BUCKET
+
+        ans = []
+        with self._lock:
+            paths = [self.root]
+            while paths:
+                listing = self._listing( paths.pop() )
+                ans += listing.files( start, end )
+                paths += [path for n, path in listing.buckets if first <= n <= last]
+                paths += listing.others
+        return sorted(ans)
+
+    def query( self, flags, start, end ):
+        '''
+        read known and active segments for flags (IFO:NAME:VERSION) within [start, end] (GPS seconds)
+        returns a dictionary mapping each flag to (known, active) segment arrays measured in nanoseconds
+        '''
+        start_ns = segments.gps2ns( start )
+        end_ns = segments.gps2ns( end )
+
+        wanted = set(flags)
+        known = defaultdict( list )
+        active = defaultdict( list )
+        for path in self.files( start, end ):
+            tables = SegmentTables.fromColumns( segxml.readColumns( path, ['segment_definer', 'segment_summary', 'segment'] ) )
+            for i, (flag_known, flag_active) in enumerate(tables.split()):
+                flag = tables.flag( i )
+                if flag in wanted:
+                    known[flag].append( flag_known )
+                    active[flag].append( flag_active )
+
+        known = dict((flag, np.concatenate(segs)) for flag, segs in known.items())
+        active = dict((flag, np.concatenate(segs)) for flag, segs in active.items())
+
+        return dict((flag, (segments.coalesce(segments.clip(known.get(flag, segments.empty()), start_ns, end_ns)), segments.coalesce(segments.clip(active.get(flag, segments.empty()), start_ns, end_ns)))) for flag in flags)
+
+#-------------------------------------------------
+
+### indices are shared within a process so a long-lived process (e.g. seglogic.py --daemon) only ever lists each directory once
+_indices = {}
+_indices_lock = threading.Lock()
+
+def getIndex( root ):
+    '''
+    return the shared DMTIndex for root
+    '''
+    with _indices_lock:
+        if root not in _indices:
+            _indices[root] = DMTIndex( root )
+        return _indices[root]
@@ -0,0 +1,189 @@
+'''
+boolean expressions over flags, evaluated from segments we have already retrieved
+e.g. "H1:DMT-ANALYSIS_READY:1 AND NOT H1:DMT-OMC_DCPD_ADC_OVERFLOW:1" or "H1:ODC-INJECTION_*:2" (any flag matching the pattern)
+
+expressions are built from flags, the operators NOT, AND and OR (in order of precedence) and parentheses
+flags may contain shell-style wildcards, which stand for the OR of every matching flag
+the result is only known when all of the flags it depends on are known, and is active wherever the expression is true within that time
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import re
+import fnmatch
+import threading
+
+from segDb2grcDb import segments
+from segDb2grcDb import metrics
+
+#-------------------------------------------------
+
+_token = re.compile(r'\(|\)|[^\s()]+')
+
+OPERATORS = ['NOT', 'AND', 'OR']
+
+#-------------------------------------------------
+
+class Expression(object):
+    '''
+    a parsed boolean expression over flags
+    flags is the list of flags the expression may refer to, which wildcards are matched against
+    raises ValueError if the expression cannot be parsed or refers to flags that are not in flags
+    '''
+
+    def __init__( self, text, flags ):
+        self.text = text
+        self._available = flags
+        self._tokens = _token.findall( text )
+        self._pos = 0
+
+        if not self._tokens:
+            raise ValueError("empty expression")
+        self.tree = self._or()
+        if self._pos < len(self._tokens):
+            raise ValueError("could not parse \"%s\" : unexpected \"%s\""%(text, self._tokens[self._pos]))
+        del self._tokens, self._pos, self._available
+
+        self.flags = sorted(self._flags( self.tree ))
+
+    #---
+
+    def _peek( self ):
+        if self._pos < len(self._tokens):
+            return self._tokens[self._pos]
+        return None
+
+    def _next( self ):
+        token = self._peek()
+        if token is None:
+            raise ValueError("could not parse \"%s\" : unexpected end of expression"%self.text)
+        self._pos += 1
+        return token
+
+    def _or( self ):
+        node = self._and()
+        while (self._peek() or '').upper()=='OR':
+            self._next()
+            node = ('OR', node, self._and())
+        return node
+
+    def _and( self ):
+        node = self._not()
+        while (self._peek() or '').upper()=='AND':
+            self._next()
+            node = ('AND', node, self._not())
+        return node
+
+    def _not( self ):
+        if (self._peek() or '').upper()=='NOT':
+            self._next()
+            return ('NOT', self._not())
+        return self._atom()
+
+    def _atom( self ):
+        token = self._next()
+        if token=='(':
+            node = self._or()
+            if self._next()!=')':
+                raise ValueError("could not parse \"%s\" : missing \")\""%self.text)
+            return node
+        if (token==')') or (token.upper() in OPERATORS):
+            raise ValueError("could not parse \"%s\" : unexpected \"%s\""%(self.text, token))
+
+        ### a single flag, or every flag matching a pattern
+        matches = fnmatch.filter( self._available, token )
+        if not matches:
+            raise ValueError("\"%s\" in \"%s\" does not match any flag in [general] flags"%(token, self.text))
+        node = ('FLAG', matches[0])
+        for flag in matches[1:]:
+            node = ('OR', node, ('FLAG', flag))
+        return node
+
+    def _flags( self, node ):
+        if node[0]=='FLAG':
+            return set([node[1]])
+        return set.union( *[self._flags( child ) for child in node[1:]] )
+
+    #---
+
+    def evaluate( self, results ):
+        '''
+        evaluate the expression given results, which maps each of self.flags to (known, active) segments (nanoseconds)
+        returns (known, active) segments for the expression
+        '''
+        known = results[self.flags[0]][0]
+        for flag in self.flags[1:]:
+            known = segments.intersection( known, results[flag][0] )
+        return known, segments.intersection( self._evaluate( self.tree, results, known ), known )
+
+    def _evaluate( self, node, results, known ):
+        '''
+        the times within known at which node is true
+        '''
+        if node[0]=='FLAG':
+            return segments.intersection( results[node[1]][1], known )
+        elif node[0]=='NOT':
+            return segments.complement( self._evaluate( node[1], results, known ), known )
+        elif node[0]=='AND':
+            return segments.intersection( self._evaluate( node[1], results, known ), self._evaluate( node[2], results, known ) )
+        else: ### OR
+            return segments.union( self._evaluate( node[1], results, known ), self._evaluate( node[2], results, known ) )
+
+#-------------------------------------------------
+
+class ExpressionCollector(object):
+    '''
+    collects results for flags as each query finishes and evaluates every expression as soon as all of the flags it depends on are in
+        expressions maps names to Expressions
+        report(name, expression, start, end, known, active) is called once for each expression that could be evaluated within its window [start, end] (GPS seconds), which is the overlap of its flags' windows
+        missing(name, expression, flags) is called instead if some of its flags could not be retrieved
+    '''
+
+    def __init__( self, expressions, report, missing ):
+        self.expressions = expressions
+        self.report = report
+        self.missing = missing
+
+        self._lock = threading.Lock()
+        self._results = {} ### flag -> (start, end, (known, active) or None if the query failed)
+        self._done = set()
+
+    def add( self, flags, start, end, results ):
+        '''
+        record the results (flag -> (known, active) in nanoseconds) of a query for flags within [start, end]
+        flags missing from results are treated as failed
+        '''
+        with self._lock:
+            for flag in flags:
+                self._results[flag] = (start, end, results.get(flag))
+            ready = []
+            for name, expression in sorted(self.expressions.items()):
+                if (name not in self._done) and all(flag in self._results for flag in expression.flags):
+                    self._done.add( name )
+                    ready.append( (name, expression, dict((flag, self._results[flag]) for flag in expression.flags)) )
+
+        for name, expression, found in ready:
+            failed = [flag for flag in expression.flags if found[flag][2] is None]
+            if failed:
+                self.missing( name, expression, failed )
+                continue
+
+            start = max(found[flag][0] for flag in expression.flags)
+            end = min(found[flag][1] for flag in expression.flags)
+            start_ns = segments.gps2ns( start )
+            end_ns = segments.gps2ns( end )
+            with metrics.timer( 'expression', flag=name, source='expression' ):
+                known, active = expression.evaluate( dict((flag, (segments.clip(found[flag][2][0], start_ns, end_ns), segments.clip(found[flag][2][1], start_ns, end_ns))) for flag in expression.flags) )
+            self.report( name, expression, start, end, known, active )
+
+    def finish( self ):
+        '''
+        give up on any expressions that are still waiting for flags, e.g. because a query raised an unexpected exception
+        '''
+        with self._lock:
+            waiting = [(name, expression) for name, expression in sorted(self.expressions.items()) if name not in self._done]
+            self._done.update( name for name, _ in waiting )
+            failed = [(name, expression, [flag for flag in expression.flags if (flag not in self._results) or (self._results[flag][2] is None)]) for name, expression in waiting]
+        for name, expression, flags in failed:
+            self.missing( name, expression, flags )
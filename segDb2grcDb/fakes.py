@@ -0,0 +1,472 @@
+'''
+stand-ins for external services so that seglogic.py can be exercised without touching production systems
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import re
+import sys
+import json
+import email
+import time
+import zlib
+import socket
+import threading
+
+try:
+    _message_from_bytes = email.message_from_bytes
+except AttributeError: ### python2, where strings are bytes
+    _message_from_bytes = email.message_from_string
+
+try:
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from urllib.parse import urlparse, parse_qs
+
+try:
+    import SocketServer as socketserver
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    import socketserver
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+from segDb2grcDb import segments
+from segDb2grcDb import segxml
+
+#-------------------------------------------------
+
+class FakeResponse(object):
+    '''
+    mimics the parts of the http responses returned by ligo.gracedb.rest.GraceDb that we use
+    '''
+
+    def __init__( self, data, status=200 ):
+        self.data = data
+        self.status = status
+
+    def json( self ):
+        return self.data
+
+class FakeHTTPError(Exception):
+    '''
+    mimics ligo.gracedb.rest.HTTPError
+    '''
+
+    def __init__( self, status, reason="" ):
+        Exception.__init__( self, "%d %s"%(status, reason) )
+        self.status = status
+        self.reason = reason
+
+#-------------------------------------------------
+
+class FakeGraceDb(object):
+    '''
+    an in-memory GraceDb that records every log message and label it receives
+
+    events maps graceid -> gpstime (stored as gpstimes)
+    every request sleeps for latency seconds before it is handled
+    the first failures requests raise FakeHTTPError(status), which is useful for testing retries
+    '''
+
+    def __init__( self, events={}, latency=0.0, failures=0, status=503 ):
+        self.gpstimes = dict(events)
+        self.latency = latency
+        self.failures = failures
+        self.status = status
+
+        self._lock = threading.Lock()
+        self.logs = [] ### (graceid, message, filename, tagname)
+        self.labels = [] ### (graceid, label)
+        self.requests = 0
+
+    def _request( self ):
+        if self.latency:
+            time.sleep( self.latency )
+        with self._lock:
+            self.requests += 1
+            if self.failures:
+                self.failures -= 1
+                raise FakeHTTPError( self.status, "fake failure" )
+
+    def event( self, graceid ):
+        self._request()
+        if graceid not in self.gpstimes:
+            raise FakeHTTPError( 404, "event %s not found"%graceid )
+        return FakeResponse( {'graceid':graceid, 'gpstime':self.gpstimes[graceid]} )
+
+    def events( self, query=None, columns=None ):
+        '''
+        yield every event (the query is ignored)
+        '''
+        self._request()
+        for graceid, gpstime in sorted(self.gpstimes.items()):
+            yield {'graceid':graceid, 'gpstime':gpstime}
+
+    def writeLog( self, graceid, message, filename=None, filecontents=None, tagname=[] ):
+        self._request()
+        with self._lock:
+            self.logs.append( (graceid, message, filename, list(tagname)) )
+        return FakeResponse( {}, status=201 )
+
+    def writeLabel( self, graceid, label ):
+        self._request()
+        with self._lock:
+            self.labels.append( (graceid, label) )
+        return FakeResponse( {}, status=201 )
+
+#-------------------------------------------------
+
+def syntheticSegments( flag, start, end, stride=16, duty=0.1 ):
+    '''
+    deterministic pseudo-random active segments (in integer GPS seconds) for flag within [start, end]
+    each stride seconds contains a single segment with probability duty, so the same times always give the same segments regardless of how they are requested
+    '''
+    seed = zlib.crc32( flag.encode('utf-8') ) & 0xffffffff
+    ans = []
+    for k in range(int(start)//stride, int(end)//stride + 1):
+        rng = np.random.RandomState( (seed + k) % 2**32 )
+        if rng.rand() < duty:
+            s, e = sorted(rng.randint(0, stride+1, size=2))
+            if e > s:
+                ans.append( [k*stride+s, k*stride+e] )
+    ans = np.array(ans, dtype=np.int64).reshape((-1,2))
+    return segments.clip( ans, int(start), int(end) ).tolist()
+
+class DMTWriter(object):
+    '''
+    writes synthetic DMT segment files for flags (all from the same IFO) under root in the layout segDb2grcDb.dmt expects
+    each file covers stride seconds and is written latency seconds after the end of the time it covers, as measured by clock (which should return GPS seconds)
+    files covering the backlog seconds before we started are written immediately
+    '''
+
+    def __init__( self, root, flags, clock, stride=16, latency=1.0, backlog=3600, duty=0.1 ):
+        self.root = root
+        self.flags = flags
+        self.clock = clock
+        self.stride = stride
+        self.latency = latency
+        self.duty = duty
+
+        self.ifo = flags[0].split(":")[0]
+        self.obs = self.ifo[0]
+        self.next = (int(clock() - latency - backlog)//stride)*stride ### the start of the next file to write
+        self._stop = threading.Event()
+
+        self.write() ### catch up on the backlog
+        self._thread = threading.Thread( target=self._work, name="fake-dmt-writer" )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def path( self, start ):
+        directory = os.path.join(self.root, self.ifo, "%s-DQ_Segments-%05d"%(self.obs, start//100000))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        return os.path.join(directory, "%s-DQ_Segments-%d-%d.xml"%(self.obs, start, self.stride))
+
+    def write( self ):
+        '''
+        write every file whose data should be available by now
+        '''
+        while self.next + self.stride + self.latency <= self.clock():
+            start, end = self.next, self.next+self.stride
+            results = []
+            for flag in self.flags:
+                active = segments.asarray( syntheticSegments( flag, start, end, stride=self.stride, duty=self.duty ) )*segments.NS
+                results.append( (flag, segments.asarray([[start*segments.NS, end*segments.NS]]), active) )
+            path = self.path( start )
+            segxml.writeSegments( path+".tmp", results, comment="DMTWriter" )
+            os.rename( path+".tmp", path ) ### make sure readers never see a partial file
+            self.next = end
+
+    def _work( self ):
+        while not self._stop.is_set():
+            self.write()
+            self._stop.wait( 0.1 )
+
+    def close( self ):
+        self._stop.set()
+        self._thread.join()
+
+#-------------------------------------------------
+
+class _HTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error( self, request, client_address ):
+        if isinstance(sys.exc_info()[1], socket.error): ### clients hang up on connections we keep alive whenever they like
+            return
+        HTTPServer.handle_error( self, request, client_address )
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    '''
+    dispatches requests to self.server.fake.handle, which returns (status, JSON-able response)
+    connections are kept alive between requests, like the real services
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message( self, *args ): ### keep quiet
+        pass
+
+    def setup( self ):
+        BaseHTTPRequestHandler.setup( self )
+        with self.server.fake._connections_lock:
+            self.server.fake.connections += 1
+            self.server.fake._open.add( self.connection )
+
+    def finish( self ):
+        with self.server.fake._connections_lock:
+            self.server.fake._open.discard( self.connection )
+        BaseHTTPRequestHandler.finish( self )
+
+    def _respond( self, method ):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read( length ) if length else b''
+        try:
+            form = parseForm( self.headers.get('Content-Type', ''), body )
+        except ValueError as e:
+            status, response = 400, {'error':str(e)}
+        else:
+            url = urlparse( self.path )
+            status, response = self.server.fake.handle( method, url.path, parse_qs(url.query), form )
+
+        body = json.dumps( response ).encode('utf-8')
+        self.send_response( status )
+        self.send_header( 'Content-Type', 'application/json' )
+        self.send_header( 'Content-Length', str(len(body)) )
+        self.end_headers()
+        self.wfile.write( body )
+
+    def do_GET( self ):
+        self._respond( 'GET' )
+
+    def do_POST( self ):
+        self._respond( 'POST' )
+
+    def do_PUT( self ):
+        self._respond( 'PUT' )
+
+def parseForm( content_type, body ):
+    '''
+    the fields in the body of a request as a dictionary, for each of the encodings ligo.gracedb.rest.GraceDb uses
+        application/json                  : the decoded object
+        application/x-www-form-urlencoded : the last value of each field
+        multipart/form-data               : the value of each field, except for uploaded files which give their file name
+    '''
+    if not body:
+        return {}
+    kind = content_type.split(';')[0].strip().lower()
+
+    if kind == 'application/json':
+        return json.loads( body.decode('utf-8') )
+
+    elif kind == 'application/x-www-form-urlencoded':
+        return dict((key, values[-1]) for key, values in parse_qs( body.decode('utf-8') ).items())
+
+    elif kind == 'multipart/form-data':
+        ### email splits the parts for us once it is told the boundary, which is in content_type
+        message = _message_from_bytes( ("Content-Type: %s\r\n\r\n"%content_type).encode('utf-8') + body )
+        form = {}
+        for part in message.get_payload():
+            name = part.get_param( 'name', header='content-disposition' )
+            filename = part.get_filename()
+            form[name] = filename if filename else part.get_payload( decode=True ).decode('utf-8')
+        return form
+
+    raise ValueError("cannot parse request bodies with Content-Type=%s"%content_type)
+
+class _FakeServer(object):
+    '''
+    runs a local (plain http) server in a background thread
+    connections counts how many connections clients have opened
+    '''
+
+    def __init__( self, host='127.0.0.1', port=0, latency=0.0 ):
+        self.latency = latency
+        self.connections = 0
+        self._connections_lock = threading.Lock()
+        self._open = set() ### connections that are still open, which we close when we close
+        self._server = _HTTPServer( (host, port), _FakeHandler )
+        self._server.fake = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread( target=self._server.serve_forever, name="fake-server-%d"%self.port )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def handle( self, method, path, query, form ):
+        if self.latency:
+            time.sleep( self.latency )
+        return self._handle( method, path, query, form )
+
+    def close( self ):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._connections_lock:
+            for conn in self._open:
+                try:
+                    conn.shutdown( socket.SHUT_RDWR ) ### lets the threads serving them finish
+                except socket.error:
+                    pass
+
+#------------------------
+
+class FakeGraceDbServer(_FakeServer):
+    '''
+    a local server that speaks enough of the GraceDb REST API for seglogic.py (through ligo.gracedb.rest.GraceDb)
+    events are created with addEvent and every request about an event is recorded in requests as (time, graceid, kind, detail)
+    where kind is one of "event", "log" (detail is (message, filename)) or "label" (detail is the label)
+    '''
+
+    def __init__( self, host='127.0.0.1', port=0, latency=0.0 ):
+        self._lock = threading.Lock()
+        self.gpstimes = {}
+        self.labels = {}
+        self.requests = []
+        _FakeServer.__init__( self, host=host, port=port, latency=latency )
+        self.url = "http://%s:%d/api/"%(self.host, self.port)
+
+    def addEvent( self, graceid, gpstime ):
+        with self._lock:
+            self.gpstimes[graceid] = gpstime
+            self.labels[graceid] = []
+
+    def _record( self, graceid, kind, detail=None ):
+        with self._lock:
+            self.requests.append( (time.time(), graceid, kind, detail) )
+
+    def _event( self, graceid ):
+        return {'graceid':graceid, 'gpstime':self.gpstimes[graceid], 'labels':self.labels[graceid], 'links':{}}
+
+    def _handle( self, method, path, query, form ):
+        url = self.url.rstrip('/')
+        if path.rstrip('/') == '/api':
+            return 200, {
+                'links' : {
+                    'self'   : self.url,
+                    'events' : url+'/events/',
+                },
+                'templates' : {
+                    'event-detail-template' : url+'/events/{graceid}',
+                    'event-log-template'    : url+'/events/{graceid}/log/',
+                    'event-label-template'  : url+'/events/{graceid}/labels/{label}',
+                    'event-label-list-template' : url+'/events/{graceid}/labels/',
+                },
+                'groups':[], 'pipelines':[], 'searches':[], 'labels':[], 'em-groups':[], 'wavebands':{}, 'eel-statuses':[], 'obs-statuses':[], 'instruments':[], 'voevent-types':{},
+            }
+
+        if path.rstrip('/') == '/api/events':
+            with self._lock:
+                events = [self._event( graceid ) for graceid in sorted(self.gpstimes.keys())]
+            return 200, {'events':events, 'numRows':len(events), 'links':{}}
+
+        match = re.match(r'^/api/events/([^/]+)(?:/(log|labels)(?:/([^/]*))?)?/?$', path)
+        if not match:
+            return 404, {'error':'%s not found'%path}
+        graceid, kind, label = match.groups()
+        if graceid not in self.gpstimes:
+            return 404, {'error':'event %s not found'%graceid}
+
+        if kind is None and method=='GET':
+            self._record( graceid, 'event' )
+            with self._lock:
+                return 200, self._event( graceid )
+
+        elif kind=='log' and method=='POST':
+            message = form.get('message', form.get('comment', '')) ### older clients called it comment
+            self._record( graceid, 'log', (message, form.get('upload', None)) )
+            return 201, {'comment':message, 'filename':form.get('upload') or '', 'tag_names':[tag for tag in (form.get('tagname') or '').split(',') if tag]}
+
+        elif kind=='labels' and method=='PUT' and label:
+            self._record( graceid, 'label', label )
+            with self._lock:
+                if label not in self.labels[graceid]:
+                    self.labels[graceid].append( label )
+            return 201, {'name':label}
+
+        elif kind=='labels' and method=='GET':
+            with self._lock:
+                return 200, {'labels':[{'name':name} for name in self.labels[graceid]]}
+
+        return 405, {'error':'%s not allowed for %s'%(method, path)}
+
+#------------------------
+
+class FakeSegDbServer(_FakeServer):
+    '''
+    a local server that speaks enough of the DQSegDB REST API for ligolw_segment_query_dqsegdb and ligolw_segments_from_cats_dqsegdb
+    every flag exists with version 1 and has syntheticSegments
+    data is known up to latency seconds before clock() (which should return GPS seconds)
+    only flags (IFO:NAME:VERSION) are included when listing ifos, names and versions and when reporting active flags (e.g. for segDb2grcDb.allactive)
+    '''
+
+    def __init__( self, clock, host='127.0.0.1', port=0, latency=0.0, data_latency=1.0, stride=16, duty=0.1, flags=[] ):
+        self.clock = clock
+        self.flags = flags
+        self.data_latency = data_latency
+        self.stride = stride
+        self.duty = duty
+        self._lock = threading.Lock()
+        self.queries = [] ### (time, flag or 'report/active', start, end)
+        _FakeServer.__init__( self, host=host, port=port, latency=latency )
+        self.url = "http://%s:%d"%(self.host, self.port)
+
+    def _segments( self, flag, start, end ):
+        '''
+        the known and active segments for flag within [start, end]
+        '''
+        known_end = min(end, self.clock() - self.data_latency)
+        known = [[start, known_end]] if known_end > start else []
+        active = [seg for seg in syntheticSegments( flag, start, end, stride=self.stride, duty=self.duty ) if seg[0] < known_end]
+        return known, [[s, min(e, known_end)] for s, e in active]
+
+    def _handle( self, method, path, query, form ):
+        parts = [part for part in path.split('/') if part]
+        info = {'server':self.url, 'uri':path}
+
+        if (parts == ['report', 'active']) and (method == 'GET'): ### every flag that is active within the window
+            start = float(query.get('s', [0])[0])
+            end = float(query.get('e', [0])[0])
+            with self._lock:
+                self.queries.append( (time.time(), 'report/active', start, end) )
+            results = []
+            for flag in self.flags:
+                ifo, name, version = flag.split(':')
+                active = self._segments( flag, start, end )[1]
+                if active:
+                    results.append( {'ifo':ifo, 'name':name, 'version':int(version), 'active':active} )
+            info.update( {'start':start, 'end':end} )
+            return 200, {'results':results, 'query_information':info}
+
+        if (not parts) or (parts[0] != 'dq') or (method != 'GET'):
+            return 404, {'error':'%s not found'%path}
+        parts = parts[1:]
+
+        if len(parts) < 3: ### listing ifos, names or versions
+            listed = [flag.split(':') for flag in self.flags]
+            if len(parts)==2:
+                versions = sorted(set(int(v) for ifo, name, v in listed if [ifo, name]==parts)) or [1]
+                return 200, {'version':versions, 'resource_type':'versions', 'query_information':info}
+            return 200, {'results':sorted(set(x[len(parts)] for x in listed if x[:len(parts)]==parts)), 'query_information':info}
+
+        ifo, name, version = parts[:3]
+        flag = "%s:%s:%s"%(ifo, name, version)
+        start = float(query.get('s', [0])[0])
+        end = float(query.get('e', [0])[0])
+        with self._lock:
+            self.queries.append( (time.time(), flag, start, end) )
+
+        known, active = self._segments( flag, start, end )
+
+        info.update( {'start':start, 'end':end, 'include':query.get('include', [''])[0]} )
+        return 200, {
+            'ifo'               : ifo,
+            'name'              : name,
+            'version'           : int(version),
+            'known'             : known,
+            'active'            : active,
+            'metadata'          : {'comment':'FakeSegDbServer', 'provenance_url':'', 'uri':path, 'deactivated':False, 'active_indicates_ifo_badness':None},
+            'query_information' : info,
+        }
@@ -0,0 +1,66 @@
+'''
+a lightweight GPS clock
+this replaces lal.gpstime.gps_time_now, which is all seglogic.py needed from lal but requires importing all of lal (and numpy) just to read the clock
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import time
+import calendar
+
+#-------------------------------------------------
+
+### the unix time of the GPS epoch (1980-01-06 00:00:00 UTC)
+GPS_EPOCH = 315964800
+
+### the UTC dates at which a leap second was inserted since the GPS epoch (just before midnight on the previous day)
+### this must be extended whenever the IERS announces a new leap second (see Bulletin C)
+LEAP_SECONDS = [
+    (1981, 7, 1),
+    (1982, 7, 1),
+    (1983, 7, 1),
+    (1985, 7, 1),
+    (1988, 1, 1),
+    (1990, 1, 1),
+    (1991, 1, 1),
+    (1992, 7, 1),
+    (1993, 7, 1),
+    (1994, 7, 1),
+    (1996, 1, 1),
+    (1997, 7, 1),
+    (1999, 1, 1),
+    (2006, 1, 1),
+    (2009, 1, 1),
+    (2012, 7, 1),
+    (2015, 7, 1),
+    (2017, 1, 1),
+]
+_LEAP_UNIX = [calendar.timegm( (year, month, day, 0, 0, 0) ) for year, month, day in LEAP_SECONDS]
+
+#-------------------------------------------------
+
+def leapSeconds( unix ):
+    '''
+    the number of leap seconds inserted between the GPS epoch and unix (seconds since the unix epoch)
+    '''
+    return sum(1 for leap in _LEAP_UNIX if unix >= leap)
+
+def unix2gps( unix ):
+    '''
+    convert a unix time into a GPS time
+    '''
+    return unix - GPS_EPOCH + leapSeconds( unix )
+
+def gps2unix( gps ):
+    '''
+    convert a GPS time into a unix time
+    '''
+    unix = gps + GPS_EPOCH
+    return unix - leapSeconds( unix - leapSeconds( unix ) )
+
+def gps_time_now():
+    '''
+    the current GPS time, with the same name as lal.gpstime.gps_time_now
+    '''
+    return unix2gps( time.time() )
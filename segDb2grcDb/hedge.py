@@ -0,0 +1,146 @@
+'''
+hedged queries across data sources
+the same request is sent to a primary source and, if that has not produced a complete answer within a latency budget, to a secondary source as well
+the first complete answer (the whole window known for every flag) wins and the other query is cancelled
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import sys
+import time
+import threading
+import traceback
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from segDb2grcDb import segments
+from segDb2grcDb import metrics
+from segDb2grcDb.query import QueryError
+
+#-------------------------------------------------
+
+def coverage( results, flags, start, end ):
+    '''
+    the fraction of [start, end] that is known, summed over flags (flags missing from results are not known at all)
+    '''
+    dur = segments.gps2ns( end ) - segments.gps2ns( start )
+    if dur <= 0:
+        return float(len(flags))
+    return sum(segments.duration( segments.clip( results[flag][0], segments.gps2ns( start ), segments.gps2ns( end ) ) ) / float(dur) for flag in flags if flag in results)
+
+#-------------------------------------------------
+
+class Hedge(object):
+    '''
+    a fetch (see segDb2grcDb.query.fetchSegments) that tries several sources in turn
+        sources : a list of (name, fetch, timeout) in order of preference
+            fetch(start, end, cancel) returns (outfilename, results) and should give up once cancel (a threading.Event) is set
+            we stop waiting on a source (and cancel it) after timeout seconds, where None or 0 means we wait as long as it takes
+        flags : an answer is complete when the window is known for all of these
+        budget : how long (sec) to wait for a complete answer from one source before also asking the next one, which we also do as soon as a source fails or returns an incomplete answer
+
+    returns (outfilename, results, name) where name is the source that answered, so that results can be attributed (and cached) correctly
+    the latency and outcome (won, lost, incomplete, failed or timeout) of each source are recorded as the hedge stage (see segDb2grcDb.metrics)
+    if no source gives a complete answer, we return the most complete one and raise QueryError only if every source failed
+    '''
+
+    def __init__( self, sources, flags, budget=0.0, verbose=False ):
+        if not sources:
+            raise ValueError("at least one source is required")
+        self.sources = sources
+        self.flags = flags
+        self.budget = budget
+        self.verbose = verbose
+
+    def __call__( self, start, end ):
+        if len(self.sources)==1: ### nothing to hedge, so the query enforces its own timeout
+            name, fetch = self.sources[0][:2]
+            outfilename, results = fetch( start, end, None )
+            return outfilename, results, name
+
+        answers = queue.Queue()
+        tags = metrics.tags() ### so that measurements made within each source's thread are tagged like ours
+        running = {} ### name -> (time launched, timeout, cancel)
+        waiting = list(self.sources)
+        best = None ### (coverage, name, answer)
+        errors = []
+
+        def run( name, fetch, cancel ):
+            try:
+                with metrics.context( **dict(tags, source=name) ):
+                    answer = fetch( start, end, cancel )
+            except QueryError as e:
+                answer = e
+            except Exception as e: ### report anything else like a failed query rather than losing the thread
+                traceback.print_exc()
+                sys.stderr.flush()
+                answer = QueryError( "%s: %s"%(type(e).__name__, e) )
+            answers.put( (name, answer) )
+
+        def launch():
+            name, fetch, timeout = waiting.pop( 0 )
+            if self.verbose and running:
+                print "        hedging with %s"%name
+            cancel = threading.Event()
+            running[name] = (time.time(), timeout, cancel)
+            thread = threading.Thread( target=run, args=(name, fetch, cancel), name="hedge-%s"%name )
+            thread.daemon = True
+            thread.start()
+
+        def finish( name, outcome ):
+            t0, _, cancel = running.pop( name )
+            cancel.set()
+            metrics.record( 'hedge', time.time()-t0, source=name, outcome=outcome )
+            if self.verbose:
+                print "        %s : %s after %.3f sec"%(name, outcome, time.time()-t0)
+
+        launch()
+        hedge_time = time.time() + self.budget
+        while running:
+            ### wait until the next source answers, times out or it is time to hedge
+            now = time.time()
+            wakeups = [t0+timeout for t0, timeout, _ in running.values() if timeout]
+            if waiting:
+                wakeups.append( hedge_time )
+            try:
+                ### always block with a timeout, which keeps us interruptible
+                name, answer = answers.get( timeout=max(0.0, min(wakeups)-now) if wakeups else 60.0 )
+            except queue.Empty:
+                now = time.time()
+                for name, (t0, timeout, _) in list(running.items()):
+                    if timeout and (now-t0 >= timeout):
+                        errors.append( "%s timed out after %.1f sec"%(name, timeout) )
+                        finish( name, 'timeout' )
+                if waiting and ((now >= hedge_time) or (not running)):
+                    launch()
+                continue
+
+            if name not in running: ### a source we already gave up on
+                continue
+
+            if isinstance(answer, QueryError):
+                errors.append( "%s : %s"%(name, answer) )
+                finish( name, 'failed' )
+            else:
+                cov = coverage( answer[1], self.flags, start, end )
+                if cov >= len(self.flags): ### a complete answer, so we're done
+                    finish( name, 'won' )
+                    for other in list(running.keys()):
+                        finish( other, 'lost' )
+                    return answer[0], answer[1], name
+                if (best is None) or (cov > best[0]):
+                    best = (cov, name, answer)
+                finish( name, 'incomplete' )
+
+            if waiting: ### this source could not give us a complete answer, so ask the next one right away
+                launch()
+
+        if best is not None:
+            if self.verbose:
+                print "        no source knew the whole window, using the most complete answer (from %s)"%best[1]
+            return best[2][0], best[2][1], best[1]
+        raise QueryError( "\n".join(errors) )
@@ -0,0 +1,236 @@
+'''
+timing measurements for each stage of seglogic.py
+every measurement is appended to a JSON-lines log and summarized in a Prometheus textfile (e.g. for node_exporter's textfile collector)
+
+measurements are recorded through the module-level functions (timer, record and context), which do nothing until configure is called
+tags set with context apply to every measurement made within that block by the same thread, so the code that launches queries and parses files does not need to know which event or flag it is working on
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import json
+import time
+import tempfile
+import threading
+
+#-------------------------------------------------
+
+### tags that are included in the Prometheus textfile
+### graceid is only written to the JSON-lines log because it would create a new time series for every event
+PROMETHEUS_TAGS = ['stage', 'flag', 'source', 'outcome']
+
+#-------------------------------------------------
+
+class _Timer(object):
+    '''
+    records how long the block it manages took, tagging the measurement with error=True if the block raised an exception
+    '''
+
+    def __init__( self, metrics, stage, tags ):
+        self.metrics = metrics
+        self.stage = stage
+        self.tags = tags
+
+    def __enter__( self ):
+        self.start = time.time()
+        return self
+
+    def __exit__( self, type, value, traceback ):
+        if type is not None:
+            self.tags['error'] = True
+        self.metrics.record( self.stage, time.time()-self.start, **self.tags )
+
+class _Context(object):
+    '''
+    applies tags to every measurement made by this thread within the block it manages
+    '''
+
+    def __init__( self, metrics, tags ):
+        self.metrics = metrics
+        self.tags = tags
+
+    def __enter__( self ):
+        stack = self.metrics._stack()
+        stack.append( dict(stack[-1], **self.tags) if stack else self.tags )
+        return self
+
+    def __exit__( self, *args ):
+        self.metrics._stack().pop()
+
+#-------------------------------------------------
+
+class Metrics(object):
+    '''
+    collects timing measurements for each stage
+        jsonl : every measurement is appended to this file as a JSON object on its own line
+        textfile : the number, total and maximum duration of measurements for each (stage, flag, source) are written here by flush
+    if neither is supplied, nothing is recorded
+    '''
+
+    def __init__( self, jsonl=None, textfile=None, prefix='seglogic' ):
+        self.jsonl = jsonl
+        self.textfile = textfile
+        self.prefix = prefix
+        self.enabled = bool(jsonl or textfile)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._summary = {} ### tuple of PROMETHEUS_TAGS -> [count, sum, max]
+        self._file_obj = open(jsonl, 'a', 1) if jsonl else None ### line buffered and opened for appending, so concurrent processes can share the log
+
+    def _stack( self ):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    #---
+
+    def context( self, **tags ):
+        return _Context( self, tags )
+
+    def tags( self ):
+        '''
+        the tags currently applied by this thread, e.g. to apply them within another thread working on its behalf
+        '''
+        stack = self._stack()
+        return dict(stack[-1]) if stack else {}
+
+    def timer( self, stage, **tags ):
+        return _Timer( self, stage, tags )
+
+    def record( self, stage, seconds, **tags ):
+        '''
+        record that stage took seconds
+        '''
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if stack:
+            tags = dict(stack[-1], **tags)
+        tags['stage'] = stage
+
+        key = tuple(str(tags.get(tag, '')) for tag in PROMETHEUS_TAGS)
+        with self._lock:
+            summary = self._summary.setdefault( key, [0, 0.0, 0.0] )
+            summary[0] += 1
+            summary[1] += seconds
+            summary[2] = max(summary[2], seconds)
+
+            if self._file_obj is not None:
+                tags.update( {'time':time.time(), 'seconds':seconds, 'pid':os.getpid()} )
+                self._file_obj.write( json.dumps(tags, sort_keys=True)+"\n" )
+
+    #---
+
+    def prometheus( self ):
+        '''
+        format the summary of every measurement so far in the Prometheus text exposition format
+        '''
+        name = "%s_stage_seconds"%self.prefix
+        lines = [
+            "# HELP %s time spent in each stage of processing an event"%name,
+            "# TYPE %s summary"%name,
+        ]
+        maxlines = [
+            "# HELP %s_max the longest time spent in each stage of processing an event"%name,
+            "# TYPE %s_max gauge"%name,
+        ]
+        with self._lock:
+            summary = sorted(self._summary.items())
+        for key, (count, total, longest) in summary:
+            labels = ",".join('%s="%s"'%(tag, value.replace('\\', '\\\\').replace('"', '\\"')) for tag, value in zip(PROMETHEUS_TAGS, key) if value)
+            lines.append( "%s_count{%s} %d"%(name, labels, count) )
+            lines.append( "%s_sum{%s} %.6f"%(name, labels, total) )
+            maxlines.append( "%s_max{%s} %.6f"%(name, labels, longest) )
+        return "\n".join(lines+maxlines)+"\n"
+
+    def flush( self ):
+        '''
+        (atomically) rewrite the Prometheus textfile
+        '''
+        if not self.textfile:
+            return
+        directory = os.path.dirname(os.path.abspath(self.textfile))
+        fd, tmp = tempfile.mkstemp( dir=directory, suffix='.tmp' )
+        try:
+            file_obj = os.fdopen( fd, 'w' )
+            file_obj.write( self.prometheus() )
+            file_obj.close()
+            os.chmod( tmp, 0o644 ) ### mkstemp only lets us read it, but the collector runs as someone else
+            os.rename( tmp, self.textfile )
+        except:
+            if os.path.exists(tmp):
+                os.unlink( tmp )
+            raise
+
+    def close( self ):
+        self.flush()
+        if self._file_obj is not None:
+            self._file_obj.close()
+            self._file_obj = None
+        self.enabled = False
+
+#-------------------------------------------------
+
+class TimedGraceDb(object):
+    '''
+    wraps a GraceDb client so that event, writeLog and writeLabel are timed
+    wrap the client itself (rather than a segDb2grcDb.upload.Uploader) to time the actual requests
+    '''
+
+    def __init__( self, gracedb ):
+        self.gracedb = gracedb
+
+    def event( self, graceid ):
+        with timer( 'event', graceid=graceid ):
+            return self.gracedb.event( graceid )
+
+    def writeLog( self, graceid, message, filename=None, filecontents=None, tagname=[] ):
+        with timer( 'writeLog', graceid=graceid, attachment=filename is not None ):
+            if filecontents is None: ### the client reads filename itself
+                return self.gracedb.writeLog( graceid, message=message, filename=filename, tagname=tagname )
+            return self.gracedb.writeLog( graceid, message=message, filename=filename, filecontents=filecontents, tagname=tagname )
+
+    def writeLabel( self, graceid, label ):
+        with timer( 'writeLabel', graceid=graceid, label=label ):
+            return self.gracedb.writeLabel( graceid, label )
+
+    def __getattr__( self, name ): ### everything else goes straight to the client
+        return getattr(self.gracedb, name)
+
+#-------------------------------------------------
+
+### shared by everything within a process, and records nothing until configure is called
+_metrics = Metrics()
+
+def configure( jsonl=None, textfile=None ):
+    '''
+    start recording measurements to jsonl and/or textfile
+    '''
+    global _metrics
+    _metrics.close()
+    _metrics = Metrics( jsonl=jsonl, textfile=textfile )
+    return _metrics
+
+def getMetrics():
+    return _metrics
+
+def context( **tags ):
+    return _metrics.context( **tags )
+
+def tags():
+    return _metrics.tags()
+
+def timer( stage, **tags ):
+    return _metrics.timer( stage, **tags )
+
+def record( stage, seconds, **tags ):
+    _metrics.record( stage, seconds, **tags )
+
+def flush():
+    _metrics.flush()
+
+def close():
+    _metrics.close()
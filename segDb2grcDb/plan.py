@@ -0,0 +1,176 @@
+'''
+planning for seglogic.py queries
+groups compatible flags together so they can be retrieved with a single query
+and compiles the config into a QueryPlan, which is only rebuilt when the config file changes
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import threading
+
+from collections import defaultdict
+
+from segDb2grcDb.expressions import Expression
+
+try:
+    from ConfigParser import SafeConfigParser
+except ImportError:
+    from configparser import ConfigParser as SafeConfigParser
+
+#-------------------------------------------------
+
+def flagSource( config, flag ):
+    '''
+    the data source for this flag: the dmt directory if specified, otherwise None (meaning SegDb)
+    '''
+    if config.has_option(flag, 'dmt'):
+        return config.get(flag, 'dmt')
+    return None
+
+def gracedbUrl( config ):
+    '''
+    the GraceDb url from the general section, or None if we should use the client's default
+    the shipped configs spell it gracedb-url, but seglogic.py used to read gracedb_url, so we accept both
+    '''
+    for option in ['gracedb-url', 'gracedb_url']:
+        if config.has_option('general', option):
+            return config.get('general', option)
+    return None
+
+#-------------------------------------------------
+
+class SectionPlan(object):
+    '''
+    the options for a single flag, veto definer, expression or allActive section, converted to the right types once
+    expressions do not have a window of their own, so look_left, look_right and wait are None for them
+    '''
+
+    def __init__( self, config, section ):
+        self.name = section
+
+        get = lambda option, default: config.get(section, option) if config.has_option(section, option) else default
+        getboolean = lambda option, default: config.getboolean(section, option) if config.has_option(section, option) else default
+        getfloat = lambda option, default: config.getfloat(section, option) if config.has_option(section, option) else default
+
+        self.look_left = getfloat('look_left', None)
+        self.look_right = getfloat('look_right', None)
+        self.wait = getfloat('wait', None)
+        self.dmt = flagSource( config, section )
+
+        self.extra_tags = get('extra_tags', '').split()
+        self.extra_queryTags = get('extra_queryTags', '').split()
+
+        ### labels applied depending on what we find
+        self.activeLabels = get('activeLabels', '').split()
+        self.inactiveLabels = get('inactiveLabels', '').split()
+        self.flaggedLabels = get('flaggedLabels', '').split()
+        self.unflaggedLabels = get('unflaggedLabels', '').split()
+
+        ### flags and expressions : how far around the event we also report active time (None means we do not)
+        self.vicinity = getfloat('vicinity', None)
+
+        ### veto definers
+        self.path = get('path', None)
+        self.cumulative = getboolean('cumulative', False)
+
+        ### allActive
+        self.include = get('flags', '').split()
+        self.humanReadable = getboolean('humanReadable', False)
+        self.max_workers = int(getfloat('max-workers', 8))
+        self.catalogue_ttl = getfloat('catalogue-ttl', 3600)
+
+    def key( self ):
+        '''
+        flags can share a query if they come from the same IFO and source and have the same window and wait
+        '''
+        return (self.name.split(":")[0], self.dmt, self.look_left, self.look_right, self.wait)
+
+    def groupName( self ):
+        '''
+        a human (and filesystem) friendly name for the group of flags this section is queried with
+        '''
+        ifo, source, look_left, look_right, wait = self.key()
+        return "%s-%s-%d-%d-%d"%(ifo, "DMT" if source else "SEGDB", look_left, look_right, wait)
+
+    def window( self, gpstime ):
+        '''
+        the end of this section's query window around gpstime and the deadline after which its data should be available
+        '''
+        end = gpstime + self.look_right
+        if end%1: ### the same rounding as segDb2grcDb.query.queryWindow
+            end = int(end) + 1
+        else:
+            end = int(end)
+        return end, end + self.wait
+
+class QueryPlan(object):
+    '''
+    everything seglogic.py needs to schedule queries for an event, parsed from config once
+    config is kept so the code that performs (and reports) each query can look up anything else it needs
+    batch_queries overrides the option of the same name in config (e.g. seglogic-backfill always batches)
+    '''
+
+    def __init__( self, config, batch_queries=None ):
+        self.config = config
+
+        get = lambda option, default: config.get('general', option) if config.has_option('general', option) else default
+        getboolean = lambda option, default: config.getboolean('general', option) if config.has_option('general', option) else default
+        getfloat = lambda option, default: config.getfloat('general', option) if config.has_option('general', option) else default
+
+        self.tags = get('tags', '').split()
+        self.queryTags = get('queryTags', '').split()
+        self.flags = get('flags', '').split()
+        self.vetoDefiners = get('vetoDefiners', '').split()
+        self.expressions = dict((name, Expression( config.get(name, 'expression'), self.flags )) for name in get('expressions', '').split())
+        self.allActive = getboolean('allActive', False)
+
+        self.max_workers = int(getfloat('max-workers', 1))
+        self.batch_queries = getboolean('batch-queries', False) if batch_queries is None else batch_queries
+        self.native_dmt = getboolean('native-dmt', False)
+        self.poll_interval = getfloat('poll-interval', 0)
+        self.query_poll_interval = getfloat('query-poll-interval', 0)
+
+        ### per-source timeouts (0 means no timeout) and the budget after which we hedge queries for DMT flags with SegDb (None means we never hedge)
+        self.timeouts = {'dmt':getfloat('dmt-timeout', 0), 'segdb':getfloat('segdb-timeout', 0)}
+        self.hedge_budget = getfloat('hedge-budget', None)
+
+        self.sections = {}
+        for section in self.flags + self.vetoDefiners + sorted(self.expressions.keys()) + (['allActive'] if self.allActive else []):
+            self.sections[section] = SectionPlan( config, section )
+
+        ### group compatible flags so that each group is retrieved with a single query
+        if self.batch_queries:
+            groups = defaultdict( list )
+            for flag in self.flags:
+                groups[self.sections[flag].key()].append( flag )
+            self.groups = sorted(groups.items(), key=lambda x: (x[0][0], x[0][1] or '', x[0][2:]))
+        else:
+            self.groups = [(self.sections[flag].key(), [flag]) for flag in self.flags]
+
+#------------------------
+
+### compiled plans, keyed by the path to the config file
+_plans = {}
+_plans_lock = threading.Lock()
+
+def loadPlan( path ):
+    '''
+    return the QueryPlan for the config file at path
+    plans are shared within a process and only recompiled when the file's mtime (or size) changes, so a long-lived process (e.g. seglogic.py --daemon) picks up changes to the config without re-parsing it for every event
+    '''
+    path = os.path.abspath( path )
+    stat = os.stat( path )
+    version = (stat.st_mtime, stat.st_size)
+    with _plans_lock:
+        if (path in _plans) and (_plans[path][0]==version):
+            return _plans[path][1]
+
+    config = SafeConfigParser()
+    config.read( path )
+    plan = QueryPlan( config )
+
+    with _plans_lock:
+        _plans[path] = (version, plan)
+    return plan
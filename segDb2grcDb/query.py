@@ -0,0 +1,348 @@
+'''
+launching (and reading the results of) queries for segments
+these are shared by seglogic.py and seglogic-backfill
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import glob
+import time
+import threading
+
+import subprocess as sp
+
+import numpy as np
+
+from segDb2grcDb import segxml
+from segDb2grcDb import segments
+from segDb2grcDb import metrics
+from segDb2grcDb import archive
+from segDb2grcDb.segtables import SegmentTables
+from segDb2grcDb import dmt as dmtutils
+
+#-------------------------------------------------
+
+def flag2filename( flag, start, dur, output_dir="." ):
+    flag = flag.split(":")
+    flag = "%s-%s"%(flag[0], "_".join(f.replace("-","_") for f in flag[1:]))
+    return "%s/%s-%d-%d.xml.gz"%(output_dir, flag, start, dur)
+
+def segDBcmd( url, flag, start, end, outfilename, dmt=False ):
+    ### ligolw_segment_query_dqsegdb -t https://segments.ligo.org -q -a H1:DMT-ANALYSIS_READY:1 -s 1130950800 -e 1131559200
+    if dmt:
+        return "ligolw_segment_query --dmt-files -q -a %s -s %d -e %d -o %s"%(flag, start, end, outfilename)
+    else:
+        return "ligolw_segment_query_dqsegdb -t %s -q -a %s -s %d -e %d -o %s"%(url, flag, start, end, outfilename)
+
+#-----------
+
+def segDBvetoDefcmd( url, vetoDef, start, end, output_dir=".", dmt=False ):
+    ### ligolw_segments_from_cats_dqsegdb
+    if dmt:
+        return "ligolw_segments_from_cats_dqsegdb --dmt-file -v %s -s %d -e %d -i -p -o %s"%(vetoDef, start, end, output_dir)
+    else:
+        return "ligolw_segments_from_cats_dqsegdb -t %s -v %s -s %d -e %d -i -p -o %s"%(url, vetoDef, start, end, output_dir)
+
+#-----------
+
+def allActivefilename( start, dur, output_dir="."):
+    return "%s/allActive-%d-%d.json"%(output_dir, start, dur)
+
+#-----------
+
+def queryWindow( gpstime, look_left, look_right ):
+    '''
+    compute the (integer) bounds for a query around gpstime
+    returns start, end, dur
+    '''
+    start = int(gpstime-look_left)
+    end = gpstime+look_right
+    if end%1:
+        end = int(end) + 1
+    else:
+        end = int(end)
+    return start, end, end-start
+
+def mergeWindows( windows, gap=0, max_span=None ):
+    '''
+    merge (start, end) windows into spans so that every window is contained within a single span
+    windows separated by no more than gap seconds are merged, but spans are not allowed to grow beyond max_span seconds (unless a single window is longer)
+    returns a list of (start, end) sorted by start
+    '''
+    spans = []
+    for start, end in sorted(windows):
+        if spans and (start - spans[-1][1] <= gap) and ((max_span is None) or (max(end, spans[-1][1]) - spans[-1][0] <= max_span)):
+            spans[-1][1] = max(end, spans[-1][1])
+        else:
+            spans.append( [start, end] )
+    return [tuple(span) for span in spans]
+
+def runQuery( cmd, dmt=None, timeout=None, cancel=None ):
+    '''
+    launch the query as a subprocess and block until it finishes
+    dmt is passed to the subprocess as ONLINEDQ rather than modifying our own environment, which is shared between concurrent queries
+    the subprocess is killed if it runs longer than timeout seconds or once cancel (a threading.Event) is set, in which case returncode is non-zero and the reason is appended to stderr
+    returns returncode, stdout, stderr
+    '''
+    env = None
+    if dmt:
+        env = dict(os.environ)
+        env['ONLINEDQ'] = dmt
+    with metrics.timer( 'query' ):
+        proc = sp.Popen( cmd.split(), stdout=sp.PIPE, stderr=sp.PIPE, env=env )
+
+        killed = []
+        if timeout or (cancel is not None):
+            def watch():
+                ### communicate does not support a timeout in python2, so we watch the process from another thread
+                t0 = time.time()
+                while proc.poll() is None:
+                    if timeout and (time.time()-t0 > timeout):
+                        killed.append( "timed out after %.1f sec"%timeout )
+                    elif (cancel is not None) and cancel.is_set():
+                        killed.append( "cancelled" )
+                    else:
+                        time.sleep( 0.05 )
+                        continue
+                    try:
+                        proc.kill()
+                    except OSError: ### it finished in the meantime
+                        pass
+                    return
+            watcher = threading.Thread( target=watch )
+            watcher.daemon = True
+            watcher.start()
+
+        output = proc.communicate()
+
+    returncode, stderr = proc.returncode, output[1]
+    if killed:
+        returncode = returncode or -1
+        stderr = "%s\n%s : %s"%(stderr, cmd.split()[0], killed[0])
+    return returncode, output[0], stderr
+
+#-----------
+
+#-------------------------------------------------
+
+class QueryError(Exception):
+    '''
+    raised when a query for segments fails
+    '''
+    pass
+
+def loadSegmentTables( filename ):
+    '''
+    stream the segment tables from a LIGO_LW file (or an in-memory segDb2grcDb.archive.Attachment) into a SegmentTables object
+    '''
+    with metrics.timer( 'parse' ):
+        return SegmentTables.fromColumns( segxml.readColumns( filename ) )
+
+def makedirs( path ):
+    '''
+    make path if it does not already exist
+    '''
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError: ### another process may have created it in the meantime
+            if not os.path.exists(path):
+                raise
+
+def recordSegments( outfilename, results, comment="" ):
+    '''
+    record segments (see segDb2grcDb.segxml.segments2xml) that belong in outfilename
+    returns outfilename, or an in-memory Attachment if results are kept in memory (see segDb2grcDb.archive)
+    '''
+    return archive.record( outfilename, archive.encode( outfilename, segxml.segments2xml( results, comment=comment ) ) )
+
+#------------------------
+
+def queryFlag( flag, start, end, segdb_url, output_dir, dmt=None, timeout=None, cancel=None, verbose=False ):
+    '''
+    query for a single flag within [start, end] (GPS seconds) with ligolw_segment_query(_dqsegdb)
+    timeout and cancel are passed to runQuery
+    returns outfilename, results where results maps flag to (known, active) segments in nanoseconds
+        outfilename is an in-memory Attachment if results are kept in memory (see segDb2grcDb.archive)
+    raises QueryError if the query fails
+    '''
+    ### actually perform the query
+    outfilename = flag2filename( flag, start, end-start, output_dir)
+    scratch = archive.scratchDir( output_dir )
+    try:
+        target = os.path.join(scratch, os.path.basename(outfilename)) if archive.inMemory() else outfilename
+        cmd = segDBcmd( segdb_url, flag, start, end, target, dmt=dmt )
+        if verbose:
+            print "        %s : %s"%(flag, cmd)
+        returncode, _, stderr = runQuery( cmd, dmt=dmt, timeout=timeout, cancel=cancel )
+
+        ### check returncode for errors
+        if returncode:
+            raise QueryError( stderr )
+
+        outfilename = archive.load( target, outfilename )
+    finally:
+        archive.cleanup( scratch )
+
+    ### get segdef_id
+    tables = loadSegmentTables( outfilename )
+#    i = tables.index( flag.split(":")[1] )
+    i = tables.index( 'RESULT' )
+
+    return outfilename, {flag:(tables.segments( i, summary=True ), tables.segments( i ))}
+
+def queryFlagGroup( name, flags, start, end, segdb_url, output_dir, dmt=None, timeout=None, cancel=None, verbose=False ):
+    '''
+    query for several flags at once within [start, end] (GPS seconds)
+    we do this by writing a veto definer containing all the flags (under output_dir/name) and requesting individual results from ligolw_segments_from_cats_dqsegdb
+    timeout and cancel are passed to runQuery
+    returns outfilename, results where results maps each flag we found to (known, active) segments in nanoseconds
+        outfilename is an in-memory Attachment if results are kept in memory (see segDb2grcDb.archive)
+    raises QueryError if the query fails
+    '''
+    ### set up output dir and the veto definer describing this group
+    this_output_dir = "%s/%s"%(output_dir, name)
+    if not archive.inMemory():
+        makedirs( this_output_dir )
+    scratch = archive.scratchDir( this_output_dir )
+    try:
+        dur = end - start
+        vetoDef = "%s/VETO_DEFINER-%d-%d.xml"%(scratch, start, dur)
+        segxml.writeVetoDefiner( vetoDef, [segxml.flag2vetoDefRow(flag, comment=name) for flag in flags] )
+
+        ### actually perform the query
+        cmd = segDBvetoDefcmd( segdb_url, vetoDef, start, end, output_dir=scratch, dmt=dmt )
+        if verbose:
+            print "        %s : %s"%(name, cmd)
+        returncode, _, stderr = runQuery( cmd, dmt=dmt, timeout=timeout, cancel=cancel )
+
+        outfilenames = glob.glob("%s/*-VETOTIME_CAT1-%d-%d.xml"%(scratch, start, dur))
+
+        ### check returncode for errors
+        if returncode or (not outfilenames):
+            raise QueryError( stderr )
+
+        outfilename = archive.load( outfilenames[0], os.path.join(this_output_dir, os.path.basename(outfilenames[0])) )
+    finally:
+        archive.cleanup( scratch )
+
+    ### split the results into segments for each flag
+    tables = loadSegmentTables( outfilename )
+    results = {}
+    for i, (known, active) in enumerate(tables.split()):
+        flag = tables.flag( i )
+        if flag in flags:
+            results[flag] = (known, active)
+
+    return outfilename, results
+
+def queryDMTFlags( name, flags, start, end, dmt, output_dir, verbose=False ):
+    '''
+    read segments for flags within [start, end] (GPS seconds) directly from the DMT files under dmt (see segDb2grcDb.dmt)
+    the results are recorded in output_dir in the same format as the other queries (or kept in memory, see segDb2grcDb.archive)
+    returns outfilename, results where results maps each flag to (known, active) segments in nanoseconds
+    raises QueryError if the files cannot be read
+    '''
+    ### actually perform the query
+    if verbose:
+        print "        %s : reading DMT files from %s"%(name, dmt)
+    try:
+        with metrics.timer( 'read' ):
+            results = dmtutils.getIndex( dmt ).query( flags, start, end )
+    except (IOError, OSError) as e:
+        raise QueryError( str(e) )
+
+    ### record what we found in the same format as the other queries
+    if len(flags)==1:
+        outfilename = flag2filename( flags[0], start, end-start, output_dir )
+    else:
+        outfilename = "%s/%s-%d-%d.xml.gz"%(output_dir, name, start, end-start)
+    outfilename = recordSegments( outfilename, [(flag,)+results[flag] for flag in flags], comment=dmt )
+
+    return outfilename, results
+
+#-------------------------------------------------
+
+def allKnown( results, flags, dur ):
+    '''
+    whether the entire query window (dur seconds) is known for every flag in results (flag -> (known, active) segments in nanoseconds)
+    flags that are missing from results are not known at all
+    '''
+    return all((flag in results) and (segments.duration( results[flag][0] ) >= segments.gps2ns( dur )) for flag in flags)
+
+def fetchSegments( fetch, flags, start, end, cache=None, source=None, verbose=False ):
+    '''
+    retrieve known and active segments for flags within [start, end] (GPS seconds)
+    fetch(start, end) performs the query and returns (outfilename, results), where results maps flags to (known, active) segments in nanoseconds
+    fetch may also return (outfilename, results, source) if the answer did not come from source (e.g. a segDb2grcDb.hedge.Hedge answered by its secondary), in which case the results are cached under the source that answered
+
+    if cache is supplied, we only query for the part of the window that is not already known within the cache and store whatever we find
+    if the cache also has leases (see segDb2grcDb.cache.Leases) and another process is already querying an overlapping window for any of these flags, we wait for it to finish and use its results from the cache rather than issuing a duplicate query
+    returns outfilename, results, origin where origin is one of "query", "cache", "cache+query", "shared" or "shared+query" (shared meaning another process' query answered some of the window) and outfilename is None unless we ran a query
+    '''
+    if cache is None:
+        outfilename, results = fetch( start, end )[:2]
+        return outfilename, results, "query"
+
+    start_ns = segments.gps2ns( start )
+    end_ns = segments.gps2ns( end )
+    window = segments.asarray( [[start_ns, end_ns]] )
+
+    t0 = time.time()
+    shared = False
+    lease = None
+    while True:
+        with metrics.timer( 'cache' ):
+            cached = cache.lookup( source, flags, start_ns, end_ns )
+        missing = segments.coalesce( np.concatenate([segments.difference( window, cached[flag][0] ) for flag in flags]) )
+        if not len(missing): ### everything is already known
+            return None, cached, "shared" if shared else "cache"
+
+        ### only query for the span of time that is missing
+        qstart = int(missing[0,0]//segments.NS)
+        qend = int(-(-missing[-1,1]//segments.NS)) ### round up
+        if cache.leases is None:
+            break
+
+        ### make sure nobody else is already querying for it
+        lease, busy = cache.leases.claim( source, flags, qstart, qend )
+        if lease is not None:
+            break
+        timeout = None if cache.leases.max_wait is None else cache.leases.max_wait - (time.time()-t0)
+        if (timeout is not None) and (timeout <= 0): ### we've waited long enough, so we query for it ourselves
+            if verbose:
+                print "        giving up on the queries already in flight for %s within [%d, %d]"%(", ".join(sorted(set(info['flag'] for _, info in busy))), qstart, qend)
+            break
+        if verbose:
+            print "        waiting for the queries already in flight for %s within [%d, %d]"%(", ".join(sorted(set(info['flag'] for _, info in busy))), qstart, qend)
+        with metrics.timer( 'coalesce' ):
+            cache.leases.wait( busy, timeout=timeout )
+        shared = True ### look again, which picks up whatever they found
+
+    if verbose:
+        print "        querying [%d, %d] for the part of [%d, %d] that is not already cached"%(qstart, qend, start, end)
+    try:
+        answer = fetch( qstart, qend )
+        outfilename, new = answer[:2]
+        cache.store( answer[2] if len(answer) > 2 else source, new )
+    finally:
+        if lease is not None: ### anyone waiting on us will now find our results in the cache (or query for themselves if we failed)
+            lease.release()
+
+    ### merge what we already had with what we just found
+    results = dict((flag, segs) for flag, segs in cached.items() if len(segs[0]))
+    if results:
+        origin = "shared+query" if shared else "cache+query"
+    else:
+        origin = "query"
+    for flag, (known, active) in new.items():
+        known = segments.clip( known, start_ns, end_ns )
+        active = segments.clip( active, start_ns, end_ns )
+        if flag in results:
+            old_known, old_active = results[flag]
+            known, active = segments.union( old_known, known ), segments.union( segments.difference( old_active, known ), active )
+        results[flag] = (known, active)
+
+    return outfilename, results, origin
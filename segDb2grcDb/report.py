@@ -0,0 +1,137 @@
+'''
+formatting and posting summaries of query results to GraceDb
+these are shared by seglogic.py and seglogic-backfill
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import numpy as np
+
+from segDb2grcDb import segments
+from segDb2grcDb import metrics
+from segDb2grcDb.archive import Attachment
+
+#-------------------------------------------------
+
+def writeLog( gdb, graceid, message, filename=None, tagname=[] ):
+    '''
+    delegates to gdb.writeLog but incorporates a common tagname for all uploads
+    filename may also be an in-memory segDb2grcDb.archive.Attachment, which is uploaded straight from memory
+    '''
+    if isinstance(filename, Attachment):
+        gdb.writeLog( graceid, message=message, filename=filename.name, filecontents=filename.contents, tagname=['segDb2grcDb']+tagname )
+    else:
+        gdb.writeLog( graceid, message=message, filename=filename, tagname=['segDb2grcDb']+tagname )
+
+def writeLabel( gdb, graceid, labels ):
+    '''
+    delegates to gdb.writeLabel but is smart about handling cases where label was already applied
+    (turns out GraceDb is very friendly and doesn't raise an error if a label is already present)
+    when gdb is a segDb2grcDb.upload.Uploader, labels that were already applied during this run are not sent again
+    '''
+    for label in labels:
+        gdb.writeLabel( graceid, label ) ### GraceDb doesn't raise an error if label is already present, it only warns us
+
+#-------------------------------------------------
+
+def summarize( section, index, gps_ns, start_ns=None, end_ns=None ):
+    '''
+    the numbers we report for a flag (see reportFlag) from its segments.SegmentIndex, for a single event or for many events at once (gps_ns, start_ns and end_ns may be arrays)
+    section is the flag's segDb2grcDb.plan.SectionPlan
+    returns defd, actv, flagged, near
+        defd and actv are the known and active time (sec) within [start_ns, end_ns], or all of the time in index if these are not supplied
+        flagged is whether the event is within an active segment
+        near is (vicinity, active time within +/-vicinity of the event, distance to the nearest edge of an active segment or -1 if there are none) in seconds if the flag's section sets vicinity, and None otherwise
+    '''
+    if start_ns is None:
+        defd = segments.ns2gps( index.known.duration() )
+        actv = segments.ns2gps( index.active.duration() )
+    else:
+        defd = segments.ns2gps( index.known.within( start_ns, end_ns ) )
+        actv = segments.ns2gps( index.active.within( start_ns, end_ns ) )
+    flagged = index.isActive( gps_ns )
+
+    near = None
+    if section.vicinity is not None:
+        vicinity = section.vicinity
+        edge = index.active.nearestEdge( gps_ns )
+        near = (vicinity, segments.ns2gps( index.active.around( gps_ns, segments.gps2ns( vicinity ) ) ), np.where( edge >= 0, segments.ns2gps( edge ), -1 ))
+    return defd, actv, flagged, near
+
+def reportFlag( gracedb, graceid, section, defd, actv, flagged, dur, near=None, tags=[], verbose=False ):
+    '''
+    format the summary statement for a single flag, post it and apply the labels from its segDb2grcDb.plan.SectionPlan
+    near is (vicinity, active time within +/-vicinity of the event, distance to the nearest edge of an active segment) in seconds (see summarize), which is also reported if supplied
+    '''
+    ### set up labels
+    actvLabels = section.activeLabels
+    inactvLabels = section.inactiveLabels
+    flagLabels = section.flaggedLabels
+    unflagLabels = section.unflaggedLabels
+
+    ### write message
+    message = "%s"%section.name
+    message += "<br>&nbsp;&nbsp;known : %.3f/%d=%.3f%s"%(defd, dur, defd/dur * 100, "%")
+
+    labels = [] ### labels to be applied
+    message += "<br>&nbsp;&nbsp;active : %.3f/%d=%.3f%s"%(actv, dur, actv/dur * 100, "%")
+    if actv:
+        if actvLabels:
+            message += " <strong>Will label as : %s.</strong>"%(", ".join(actvLabels))
+            labels += actvLabels
+    else:
+        if inactvLabels:
+            message += " <strong>Will label as : %s.</strong>"%(", ".join(inactvLabels))
+            labels += inactvLabels
+
+    if flagged:
+        message += "<br>&nbsp;&nbsp;<strong>candidate is within these segments!</strong>"
+        if flagLabels:
+            message += " <strong>Will label as : %s.</strong>"%(", ".join(flagLabels))
+            labels += flagLabels
+
+    else:
+        message += "<br>&nbsp;&nbsp;<strong>candidate is not within these segments!</strong>"
+        if unflagLabels:
+            message += " <strong>Will label as : %s.</strong>"%(", ".join(unflagLabels))
+            labels += unflagLabels
+
+    if near is not None:
+        vicinity, around, edge = near
+        message += "<br>&nbsp;&nbsp;active within &plusmn;%.1f sec of the candidate : %.3f sec"%(vicinity, around)
+        if edge >= 0:
+            message += "<br>&nbsp;&nbsp;nearest edge of an active segment : %.3f sec from the candidate"%edge
+
+    ### post message
+    if verbose:
+        print "        %s"%message
+    writeLog( gracedb, graceid, message, tagname=tags )
+
+    ### apply labels
+    writeLabel( gracedb, graceid, set(labels) )
+
+def reportResults( gracedb, graceid, gpstime, sections, flags, results, dur, summaries={}, g_tags=[], qtags=[], verbose=False ):
+    '''
+    report results (flag -> (known, active) segments in nanoseconds) for each flag separately
+    sections maps each flag to its segDb2grcDb.plan.SectionPlan (see segDb2grcDb.plan.QueryPlan.sections)
+    flags that are missing from results are reported as such
+    summaries may supply what summarize returns for some flags, e.g. when it has already been computed for many events at once
+    '''
+    gps_ns = segments.gps2ns( gpstime )
+    for flag in flags:
+        section = sections[flag]
+        tags = g_tags + section.extra_tags
+        if flag not in results:
+            message = "%s<br>&nbsp;&nbsp;<strong>WARNING</strong>: could not find this flag in the query results!"%flag
+            if verbose:
+                print "        %s"%message
+            writeLog( gracedb, graceid, message=message, tagname=qtags )
+            continue
+
+        if flag in summaries:
+            defd, actv, flagged, near = summaries[flag]
+        else:
+            with metrics.timer( 'summary', flag=flag ):
+                defd, actv, flagged, near = summarize( section, segments.SegmentIndex( *results[flag] ), gps_ns )
+        reportFlag( gracedb, graceid, section, defd, actv, flagged, dur, near=near, tags=tags, verbose=verbose )
@@ -0,0 +1,128 @@
+'''
+a small deadline-driven scheduler used to launch queries as soon as their data should be available
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import sys
+import time
+import heapq
+import threading
+import traceback
+
+#-------------------------------------------------
+
+class DeadlineScheduler(object):
+    '''
+    runs jobs in a pool of worker threads, launching each job only once its deadline has passed
+    jobs are launched in order of their deadlines and at most max_workers run at the same time
+
+    deadlines are measured with clock, which should return the current time in the same units as the deadlines (e.g. GPS seconds)
+    '''
+
+    def __init__( self, max_workers=1, clock=time.time ):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self.clock = clock
+
+        self._heap = []
+        self._counter = 0 ### breaks ties between jobs with the same deadline so we never compare functions
+        self._pending = 0 ### number of jobs that have been submitted but have not finished
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.errors = [] ### (name, exc_info) for every job that raised
+
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread( target=self._work, name="seglogic-worker-%d"%i )
+            worker.daemon = True
+            worker.start()
+            self._workers.append( worker )
+
+    def submit( self, deadline, func, *args, **kwargs ):
+        '''
+        schedule func(*args, **kwargs) to run once clock() >= deadline
+        '''
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("cannot submit jobs to a scheduler that has been joined")
+            self._push( deadline, func, args, kwargs )
+
+    def _push( self, deadline, func, args, kwargs ):
+        '''
+        add a job to the heap, must be called while holding self._cond
+        '''
+        heapq.heappush( self._heap, (deadline, self._counter, func, args, kwargs) )
+        self._counter += 1
+        self._pending += 1
+        self._cond.notify_all()
+
+    def poll( self, start, stop, interval, func, *args, **kwargs ):
+        '''
+        schedule func(*args, **kwargs) to run once clock() >= start and then again every interval until it returns something other than False
+        func is not rescheduled after stop, so it should do whatever it must (e.g. give up gracefully) once stop passes
+        '''
+        self.submit( min(start, stop), self._poll, stop, interval, func, args, kwargs )
+
+    def _poll( self, stop, interval, func, args, kwargs ):
+        if func( *args, **kwargs ) is not False:
+            return
+        now = self.clock()
+        if now >= stop:
+            return
+        with self._cond: ### jobs may reschedule themselves even after join has been called
+            self._push( min(now+interval, stop), self._poll, (stop, interval, func, args, kwargs), {} )
+
+    def __len__( self ):
+        with self._cond:
+            return self._pending
+
+    def _next( self ):
+        '''
+        block until a job is ready to launch and return it, or return None if there is nothing left to do
+        '''
+        with self._cond:
+            while True:
+                if self._heap:
+                    wait = self._heap[0][0] - self.clock()
+                    if wait <= 0:
+                        return heapq.heappop( self._heap )
+                    self._cond.wait( wait )
+                elif self._closed and not self._pending: ### running jobs may still reschedule themselves
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _work( self ):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+
+            deadline, _, func, args, kwargs = job
+            try:
+                func( *args, **kwargs )
+            except Exception:
+                exc_info = sys.exc_info()
+                if func == self._poll: ### report the function we are polling
+                    func = args[2]
+                self.errors.append( (getattr(func, '__name__', repr(func)), exc_info) )
+                traceback.print_exception( *exc_info )
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify_all()
+
+    def join( self ):
+        '''
+        block until every submitted job has finished, after which no more jobs can be submitted
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            while worker.is_alive():
+                worker.join( 1.0 ) ### join with a timeout so we remain responsive to KeyboardInterrupt
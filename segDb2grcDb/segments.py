@@ -0,0 +1,244 @@
+'''
+segment lists stored as numpy arrays
+each list is an (N,2) array of int64 [start, end] times measured in integer nanoseconds so that *_time_ns columns are handled exactly
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import numpy as np
+
+#-------------------------------------------------
+
+NS = 1000000000 ### nanoseconds per second
+
+#-------------------------------------------------
+
+def gps2ns( sec, ns=0 ):
+    '''
+    convert (integer seconds, integer nanoseconds) into integer nanoseconds
+    sec may also be a float, in which case it is rounded to the nearest nanosecond
+    '''
+    if isinstance(sec, float):
+        return int(round(sec*NS)) + int(ns)
+    return int(sec)*NS + int(ns)
+
+def ns2gps( ns ):
+    '''
+    convert integer nanoseconds into (float) seconds
+    '''
+    return ns/float(NS) if np.ndim(ns)==0 else np.asarray(ns)/float(NS)
+
+def empty():
+    return np.empty((0,2), dtype=np.int64)
+
+def asarray( segs ):
+    '''
+    convert a list of [start, end] pairs (in nanoseconds) into an (N,2) int64 array
+    '''
+    if not len(segs):
+        return empty()
+    return np.asarray(segs, dtype=np.int64).reshape((-1,2))
+
+#-------------------------------------------------
+
+def coalesce( segs ):
+    '''
+    sort segments and merge any that overlap or touch
+    '''
+    segs = asarray( segs )
+    segs = segs[segs[:,1] > segs[:,0]] ### drop empty segments
+    if len(segs) < 2:
+        return segs
+    segs = segs[np.argsort(segs[:,0], kind='mergesort')]
+
+    ### a new segment starts wherever the start is beyond every end we've seen so far
+    maxend = np.maximum.accumulate( segs[:,1] )
+    new = np.empty(len(segs), dtype=bool)
+    new[0] = True
+    new[1:] = segs[1:,0] > maxend[:-1]
+    starts = np.flatnonzero( new )
+
+    ans = np.empty((len(starts),2), dtype=np.int64)
+    ans[:,0] = segs[starts,0]
+    ans[:,1] = np.maximum.reduceat( segs[:,1], starts )
+    return ans
+
+def clip( segs, start, end ):
+    '''
+    restrict segments to [start, end], dropping those that fall entirely outside
+    '''
+    segs = asarray( segs )
+    segs = segs[(segs[:,1] > start) & (segs[:,0] < end)]
+    return np.clip( segs, start, end )
+
+def slices( segs, starts, ends ):
+    '''
+    restrict coalesced segs to each of the windows [starts[i], ends[i]]
+    returns a list with one segment array per window
+    only the segments overlapping each window are touched, so this is much faster than calling clip for every window
+    '''
+    segs = asarray( segs )
+    lo = np.searchsorted( segs[:,1], starts, side='right' ) ### the first segment ending after each window starts
+    hi = np.searchsorted( segs[:,0], ends, side='left' ) ### the first segment starting at or after each window ends
+    return [np.clip( segs[l:h], s, e ) for l, h, s, e in zip(lo, hi, starts, ends)]
+
+def duration( segs ):
+    '''
+    the total duration of segs in nanoseconds (overlapping segments are counted multiple times)
+    '''
+    segs = asarray( segs )
+    return int(np.sum(segs[:,1]-segs[:,0]))
+
+def count( segs, t ):
+    '''
+    the number of segments containing t (including their end points)
+    '''
+    segs = asarray( segs )
+    return int(np.sum((segs[:,0] <= t) & (t <= segs[:,1])))
+
+#-------------------------------------------------
+
+def _combine( a, b, keep ):
+    '''
+    combine two segment lists with a boolean operation
+    keep(in_a, in_b) returns a boolean array saying which elementary intervals to keep
+    '''
+    a = coalesce( a )
+    b = coalesce( b )
+    edges = np.unique( np.concatenate((a.flatten(), b.flatten())) )
+    if len(edges) < 2:
+        return empty()
+
+    ### every elementary interval [edges[i], edges[i+1]) is either entirely inside or entirely outside each list, so we only need to check its left edge
+    left = edges[:-1]
+    def inside( segs ):
+        if not len(segs):
+            return np.zeros(len(left), dtype=bool)
+        i = np.searchsorted( segs[:,0], left, side='right' ) - 1
+        return (i >= 0) & (left < segs[np.maximum(i, 0),1])
+
+    mask = keep( inside(a), inside(b) )
+    return coalesce( np.transpose([left[mask], edges[1:][mask]]) )
+
+def union( a, b ):
+    '''
+    the times covered by either a or b
+    '''
+    return coalesce( np.concatenate((asarray(a), asarray(b))) )
+
+def intersection( a, b ):
+    '''
+    the times covered by both a and b
+    '''
+    return _combine( a, b, lambda in_a, in_b: in_a & in_b )
+
+def difference( a, b ):
+    '''
+    the times covered by a but not by b
+    '''
+    return _combine( a, b, lambda in_a, in_b: in_a & ~in_b )
+
+def complement( segs, known ):
+    '''
+    the times within known that are not covered by segs
+    '''
+    return difference( known, segs )
+
+#-------------------------------------------------
+
+class SortedSegments(object):
+    '''
+    a coalesced segment list stored as sorted start and end arrays (along with the cumulative time covered before each segment) so that many times can be looked up at once with binary searches
+    every lookup accepts a single time or an array of times (nanoseconds) and returns a scalar or an array to match
+    '''
+
+    def __init__( self, segs ):
+        segs = coalesce( segs )
+        self.starts = np.ascontiguousarray( segs[:,0] )
+        self.ends = np.ascontiguousarray( segs[:,1] )
+        self.edges = segs.flatten() ### strictly increasing, since coalesced segments neither overlap nor touch
+        self.cumulative = np.concatenate(([0], np.cumsum(self.ends-self.starts))) ### the time covered before each segment
+
+    def __len__( self ):
+        return len(self.starts)
+
+    def duration( self ):
+        return int(self.cumulative[-1])
+
+    def _segment( self, times ):
+        '''
+        the index of the last segment starting at or before each time (-1 if there is none)
+        '''
+        return np.searchsorted( self.starts, times, side='right' ) - 1
+
+    def contains( self, times ):
+        '''
+        whether each time falls within a segment (including its end points), like count(segs, t) > 0
+        '''
+        times = np.asarray(times, dtype=np.int64)
+        i = self._segment( times )
+        ans = (i >= 0) & (times <= self.ends[np.maximum(i, 0)]) if len(self) else np.zeros(times.shape, dtype=bool)
+        return ans if ans.ndim else ans[()]
+
+    def covered( self, times ):
+        '''
+        the time covered by segments before each time
+        '''
+        times = np.asarray(times, dtype=np.int64)
+        if not len(self):
+            ans = np.zeros(times.shape, dtype=np.int64)
+        else:
+            i = self._segment( times )
+            j = np.maximum(i, 0)
+            ans = np.where( i >= 0, self.cumulative[j] + np.clip(times-self.starts[j], 0, self.ends[j]-self.starts[j]), 0 )
+        return ans if ans.ndim else ans[()]
+
+    def within( self, starts, ends ):
+        '''
+        the time covered by segments within each window [starts, ends]
+        '''
+        return self.covered( ends ) - self.covered( starts )
+
+    def around( self, times, window ):
+        '''
+        the time covered by segments within +/-window of each time
+        '''
+        times = np.asarray(times, dtype=np.int64)
+        return self.within( times-window, times+window )
+
+    def nearestEdge( self, times ):
+        '''
+        the distance from each time to the nearest start or end of a segment (-1 if there are no segments)
+        '''
+        times = np.asarray(times, dtype=np.int64)
+        if not len(self):
+            ans = -np.ones(times.shape, dtype=np.int64)
+        else:
+            j = np.searchsorted( self.edges, times )
+            before = np.where( j > 0, times - self.edges[np.maximum(j-1, 0)], np.iinfo(np.int64).max )
+            after = np.where( j < len(self.edges), self.edges[np.minimum(j, len(self.edges)-1)] - times, np.iinfo(np.int64).max )
+            ans = np.minimum( before, after )
+        return ans if ans.ndim else ans[()]
+
+class SegmentIndex(object):
+    '''
+    the known and active segments for a single flag, each indexed as SortedSegments
+    build this once per flag and ask about as many times as needed, e.g. every event within a span in seglogic-backfill
+    '''
+
+    def __init__( self, known, active ):
+        self.known = SortedSegments( known )
+        self.active = SortedSegments( active )
+
+    def isKnown( self, times ):
+        return self.known.contains( times )
+
+    def isActive( self, times ):
+        return self.active.contains( times )
+
+def contains( segs, times ):
+    '''
+    whether each time (nanoseconds) falls within segs (see SortedSegments.contains)
+    '''
+    return SortedSegments( segs ).contains( times )
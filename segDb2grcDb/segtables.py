@@ -0,0 +1,159 @@
+'''
+a vectorized engine for summarizing segment_definer, segment_summary and segment tables
+all rows are loaded into numpy arrays and grouped by segment_def_id in a single pass so every definer is summarized at once
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import numpy as np
+
+from segDb2grcDb import segments
+
+#-------------------------------------------------
+
+def _sumByGroup( groups, values, ngroups ):
+    '''
+    exact (integer) sums of values for each group in range(ngroups)
+    '''
+    ans = np.zeros(ngroups, dtype=np.int64)
+    if len(groups):
+        order = np.argsort(groups, kind='mergesort')
+        groups = groups[order]
+        starts = np.flatnonzero( np.concatenate(([True], groups[1:]!=groups[:-1])) )
+        ans[groups[starts]] = np.add.reduceat( values[order], starts )
+    return ans
+
+def _splitByGroup( table, ngroups ):
+    '''
+    the rows of an (N,3) array of (group, start, end) for each group in range(ngroups) as (M,2) arrays, in a single pass
+    '''
+    if not ngroups:
+        return []
+    table = table[np.argsort(table[:,0], kind='mergesort')] ### stable, so rows keep their order within each group
+    bounds = np.searchsorted( table[:,0], np.arange(1, ngroups) )
+    return [rows[:,1:] for rows in np.split( table, bounds )]
+
+#-------------------------------------------------
+
+class SegmentTables(object):
+    '''
+    array-backed segment tables
+
+    definers is a list of (segment_def_id, ifos, name, version)
+    summary and segment are (N,3) int64 arrays of (definer index, start, end) with times in nanoseconds
+    '''
+
+    def __init__( self, definers, summary, segment ):
+        self.definers = definers
+        self.summary = summary
+        self.segment = segment
+
+    def __len__( self ):
+        return len(self.definers)
+
+    #---
+
+    @staticmethod
+    def _rows2array( rows, index, getter ):
+        '''
+        convert rows into an (N,3) array of (definer index, start, end), skipping rows with unknown segment_def_id
+        '''
+        ans = []
+        for row in rows:
+            segdef_id, start, start_ns, end, end_ns = getter( row )
+            if segdef_id in index:
+                ans.append( (index[segdef_id], segments.gps2ns(start, start_ns or 0), segments.gps2ns(end, end_ns or 0)) )
+        if ans:
+            return np.array(ans, dtype=np.int64)
+        return np.empty((0,3), dtype=np.int64)
+
+    @classmethod
+    def fromTables( cls, sdef, ssum, seg ):
+        '''
+        build from glue.ligolw tables (rows with attributes)
+        '''
+        definers = [(a.segment_def_id, a.ifos, a.name, a.version) for a in sdef]
+        index = dict((definer[0], i) for i, definer in enumerate(definers))
+        getter = lambda a: (a.segment_def_id, a.start_time, a.start_time_ns, a.end_time, a.end_time_ns)
+        return cls( definers, cls._rows2array(ssum, index, getter), cls._rows2array(seg, index, getter) )
+
+    @staticmethod
+    def _columns2array( columns, index ):
+        '''
+        convert columns into an (N,3) array of (definer index, start, end), skipping rows with unknown segment_def_id
+        '''
+        if (not columns) or (not len(columns['segment_def_id'])):
+            return np.empty((0,3), dtype=np.int64)
+
+        ### map each distinct segment_def_id once rather than once per row
+        ids, inverse = np.unique( np.array(columns['segment_def_id']), return_inverse=True )
+        lookup = np.array([index.get(segdef_id, -1) for segdef_id in ids], dtype=np.int64)
+
+        n = len(inverse)
+        zeros = np.zeros(n, dtype=np.int64)
+        ans = np.empty((n,3), dtype=np.int64)
+        ans[:,0] = lookup[inverse]
+        ans[:,1] = columns['start_time']*segments.NS + columns.get('start_time_ns', zeros)
+        ans[:,2] = columns['end_time']*segments.NS + columns.get('end_time_ns', zeros)
+        return ans[ans[:,0] >= 0]
+
+    @classmethod
+    def fromColumns( cls, tables ):
+        '''
+        build from the output of segDb2grcDb.segxml.readColumns
+        '''
+        sdef = tables.get('segment_definer', {})
+        if sdef:
+            definers = list(zip(sdef['segment_def_id'], sdef['ifos'], sdef['name'], sdef['version']))
+        else:
+            definers = []
+        index = dict((definer[0], i) for i, definer in enumerate(definers))
+        return cls( definers, cls._columns2array(tables.get('segment_summary', {}), index), cls._columns2array(tables.get('segment', {}), index) )
+
+    #---
+
+    def index( self, name, ifos=None, version=None ):
+        '''
+        the index of the first definer matching name (and ifos, version if supplied)
+        raises StopIteration if nothing matches
+        '''
+        return next(i for i, (_, ifo, n, v) in enumerate(self.definers) if (n==name) and (ifos is None or ifo==ifos) and (version is None or str(v)==str(version)))
+
+    def flag( self, i ):
+        '''
+        IFO:NAME:VERSION for the i'th definer
+        '''
+        _, ifos, name, version = self.definers[i]
+        return "%s:%s:%s"%(ifos, name, version)
+
+    def segments( self, i, summary=False ):
+        '''
+        the segments (or summary segments) for the i'th definer as an (N,2) array in nanoseconds
+        '''
+        table = self.summary if summary else self.segment
+        return table[table[:,0]==i][:,1:]
+
+    def split( self ):
+        '''
+        the known (summary) and active segments for every definer at once
+        returns a list of (known, active) aligned with self.definers, which is much cheaper than calling segments for each definer when there are many of them
+        '''
+        ndef = len(self.definers)
+        return list(zip(_splitByGroup( self.summary, ndef ), _splitByGroup( self.segment, ndef )))
+
+    def summarize( self, gpstime ):
+        '''
+        compute, for every definer at once, how long it is known (defined), how long it is active and the number of active segments containing gpstime
+        returns known, active, flagged as int64 arrays aligned with self.definers (known and active are measured in nanoseconds)
+        '''
+        ndef = len(self.definers)
+        t = segments.gps2ns( gpstime )
+
+        known = _sumByGroup( self.summary[:,0], self.summary[:,2]-self.summary[:,1], ndef )
+        active = _sumByGroup( self.segment[:,0], self.segment[:,2]-self.segment[:,1], ndef )
+
+        contains = (self.segment[:,1] <= t) & (t <= self.segment[:,2])
+        flagged = np.bincount( self.segment[contains,0], minlength=ndef ).astype(np.int64)
+
+        return known, active, flagged
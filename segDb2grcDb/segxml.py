@@ -0,0 +1,323 @@
+'''
+minimal LIGO_LW XML readers and writers for the tables seglogic.py needs
+we handle these by hand so that documents can be processed without building a glue.ligolw document tree
+in particular, the reader streams through documents and stores only the tables we need as compact columns
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import csv
+import gzip
+
+import numpy as np
+
+from xml.sax import make_parser
+from xml.sax.handler import ContentHandler, feature_external_ges, feature_external_pes
+from xml.sax.saxutils import escape
+
+from segDb2grcDb import segments
+
+#-------------------------------------------------
+
+HEADER = """<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE LIGO_LW SYSTEM "http://ldas-sw.ligo.caltech.edu/doc/ligolwAPI/html/ligolw_dtd.txt">
+<LIGO_LW>
+"""
+FOOTER = """</LIGO_LW>
+"""
+
+VETODEF_COLUMNS = [
+    ('process_id', 'ilwd:char'),
+    ('ifo',        'lstring'),
+    ('name',       'lstring'),
+    ('version',    'int_4s'),
+    ('category',   'int_4s'),
+    ('start_time', 'int_4s'),
+    ('end_time',   'int_4s'),
+    ('start_pad',  'int_4s'),
+    ('end_pad',    'int_4s'),
+    ('comment',    'lstring'),
+]
+
+SEGDEF_COLUMNS = [
+    ('process_id',     'ilwd:char'),
+    ('segment_def_id', 'ilwd:char'),
+    ('ifos',           'lstring'),
+    ('name',           'lstring'),
+    ('version',        'int_4s'),
+    ('comment',        'lstring'),
+]
+
+SEGSUM_COLUMNS = [
+    ('process_id',     'ilwd:char'),
+    ('segment_sum_id', 'ilwd:char'),
+    ('segment_def_id', 'ilwd:char'),
+    ('start_time',     'int_4s'),
+    ('start_time_ns',  'int_4s'),
+    ('end_time',       'int_4s'),
+    ('end_time_ns',    'int_4s'),
+    ('comment',        'lstring'),
+]
+
+SEG_COLUMNS = [
+    ('process_id',     'ilwd:char'),
+    ('segment_id',     'ilwd:char'),
+    ('segment_def_id', 'ilwd:char'),
+    ('start_time',     'int_4s'),
+    ('start_time_ns',  'int_4s'),
+    ('end_time',       'int_4s'),
+    ('end_time_ns',    'int_4s'),
+]
+
+INT_TYPES = ('int_2s', 'int_2u', 'int_4s', 'int_4u', 'int_8s', 'int_8u', 'int')
+FLOAT_TYPES = ('real_4', 'real_8', 'float', 'double')
+
+#-------------------------------------------------
+
+def open_xml( filename, mode="rb" ):
+    '''
+    open filename in binary mode, transparently handling gzip compression
+    '''
+    if filename.endswith(".gz"):
+        return gzip.open( filename, mode )
+    return open( filename, mode )
+
+#-------------------------------------------------
+
+def _format( value, dtype ):
+    '''
+    format a single value for a LIGO_LW Stream
+    '''
+    if value is None:
+        return ""
+    if dtype in ('lstring', 'ilwd:char'):
+        return '"%s"'%escape(str(value).replace('\\', '\\\\').replace('"', '\\"'))
+    return str(value)
+
+def table2xml( tablename, columns, rows ):
+    '''
+    format a table as a LIGO_LW string
+    columns is a list of (name, type) and rows is a list of tuples ordered like columns
+    '''
+    xml = '\t<Table Name="%s:table">\n'%tablename
+    for name, dtype in columns:
+        xml += '\t\t<Column Name="%s:%s" Type="%s"/>\n'%(tablename, name, dtype)
+    xml += '\t\t<Stream Name="%s:table" Type="Local" Delimiter=",">\n'%tablename
+    xml += ",\n".join("\t\t\t"+",".join(_format(value, dtype) for value, (_, dtype) in zip(row, columns)) for row in rows)
+    xml += '\n\t\t</Stream>\n\t</Table>\n'
+    return xml
+
+#------------------------
+
+def flag2vetoDefRow( flag, category=1, start_pad=0, end_pad=0, comment="" ):
+    '''
+    convert IFO:NAME:VERSION into a veto_definer row that is valid for all time
+    '''
+    ifo, name, version = flag.split(":")
+    return ("process:process_id:0", ifo, name, int(version), category, 0, 0, start_pad, end_pad, comment)
+
+def writeVetoDefiner( filename, rows ):
+    '''
+    write a veto definer file containing rows (formatted as in flag2vetoDefRow)
+    '''
+    file_obj = open(filename, "w")
+    file_obj.write( HEADER )
+    file_obj.write( table2xml( 'veto_definer', VETODEF_COLUMNS, rows ) )
+    file_obj.write( FOOTER )
+    file_obj.close()
+
+#------------------------
+
+def segments2xml( results, comment="" ):
+    '''
+    format segments as a LIGO_LW string
+    results is a list of (flag, known, active) where flag is IFO:NAME:VERSION and known, active are segment arrays (see segDb2grcDb.segments)
+    '''
+    segdef = []
+    segsum = []
+    seg = []
+    for i, (flag, known, active) in enumerate(results):
+        ifo, name, version = flag.split(":")
+        segdef_id = "segment_definer:segment_def_id:%d"%i
+        segdef.append( ("process:process_id:0", segdef_id, ifo, name, int(version), comment) )
+
+        for s, e in known:
+            segsum.append( ("process:process_id:0", "segment_summary:segment_sum_id:%d"%len(segsum), segdef_id, s//segments.NS, s%segments.NS, e//segments.NS, e%segments.NS, comment) )
+
+        for s, e in active:
+            seg.append( ("process:process_id:0", "segment:segment_id:%d"%len(seg), segdef_id, s//segments.NS, s%segments.NS, e//segments.NS, e%segments.NS) )
+
+    return HEADER \
+        + table2xml( 'segment_definer', SEGDEF_COLUMNS, segdef ) \
+        + table2xml( 'segment_summary', SEGSUM_COLUMNS, segsum ) \
+        + table2xml( 'segment', SEG_COLUMNS, seg ) \
+        + FOOTER
+
+def writeSegments( filename, results, comment="" ):
+    '''
+    write segments to filename (see segments2xml)
+    '''
+    file_obj = open_xml(filename, "wb")
+    file_obj.write( segments2xml( results, comment=comment ).encode('utf-8') )
+    file_obj.close()
+
+#-------------------------------------------------
+
+### the tables we extract when reading documents, everything else is discarded as it streams past
+STREAM_TABLES = ('segment_definer', 'segment_summary', 'segment', 'veto_definer')
+
+def _strip( name ):
+    '''
+    "segment:start_time" -> "start_time" and "segment:table" -> "segment"
+    '''
+    name = name.split(":")
+    if name[-1]=="table":
+        return name[-2]
+    return name[-1]
+
+def tokenize( text, delimiter="," ):
+    '''
+    split the contents of a LIGO_LW Stream into individual (string) tokens
+    rows are delimiter-terminated, so we drop a single trailing delimiter from each line and let the csv module (which is implemented in C) do the rest
+    quotes are removed and null tokens are returned as empty strings
+    '''
+    if not isinstance(text, str): ### python2 gives us unicode, but csv wants bytes
+        text = text.encode('utf-8')
+    delimiter = str(delimiter)
+
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            lines.append( line[:-1] if line.endswith(delimiter) else line )
+
+    tokens = []
+    for row in csv.reader( lines, delimiter=delimiter, quotechar='"', escapechar='\\', doublequote=False ):
+        tokens += row
+    return tokens
+
+def column( tokens, dtype ):
+    '''
+    convert the tokens for a single column into an array (numeric types) or a list (everything else)
+    nulls within numeric columns are converted to 0
+    '''
+    if (dtype in INT_TYPES) or (dtype in FLOAT_TYPES):
+        if '' in tokens:
+            tokens = [token or '0' for token in tokens]
+        return np.array(tokens).astype(np.int64 if dtype in INT_TYPES else np.float64)
+    return tokens
+
+def concatenate( chunks, dtype ):
+    '''
+    join the chunks of a column produced by column
+    '''
+    if (dtype in INT_TYPES) or (dtype in FLOAT_TYPES):
+        if chunks:
+            return np.concatenate( chunks )
+        return column( [], dtype )
+    return [token for chunk in chunks for token in chunk]
+
+class _StreamHandler(ContentHandler):
+    '''
+    collects the Streams belonging to the requested tables and ignores everything else
+    Stream contents are tokenized line-by-line as they arrive and converted into columns every batch rows, so we never hold the whole Stream in memory
+    '''
+
+    def __init__( self, tablenames, batch=10000 ):
+        ContentHandler.__init__( self )
+        self.tablenames = tablenames
+        self.batch = batch
+        self.tables = {}
+
+        self._table = None ### the name of the table we're currently in (if we want it)
+        self._columns = []
+        self._delimiter = ','
+        self._chunks = None ### text from the current Stream that has not been tokenized (if we want it)
+        self._tokens = []
+        self._data = None ### column name -> list of converted chunks
+
+    def startElement( self, name, attrs ):
+        if name=='Table':
+            tablename = _strip( attrs.get('Name') )
+            self._table = tablename if tablename in self.tablenames else None
+            self._columns = []
+
+        elif self._table is None:
+            pass
+
+        elif name=='Column':
+            self._columns.append( (_strip(attrs.get('Name')), attrs.get('Type')) )
+
+        elif name=='Stream':
+            self._delimiter = attrs.get('Delimiter', ',')
+            self._chunks = []
+            self._tokens = []
+            self._data = dict((name, []) for name, _ in self._columns)
+
+    def characters( self, content ):
+        if self._chunks is None:
+            return
+        if '\n' not in content:
+            self._chunks.append( content )
+            return
+
+        ### tokenize every complete line we have
+        head, tail = content.rsplit('\n', 1)
+        self._chunks.append( head )
+        self._feed( "".join(self._chunks) )
+        self._chunks = [tail]
+
+    def _feed( self, text ):
+        self._tokens += tokenize( text, delimiter=self._delimiter )
+        if len(self._tokens) >= self.batch*len(self._columns):
+            self._flush()
+
+    def _flush( self ):
+        '''
+        convert all complete rows we have into columns
+        '''
+        ncol = len(self._columns)
+        if not ncol:
+            self._tokens = []
+            return
+        n = (len(self._tokens)//ncol)*ncol
+        for i, (name, dtype) in enumerate(self._columns):
+            self._data[name].append( column(self._tokens[i:n:ncol], dtype) )
+        self._tokens = self._tokens[n:]
+
+    def endElement( self, name ):
+        if (name=='Stream') and (self._chunks is not None):
+            self._feed( "".join(self._chunks) )
+            self._flush()
+            self._chunks = None
+            self._tokens = [] ### anything left over is an incomplete row
+            self.tables[self._table] = dict((name, concatenate(self._data[name], dtype)) for name, dtype in self._columns)
+            self._data = None
+
+        elif name=='Table':
+            if (self._table is not None) and (self._table not in self.tables): ### a table without a Stream has no rows
+                self.tables[self._table] = dict((name, column([], dtype)) for name, dtype in self._columns)
+            self._table = None
+
+def readColumns( filename, tablenames=STREAM_TABLES ):
+    '''
+    stream through a (possibly gzipped) LIGO_LW file, extracting only the requested tables
+    filename may also be anything with an open method returning a file object, e.g. an in-memory segDb2grcDb.archive.Attachment
+    returns a dictionary mapping each table found to a dictionary of columns (see column)
+    tables that are not present are not included
+    '''
+    handler = _StreamHandler( tablenames )
+
+    parser = make_parser()
+    parser.setFeature( feature_external_ges, False ) ### never go looking for the DTD
+    parser.setFeature( feature_external_pes, False )
+    parser.setContentHandler( handler )
+
+    file_obj = filename.open() if hasattr(filename, 'open') else open_xml( filename )
+    try:
+        parser.parse( file_obj )
+    finally:
+        file_obj.close()
+
+    return handler.tables
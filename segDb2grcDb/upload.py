@@ -0,0 +1,297 @@
+'''
+an asynchronous upload queue for GraceDb
+log messages and labels are handed to a background thread so that slow (or failing) requests to GraceDb never hold up segment queries
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import sys
+import time
+import threading
+import traceback
+
+from collections import deque, defaultdict
+
+#-------------------------------------------------
+
+class KeepAlive(object):
+    '''
+    a connector for ligo.gracedb.rest.GraceDb that keeps one persistent connection per thread instead of opening a new one (and doing a new TLS handshake) for every request
+    connector is the client's original connector, which is used whenever we need a new connection
+    a connection is only reused once the response to its last request has been read, and is replaced if a request on it failed or it has been idle for more than max_idle seconds (servers close idle connections on their own)
+    '''
+
+    def __init__( self, connector, max_idle=4.0 ):
+        self.connector = connector
+        self.max_idle = max_idle
+        self._local = threading.local()
+
+    def __call__( self ):
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if (conn is not None) and not (local.idle and local.response.isclosed() and (time.time()-local.last <= self.max_idle)):
+            conn.close()
+            conn = None
+
+        if conn is None:
+            conn = self.connector()
+            request = conn.request
+            getresponse = conn.getresponse
+
+            def track_request( *args, **kwargs ):
+                local.idle = False ### until we have a response
+                return request( *args, **kwargs )
+
+            def track_response( *args, **kwargs ):
+                local.response = getresponse( *args, **kwargs )
+                local.idle = True
+                local.last = time.time()
+                return local.response
+
+            conn.request = track_request
+            conn.getresponse = track_response
+            local.conn = conn
+            local.response = _Closed
+            local.idle = True
+            local.last = time.time()
+        return conn
+
+class _Closed(object):
+    '''
+    stands in for the response to the last request on a connection that has not made any
+    '''
+
+    @staticmethod
+    def isclosed():
+        return True
+
+def keepAlive( gracedb, max_idle=4.0 ):
+    '''
+    have gracedb (a ligo.gracedb.rest.GraceDb) reuse its connections (see KeepAlive) and return it
+    anything without a connector (e.g. segDb2grcDb.fakes.FakeGraceDb) is returned unchanged
+    '''
+    if hasattr(gracedb, 'connector') and not isinstance(gracedb.connector, KeepAlive):
+        gracedb.connector = KeepAlive( gracedb.connector, max_idle=max_idle )
+    return gracedb
+
+#-------------------------------------------------
+
+class Uploader(object):
+    '''
+    queues writeLog and writeLabel requests and sends them to gracedb from a single background thread, which reuses the same client for every request
+    responses are read as soon as they arrive so that a client that keeps its connections alive (see keepAlive) can send the next request over the same connection
+
+    the interface mirrors the parts of ligo.gracedb.rest.GraceDb that seglogic.py uses, so an Uploader can be passed anywhere a GraceDb object is expected
+        writeLog and writeLabel return immediately
+        event is delegated to gracedb synchronously
+
+    requests are sent in the order they were made for each event, with a few optimizations
+        consecutive log messages for the same event with the same tags and no attachment are merged into a single message
+        labels that have already been applied (or queued) for an event are skipped, until the event is flushed
+        requests that fail are retried up to retries times, waiting backoff*2**n (but no more than max_backoff) seconds between attempts
+    linger is how long the background thread waits for more requests before sending what it has, which gives it a chance to merge messages
+    '''
+
+    def __init__( self, gracedb, retries=5, backoff=1.0, max_backoff=30.0, linger=0.0, verbose=False ):
+        self.gracedb = gracedb
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.linger = linger
+        self.verbose = verbose
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._pending = 0 ### number of requests that have been queued but not sent (or abandoned)
+        self._pending_events = defaultdict( int ) ### the same, for each graceid
+        self._closed = False
+        self._flushing = 0 ### number of threads blocked in flush
+
+        self._labels = defaultdict( set ) ### graceid -> labels that have been applied or queued since the event was last flushed
+        self.counts = {'requests':0, 'merged':0, 'skipped':0, 'retries':0, 'failed':0}
+        self.errors = [] ### (request, exc_info) for every request we gave up on
+
+        self._thread = threading.Thread( target=self._work, name="seglogic-upload" )
+        self._thread.daemon = True
+        self._thread.start()
+
+    #---
+
+    def event( self, graceid ):
+        return self.gracedb.event( graceid )
+
+    def writeLog( self, graceid, message, filename=None, filecontents=None, tagname=[] ):
+        '''
+        queue a log message (and optional attachment) for graceid
+        the attachment is read from filename unless filecontents is supplied, in which case filename is only its name
+        '''
+        self._put( ('log', graceid, message, filename, tuple(tagname), filecontents) )
+
+    def writeLabel( self, graceid, label ):
+        '''
+        queue label for graceid unless it has already been applied (or queued)
+        '''
+        with self._cond:
+            if label in self._labels[graceid]:
+                self.counts['skipped'] += 1
+                return
+            self._labels[graceid].add( label )
+        self._put( ('label', graceid, label) )
+
+    def _put( self, request ):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("cannot queue requests on an Uploader that has been closed")
+            self._queue.append( request )
+            self._pending += 1
+            self._pending_events[request[1]] += 1
+            self._cond.notify_all()
+
+    #---
+
+    def _next( self ):
+        '''
+        block until there are requests to send and return them, merging log messages where possible
+        returns None if there is nothing left to do
+        '''
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+            ### give related requests a chance to arrive, unless someone is waiting on us
+            deadline = time.time() + self.linger
+            while not (self._closed or self._flushing):
+                wait = deadline - time.time()
+                if wait <= 0:
+                    break
+                self._cond.wait( wait )
+
+            requests = list(self._queue)
+            self._queue.clear()
+
+        batch = [] ### (request, number of queued requests it represents)
+        last = {} ### graceid -> index of the last request for that event within batch
+        for request in requests:
+            graceid = request[1]
+            i = last.get( graceid )
+            if (i is not None) and (request[0]=='log') and (request[3] is None):
+                previous, n = batch[i]
+                if (previous[0]=='log') and (previous[3] is None) and (previous[4]==request[4]): ### merge into the previous message
+                    batch[i] = (previous[:2] + (previous[2]+"<br><br>"+request[2],) + previous[3:], n+1)
+                    continue
+            last[graceid] = len(batch)
+            batch.append( (request, 1) )
+        return batch
+
+    def _send( self, request ):
+        if request[0]=='log':
+            _, graceid, message, filename, tagname, filecontents = request
+            if filecontents is None:
+                response = self.gracedb.writeLog( graceid, message=message, filename=filename, tagname=list(tagname) )
+            else:
+                response = self.gracedb.writeLog( graceid, message=message, filename=filename, filecontents=filecontents, tagname=list(tagname) )
+        else:
+            _, graceid, label = request
+            response = self.gracedb.writeLabel( graceid, label )
+        if hasattr(response, 'read'): ### frees up the connection for the next request
+            response.read()
+
+    def _retry( self, error ):
+        '''
+        whether a request that raised error is worth retrying
+        client errors (HTTP 4xx) will not go away on their own, except for timeouts and rate limiting
+        '''
+        status = getattr(error, 'status', None)
+        return not ((status is not None) and (400 <= status < 500) and (status not in (408, 429)))
+
+    def _work( self ):
+        while True:
+            batch = self._next()
+            if batch is None:
+                return
+
+            for request, n in batch:
+                for attempt in range(self.retries+1):
+                    try:
+                        self._send( request )
+                    except Exception as e:
+                        if (attempt < self.retries) and self._retry( e ):
+                            wait = min(self.backoff*2**attempt, self.max_backoff)
+                            if self.verbose:
+                                print "upload: %s for %s failed (%s: %s), retrying in %.1f sec"%(request[0], request[1], type(e).__name__, e, wait)
+                                sys.stdout.flush()
+                            with self._cond:
+                                self.counts['retries'] += 1
+                            time.sleep( wait )
+                            continue
+
+                        exc_info = sys.exc_info()
+                        traceback.print_exception( *exc_info )
+                        sys.stderr.flush()
+                        with self._cond:
+                            self.counts['failed'] += 1
+                            self.errors.append( (request, exc_info) )
+                            if request[0]=='label': ### let a later request try again
+                                self._labels[request[1]].discard( request[2] )
+                    break
+
+                with self._cond:
+                    self.counts['requests'] += 1
+                    self.counts['merged'] += n-1
+                    self._pending -= n
+                    self._pending_events[request[1]] -= n
+                    if not self._pending_events[request[1]]:
+                        del self._pending_events[request[1]]
+                    self._cond.notify_all()
+
+    #---
+
+    def __len__( self ):
+        with self._cond:
+            return self._pending
+
+    def flush( self, timeout=None, graceid=None ):
+        '''
+        block until every queued request (or every request for graceid, if supplied) has been sent (or abandoned)
+        the labels we remember for those events are then forgotten, so a long-lived Uploader does not keep them forever
+        returns whether the queue was emptied before timeout
+        '''
+        if timeout is not None:
+            timeout += time.time()
+        if graceid is None:
+            pending = lambda : self._pending
+        else:
+            pending = lambda : self._pending_events.get( graceid, 0 )
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all() ### stop lingering
+            try:
+                while pending():
+                    if timeout is None:
+                        self._cond.wait( 1.0 ) ### wait with a timeout so we remain responsive to KeyboardInterrupt
+                    else:
+                        wait = timeout - time.time()
+                        if wait <= 0:
+                            return False
+                        self._cond.wait( min(wait, 1.0) )
+
+                ### forget labels for every event that has nothing left to send
+                for key in ([graceid] if graceid is not None else list(self._labels.keys())):
+                    if key not in self._pending_events:
+                        self._labels.pop( key, None )
+            finally:
+                self._flushing -= 1
+        return True
+
+    def close( self ):
+        '''
+        send everything that is queued and stop the background thread, after which no more requests can be queued
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        while self._thread.is_alive():
+            self._thread.join( 1.0 )
@@ -0,0 +1,146 @@
+'''
+veto definers evaluated in-process
+the veto definer is parsed once (and again only when the file changes), the flags it contains are retrieved like any other flag and padding and categories are applied here
+this replaces launching ligolw_segments_from_cats_dqsegdb and reading back the VETOTIME files it writes
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import threading
+
+from collections import defaultdict
+
+import numpy as np
+
+from segDb2grcDb import segxml
+from segDb2grcDb import segments
+
+#-------------------------------------------------
+
+### end_time=0 in a veto definer means the row applies forever
+FOREVER = 2**31
+
+#-------------------------------------------------
+
+class VetoDefiner(object):
+    '''
+    the rows of a veto_definer table
+    each row applies flag (IFO:NAME:VERSION) in category between start_time and end_time (GPS seconds), padding every active segment to [start+start_pad, end+end_pad]
+    '''
+
+    def __init__( self, ifos, names, versions, categories, start_times, end_times, start_pads, end_pads ):
+        self.flags = ["%s:%s:%d"%(ifo, name, version) for ifo, name, version in zip(ifos, names, versions)]
+        self.ifos = list(ifos)
+        self.categories = np.asarray(categories, dtype=int)
+        self.start_times = np.asarray(start_times, dtype=np.int64)
+        self.end_times = np.where( np.asarray(end_times)==0, FOREVER, end_times ).astype(np.int64)
+        self.start_pads = np.asarray(start_pads, dtype=np.int64)
+        self.end_pads = np.asarray(end_pads, dtype=np.int64)
+
+    @staticmethod
+    def fromColumns( columns ):
+        '''
+        build from the output of segDb2grcDb.segxml.readColumns
+        '''
+        if 'veto_definer' not in columns:
+            raise ValueError("no veto_definer table found")
+        table = columns['veto_definer']
+        return VetoDefiner( table['ifo'], table['name'], table['version'], table['category'], table['start_time'], table['end_time'], table['start_pad'], table['end_pad'] )
+
+    def __len__( self ):
+        return len(self.flags)
+
+    #---
+
+    def rows( self, start, end ):
+        '''
+        the indices of rows that apply at some point within [start, end]
+        '''
+        return np.flatnonzero( (self.start_times < end) & (self.end_times > start) )
+
+    def window( self, start, end ):
+        '''
+        the window [start, end] must be extended to this so that every padded segment overlapping [start, end] is found
+        '''
+        rows = self.rows( start, end )
+        if not len(rows):
+            return start, end
+        return start - max(0, np.max(self.end_pads[rows])), end + max(0, -np.min(self.start_pads[rows]))
+
+    def evaluate( self, results, start, end, cumulative=False ):
+        '''
+        apply padding and categories to results (flag -> (known, active) segments in nanoseconds, retrieved over window(start, end)) within [start, end]
+        flags that are missing from results are treated as unknown
+
+        returns {ifo : {category : (known, active, {flag : (known, active)})}} where category is CAT1, CAT2, etc
+            the active segments of a category are the union of the padded active segments of its flags
+            a category is known only where all of its flags are known (or do not apply)
+            if cumulative, each category also includes the flags from every lower category
+        '''
+        start_ns = segments.gps2ns( start )
+        end_ns = segments.gps2ns( end )
+        window = segments.asarray( [[start_ns, end_ns]] )
+
+        ### apply each row within the time it is valid
+        rows = defaultdict( lambda : defaultdict( list ) ) ### ifo -> category -> [(flag, valid, known, active)]
+        for i in self.rows( start, end ):
+            flag = self.flags[i]
+            valid = segments.asarray( [[max(start_ns, segments.gps2ns(int(self.start_times[i]))), min(end_ns, segments.gps2ns(int(self.end_times[i])))]] )
+            if flag in results:
+                known, active = results[flag]
+                active = segments.asarray(active) + np.array([self.start_pads[i], self.end_pads[i]], dtype=np.int64)*segments.NS
+                active = segments.coalesce( active[active[:,1] > active[:,0]] ) ### negative padding can remove short segments entirely
+                known = segments.intersection( known, valid )
+                active = segments.intersection( active, valid )
+            else:
+                known = active = segments.empty()
+            rows[self.ifos[i]][self.categories[i]].append( (flag, valid, known, active) )
+
+        ans = {}
+        for ifo, categories in rows.items():
+            ans[ifo] = {}
+            for category in sorted(categories.keys()):
+                if cumulative:
+                    included = sum([categories[c] for c in sorted(categories.keys()) if c <= category], [])
+                else:
+                    included = categories[category]
+
+                unknown = segments.empty()
+                active = segments.empty()
+                flags = {}
+                for flag, valid, flag_known, flag_active in included:
+                    unknown = segments.union( unknown, segments.difference( valid, flag_known ) )
+                    active = segments.union( active, flag_active )
+                    if flag in flags: ### the same flag may appear in several rows (e.g. with different padding or valid times)
+                        flags[flag] = (segments.union( flags[flag][0], flag_known ), segments.union( flags[flag][1], flag_active ))
+                    else:
+                        flags[flag] = (flag_known, flag_active)
+                known = segments.difference( window, unknown )
+                ans[ifo]["CAT%d"%category] = (known, segments.intersection( active, known ), flags)
+        return ans
+
+#-------------------------------------------------
+
+### parsed veto definers, keyed by path
+_definers = {}
+_definers_lock = threading.Lock()
+
+def loadVetoDefiner( path ):
+    '''
+    return the VetoDefiner stored in path
+    veto definers are shared within a process and only parsed again when the file's mtime (or size) changes
+    '''
+    path = os.path.abspath( path )
+    stat = os.stat( path )
+    version = (stat.st_mtime, stat.st_size)
+    with _definers_lock:
+        if (path in _definers) and (_definers[path][0]==version):
+            return _definers[path][1]
+
+    definer = VetoDefiner.fromColumns( segxml.readColumns( path, ['veto_definer'] ) )
+
+    with _definers_lock:
+        _definers[path] = (version, definer)
+    return definer
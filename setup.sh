@@ -1 +1,2 @@
 export PATH=${PWD}/bin:${PATH}
+export PYTHONPATH=${PWD}:${PYTHONPATH}
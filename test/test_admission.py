@@ -0,0 +1,70 @@
+'''
+tests for segDb2grcDb.admission
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    from ConfigParser import SafeConfigParser
+except ImportError:
+    from configparser import ConfigParser as SafeConfigParser
+
+from segDb2grcDb import admission
+
+#-------------------------------------------------
+
+class TestAdmissionPolicy(unittest.TestCase):
+
+    def test_rules( self ):
+        '''
+        the first matching rule sets the priority, matching is case-insensitive and far is an upper limit
+        '''
+        policy = admission.AdmissionPolicy( rules=admission.parseRules( "Test/*/*:9 */*/*/1e-7:0 CBC/gstlal/*:1" ), default_priority=5 )
+        self.assertEqual( policy.priority( {'group':'test', 'pipeline':'gstlal', 'far':1e-10} ), 9 )
+        self.assertEqual( policy.priority( {'group':'Burst', 'pipeline':'cwb', 'search':'AllSky', 'far':1e-8} ), 0 )
+        self.assertEqual( policy.priority( {'group':'CBC', 'pipeline':'GSTLAL', 'search':'LowMass', 'far':1e-6} ), 1 )
+        self.assertEqual( policy.priority( {'group':'CBC', 'pipeline':'gstlal'} ), 1 )
+        self.assertEqual( policy.priority( {'group':'CBC', 'pipeline':'pycbc', 'far':1e-6} ), 5 )
+        self.assertEqual( policy.priority( {} ), 5 )
+
+    def test_parse_errors( self ):
+        for text in ["CBC/gstlal/*", "CBC/gstlal:1", "a/b/c/d/e:1", "CBC/gstlal/*:high", "CBC/gstlal/*/small:1"]:
+            self.assertRaises( ValueError, admission.parseRules, text )
+
+    def test_shedding( self ):
+        '''
+        when to shed events
+        '''
+        policy = admission.AdmissionPolicy( urgent_priority=1, max_queued=10, shed_priority=5, shed_depth=3, max_wait=60 )
+        self.assertTrue( policy.isUrgent( 0 ) and policy.isUrgent( 1 ) and not policy.isUrgent( 2 ) )
+        self.assertEqual( [policy.shedOnArrival( 5, depth ) for depth in [2, 3]], [False, True] )
+        self.assertFalse( policy.shedOnArrival( 4, 100 ) )
+        self.assertEqual( [policy.isFull( depth ) for depth in [9, 10]], [False, True] )
+        self.assertEqual( [policy.isStale( wait ) for wait in [60, 61]], [False, True] )
+
+        ### the default policy never sheds anything
+        policy = admission.AdmissionPolicy()
+        self.assertFalse( policy.shedOnArrival( 100, 100 ) or policy.isFull( 100 ) or policy.isStale( 1e6 ) )
+        self.assertEqual( policy.priority( {'group':'CBC'} ), 0 )
+
+    def test_config( self ):
+        config = SafeConfigParser()
+        self.assertEqual( admission.AdmissionPolicy.fromConfig( config ).rules, [] )
+
+        config.readfp( StringIO( "[admission]\npriorities = Test/*/*:9 CBC/*/*:1\nreserved-events = 1\nmax-wait = 30\n" ) )
+        policy = admission.AdmissionPolicy.fromConfig( config )
+        self.assertEqual( [(rule.text, rule.priority) for rule in policy.rules], [('Test/*/*', 9), ('CBC/*/*', 1)] )
+        self.assertEqual( (policy.reserved_events, policy.max_wait, policy.max_queued), (1, 30.0, None) )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
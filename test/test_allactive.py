@@ -0,0 +1,122 @@
+'''
+tests for segDb2grcDb.allactive
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import time
+import threading
+import unittest
+
+try:
+    from httplib import BadStatusLine
+except ImportError:
+    from http.client import BadStatusLine
+
+from segDb2grcDb import allactive
+from segDb2grcDb import fakes
+from segDb2grcDb import segments
+
+#-------------------------------------------------
+
+URL = "https://segments.example.org"
+
+class TestSegDbActive(unittest.TestCase):
+
+    def setUp( self ):
+        self._get = allactive._get
+        allactive._get = self.get
+        self.paths = []
+        allactive._catalogues.clear()
+
+    def tearDown( self ):
+        allactive._get = self._get
+        allactive._catalogues.clear()
+
+    def get( self, url, timeout=None ):
+        '''
+        answer like DQSegDB without reports of active flags, except that one flag returns a broken response
+        '''
+        path = url[len(URL):].split('?')[0]
+        self.paths.append( path )
+        if path == '/report/active':
+            raise IOError( "HTTP Error 404: NOT FOUND" )
+        if path == '/dq':
+            return {'results':['H1']}
+        if path == '/dq/H1':
+            return {'results':['GOOD', 'BAD', 'QUIET']}
+        if path.count('/') == 3:
+            return {'version':[1]}
+        if path == '/dq/H1/BAD/1':
+            raise BadStatusLine( '' )
+        if path == '/dq/H1/GOOD/1':
+            return {'active':[[100, 110]]}
+        return {'active':[]}
+
+    def test_broken_response( self ):
+        '''
+        a flag that cannot be queried is counted as failed instead of failing the whole query
+        '''
+        ans = allactive.segdbActive( URL, 90, 120, workers=2, ttl=0 )
+        self.assertEqual( ans.flags, ['H1:GOOD:1'] )
+        self.assertEqual( ans.failed, ['H1:BAD:1'] )
+        self.assertEqual( ans.queried, 3 )
+        self.assertEqual( ans.flagged( 105 ), ['H1:GOOD:1'] )
+        self.assertEqual( self.paths[0], '/report/active' ) ### we only query each flag if there is no report
+
+    def test_catalogue_listed_outside_lock( self ):
+        '''
+        while one thread lists flags, everyone else gets the old catalogue instead of waiting
+        '''
+        catalogue = allactive.SegDbCatalogue( URL, ttl=0 )
+        self.assertEqual( catalogue.flags(), ['H1:GOOD:1', 'H1:BAD:1', 'H1:QUIET:1'] )
+
+        listing = threading.Event()
+        release = threading.Event()
+        def slow_list( timeout=None, verbose=False ):
+            listing.set()
+            release.wait( 5.0 )
+            return ['H1:NEW:1']
+        catalogue._list = slow_list
+
+        thread = threading.Thread( target=catalogue.flags )
+        thread.start()
+        try:
+            self.assertTrue( listing.wait( 5.0 ) )
+            t0 = time.time()
+            self.assertEqual( catalogue.flags(), ['H1:GOOD:1', 'H1:BAD:1', 'H1:QUIET:1'] )
+            self.assertTrue( time.time()-t0 < 1.0 )
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual( catalogue._flags, ['H1:NEW:1'] )
+
+class TestReportActive(unittest.TestCase):
+
+    def setUp( self ):
+        self.now = 1187009000
+        flags = ['H1:A:1', 'H1:B:1', 'L1:A:1']
+        self.server = fakes.FakeSegDbServer( lambda : self.now, data_latency=0.0, duty=0.5, flags=flags )
+
+    def tearDown( self ):
+        self.server.close()
+
+    def test_report( self ):
+        '''
+        every active flag comes from a single request, and agrees with querying each flag
+        '''
+        start, end = 1187008000, 1187008100
+        ans = allactive.segdbActive( self.server.url, start, end, include=['H1:*'] )
+        self.assertEqual( [flag for _, flag, _, _ in self.server.queries], ['report/active'] )
+        self.assertEqual( ans.flags, ['H1:A:1', 'H1:B:1'] )
+        self.assertEqual( ans.queried, 2 )
+
+        for flag, segs in ans:
+            expected = allactive._segs( fakes.syntheticSegments( flag, start, end, duty=0.5 ), segments.gps2ns( start ), segments.gps2ns( end ) )
+            self.assertEqual( segs.tolist(), expected.tolist() )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
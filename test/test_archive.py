@@ -0,0 +1,65 @@
+'''
+tests for segDb2grcDb.archive
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from segDb2grcDb import archive
+
+#-------------------------------------------------
+
+class TestArchiver(unittest.TestCase):
+
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def waitFor( self, condition, timeout=5.0 ):
+        timeout += time.time()
+        while not condition():
+            if time.time() > timeout:
+                return False
+            time.sleep( 0.01 )
+        return True
+
+    def test_expire_when_idle( self ):
+        '''
+        results are removed after retention even if nothing else is archived
+        '''
+        archiver = archive.Archiver( retention=0.2 )
+        try:
+            path = os.path.join(self.directory, "result.xml")
+            archiver.save( archive.Attachment( path, b"contents" ) )
+            self.assertTrue( self.waitFor( lambda : os.path.exists(path) ) )
+            self.assertTrue( self.waitFor( lambda : not os.path.exists(path) ) )
+            self.assertEqual( archiver.counts['expired'], 1 )
+        finally:
+            archiver.close()
+
+    def test_expire_on_close( self ):
+        '''
+        closing the archiver removes whatever has outlived retention
+        '''
+        archiver = archive.Archiver( retention=3600 )
+        path = os.path.join(self.directory, "result.xml")
+        archiver.save( archive.Attachment( path, b"contents" ) )
+        self.assertTrue( self.waitFor( lambda : os.path.exists(path) ) )
+
+        archiver.retention = 0
+        archiver.close()
+        self.assertFalse( os.path.exists(path) )
+        self.assertEqual( archiver.counts, {'archived':1, 'expired':1, 'failed':0} )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+'''
+tests for segDb2grcDb.cache
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from segDb2grcDb import segments
+from segDb2grcDb.cache import SegmentCache
+
+#-------------------------------------------------
+
+def segs( *pairs ):
+    return segments.asarray( [[segments.gps2ns(s), segments.gps2ns(e)] for s, e in pairs] )
+
+class TestSegmentCache(unittest.TestCase):
+
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def test_store( self ):
+        '''
+        new results are merged with what we had, replacing active segments within the new known segments
+        '''
+        cache = SegmentCache( self.directory )
+        cache.store( 'segdb', {'H1:A:1':(segs( (0, 10) ), segs( (2, 4) ))} )
+        cache.store( 'segdb', {'H1:A:1':(segs( (8, 20) ), segs( (9, 12) ))} )
+
+        known, active = cache.lookup( 'segdb', ['H1:A:1'], segments.gps2ns(0), segments.gps2ns(30) )['H1:A:1']
+        self.assertEqual( known.tolist(), segs( (0, 20) ).tolist() )
+        self.assertEqual( active.tolist(), segs( (2, 4), (9, 12) ).tolist() )
+
+        known, active = cache.lookup( 'dmt', ['H1:A:1'], segments.gps2ns(0), segments.gps2ns(30) )['H1:A:1']
+        self.assertEqual( len(known), 0 )
+
+    def test_no_lock_per_entry( self ):
+        '''
+        storing and evicting entries does not leave a lock file behind for each of them
+        '''
+        cache = SegmentCache( self.directory, max_age=-1 )
+        open(os.path.join(self.directory, 'old.npz.lock'), 'w').close() ### from an older version
+        for i in range(10):
+            cache.store( 'segdb', {'H1:FLAG-%d:1'%i:(segs( (0, 10) ), segs())} )
+        self.assertEqual( sorted(os.listdir( self.directory ))[:1], ['.lock'] )
+        self.assertEqual( len([name for name in os.listdir( self.directory ) if name.endswith('.npz')]), 10 )
+
+        self.assertEqual( cache.evict(), 10 )
+        self.assertEqual( os.listdir( self.directory ), ['.lock'] )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
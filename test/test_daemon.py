@@ -0,0 +1,225 @@
+'''
+tests for segDb2grcDb.daemon, talking to a SeglogicDaemon over its socket
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import sys
+import json
+import shutil
+import time
+import tempfile
+import threading
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from segDb2grcDb import daemon
+from segDb2grcDb import admission
+
+#-------------------------------------------------
+
+class TestSeglogicDaemon(unittest.TestCase):
+
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'seglogic.sock')
+        self.processed = []
+        self.done = threading.Event()
+
+        self.daemon = daemon.SeglogicDaemon( self.path, self.process, max_events=2 )
+        self.thread = threading.Thread( target=self.daemon.serve_forever )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown( self ):
+        if self.thread.is_alive():
+            self.daemon.shutdown()
+            self.thread.join()
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def process( self, graceid ):
+        if graceid == 'G0':
+            raise ValueError( "cannot process %s"%graceid )
+        self.processed.append( graceid )
+        if len(self.processed) == 2:
+            self.done.set()
+
+    def send( self, request ):
+        return daemon.send( self.path, request, timeout=5.0 )
+
+    #---
+
+    def test_requests( self ):
+        '''
+        alerts for new events and graceids are queued and processed, other alerts are ignored
+        '''
+        self.assertTrue( daemon.isAlive( self.path ) )
+
+        response = self.send( {'command':'alert', 'alert':json.dumps( {'alert_type':'new', 'uid':'G1'} )} )
+        self.assertEqual( (response['status'], response['graceid']), ('queued', 'G1') )
+
+        response = self.send( {'command':'alert', 'alert':{'alert_type':'update', 'uid':'G1'}} )
+        self.assertEqual( response['status'], 'ignored' )
+
+        response = self.send( {'command':'graceid', 'graceid':'G2'} )
+        self.assertEqual( (response['status'], response['graceid']), ('queued', 'G2') )
+
+        self.assertTrue( self.done.wait( 5.0 ) )
+        self.assertEqual( sorted(self.processed), ['G1', 'G2'] )
+
+        response = self.send( {'command':'unknown'} )
+        self.assertEqual( response['status'], 'error' )
+
+    def test_status( self ):
+        '''
+        status counts what happened to every event, including those that failed
+        '''
+        stderr = sys.stderr
+        sys.stderr = StringIO() ### the traceback is printed
+        try:
+            for graceid in ['G0', 'G1', 'G2']:
+                self.send( {'command':'graceid', 'graceid':graceid} )
+            self.send( {'command':'alert', 'alert':{'alert_type':'label', 'uid':'G1'}} )
+            self.assertTrue( self.done.wait( 5.0 ) )
+
+            self.assertEqual( self.send( {'command':'stop'} )['status'], 'stopping' )
+            self.thread.join( 5.0 )
+        finally:
+            sys.stderr = stderr
+        self.assertFalse( self.thread.is_alive() )
+        self.assertFalse( os.path.exists( self.path ) )
+
+        status = self.daemon.status()
+        self.assertEqual( [status[key] for key in ['received', 'ignored', 'processed', 'failed', 'queued']], [3, 1, 2, 1, 0] )
+
+    def test_one_daemon( self ):
+        '''
+        a second daemon refuses to listen on the same socket
+        '''
+        self.assertRaises( RuntimeError, daemon.SeglogicDaemon, self.path, self.process )
+
+class TestPriority(unittest.TestCase):
+
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'seglogic.sock')
+        self.processed = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def tearDown( self ):
+        self.release.set()
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def process( self, graceid ):
+        self.started.set()
+        self.release.wait( 5.0 ) ### hold on to the only worker until we have queued everything
+        self.processed.append( graceid )
+
+    def describe( self, graceid ):
+        return {'group':'Test' if graceid.startswith('T') else 'CBC'}
+
+    def run_daemon( self, policy, requests, describe=None ):
+        '''
+        process G0 and queue requests behind it, returning the responses
+        '''
+        seglogic = daemon.SeglogicDaemon( self.path, self.process, max_events=1, policy=policy, describe=describe or self.describe, max_lookups=1 )
+        thread = threading.Thread( target=seglogic.serve_forever )
+        thread.start()
+        try:
+            daemon.send( self.path, {'command':'graceid', 'graceid':'G0'}, timeout=5.0 )
+            self.assertTrue( self.started.wait( 5.0 ) )
+            responses = [daemon.send( self.path, request, timeout=5.0 ) for request in requests]
+            self.assertTrue( self.wait_for_lookups( seglogic ) )
+            self.status = seglogic.status()
+        finally:
+            self.release.set()
+            seglogic.shutdown()
+            thread.join()
+        return responses
+
+    def wait_for_lookups( self, seglogic, timeout=5.0 ):
+        deadline = time.time() + timeout
+        while seglogic.status()['describing'] and (time.time() < deadline):
+            time.sleep( 0.01 )
+        return not seglogic.status()['describing']
+
+    def test_order( self ):
+        '''
+        events are processed in order of priority, which comes from the alert or is looked up with describe
+        '''
+        policy = admission.AdmissionPolicy( rules=admission.parseRules( "Test/*/*:9 CBC/*/*:1" ), default_priority=5 )
+        responses = self.run_daemon( policy, [
+            {'command':'graceid', 'graceid':'T1'},
+            {'command':'alert', 'alert':{'alert_type':'new', 'uid':'G1', 'object':{'group':'Burst'}}},
+            {'command':'graceid', 'graceid':'G2'},
+            {'command':'graceid', 'graceid':'G3', 'event':{'group':'Test'}},
+        ] )
+        self.assertEqual( [(response['graceid'], response['status'], response['priority']) for response in responses], [('T1', 'accepted', None), ('G1', 'queued', 5), ('G2', 'accepted', None), ('G3', 'queued', 9)] )
+        self.assertEqual( [item['graceid'] for item in self.status['queue']], ['G2', 'G1', 'T1', 'G3'] )
+        self.assertEqual( self.processed, ['G0', 'G2', 'G1', 'T1', 'G3'] )
+
+    def test_shed( self ):
+        '''
+        unimportant events are shed once the queue grows, and the least urgent event makes room when it is full
+        '''
+        policy = admission.AdmissionPolicy( rules=admission.parseRules( "Test/*/*:9" ), max_queued=2, shed_priority=9, shed_depth=1 )
+        responses = self.run_daemon( policy, [
+            {'command':'graceid', 'graceid':'T1', 'event':{'group':'Test'}}, ### queued, since nothing is waiting
+            {'command':'graceid', 'graceid':'T2', 'event':{'group':'Test'}}, ### shed on arrival
+            {'command':'graceid', 'graceid':'G1', 'event':{'group':'CBC'}},
+            {'command':'graceid', 'graceid':'G2', 'event':{'group':'CBC'}}, ### the queue is full, so T1 is shed to make room
+            {'command':'graceid', 'graceid':'G3', 'event':{'group':'CBC'}}, ### as urgent as everything queued, so it is shed
+        ] )
+        self.assertEqual( [response['status'] for response in responses], ['queued', 'shed', 'queued', 'queued', 'shed'] )
+        self.assertEqual( self.processed, ['G0', 'G1', 'G2'] )
+        self.assertEqual( (self.status['received'], self.status['shed']), (6, 3) )
+
+    def test_slow_describe( self ):
+        '''
+        requests are answered right away while events are looked up, and events that were described by their alert do not wait for lookups
+        '''
+        looking = threading.Event()
+        answer = threading.Event()
+        def describe( graceid ):
+            looking.set()
+            answer.wait( 5.0 )
+            return self.describe( graceid )
+
+        policy = admission.AdmissionPolicy( rules=admission.parseRules( "Test/*/*:9 CBC/*/*:1" ) )
+        seglogic = daemon.SeglogicDaemon( self.path, self.process, max_events=1, policy=policy, describe=describe, max_lookups=1 )
+        thread = threading.Thread( target=seglogic.serve_forever )
+        thread.start()
+        try:
+            t0 = time.time()
+            response = daemon.send( self.path, {'command':'graceid', 'graceid':'G0'}, timeout=5.0 )
+            self.assertEqual( (response['status'], response['priority']), ('accepted', None) )
+            self.assertTrue( looking.wait( 5.0 ) )
+            response = daemon.send( self.path, {'command':'alert', 'alert':{'alert_type':'new', 'uid':'T1', 'object':{'group':'Test'}}}, timeout=5.0 )
+            self.assertEqual( (response['status'], response['priority']), ('queued', 9) )
+            self.assertTrue( time.time()-t0 < 1.0 )
+
+            self.assertTrue( self.started.wait( 5.0 ) ) ### T1 does not wait for G0 to be looked up
+            status = seglogic.status()
+            self.assertEqual( (status['received'], status['describing'], list(status['running'].keys())), (2, 1, ['T1']) )
+
+            answer.set()
+            self.assertTrue( self.wait_for_lookups( seglogic ) )
+            self.assertEqual( [item['graceid'] for item in seglogic.status()['queue']], ['G0'] )
+        finally:
+            answer.set()
+            self.release.set()
+            seglogic.shutdown()
+            thread.join()
+        self.assertEqual( self.processed, ['T1', 'G0'] )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
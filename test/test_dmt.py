@@ -0,0 +1,70 @@
+'''
+tests for segDb2grcDb.dmt
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from segDb2grcDb import dmt
+from segDb2grcDb import segxml
+from segDb2grcDb import segments
+
+#-------------------------------------------------
+
+FLAG = "H1:DMT-ANALYSIS_READY:1"
+
+class TestDMTIndex(unittest.TestCase):
+
+    def setUp( self ):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.root, ignore_errors=True )
+
+    def write( self, start, dur, active ):
+        '''
+        write a DMT file covering [start, start+dur) into the bucket in which it starts
+        '''
+        directory = os.path.join(self.root, "H1", "H-DQ_Segments-%05d"%(start//dmt.BUCKET))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, "H-DQ_Segments-%d-%d.xml"%(start, dur))
+        known = segments.asarray( [[segments.gps2ns(start), segments.gps2ns(start+dur)]] )
+        segxml.writeSegments( path, [(FLAG, known, segments.asarray( [[segments.gps2ns(s), segments.gps2ns(e)] for s, e in active] ))] )
+        return path
+
+    def test_straddles_bucket( self ):
+        '''
+        a file that starts in the previous bucket but runs across the start of the window is still read
+        '''
+        boundary = 12*dmt.BUCKET
+        before = self.write( boundary-32, 64, [(boundary-10, boundary+10)] )
+        after = self.write( boundary+32, 64, [] )
+
+        index = dmt.DMTIndex( self.root )
+        self.assertEqual( index.files( boundary+5, boundary+40 ), sorted([before, after]) )
+
+        known, active = index.query( [FLAG], boundary+5, boundary+40 )[FLAG]
+        self.assertEqual( segments.duration( known ), 35*segments.NS )
+        self.assertEqual( active.tolist(), [[segments.gps2ns(boundary+5), segments.gps2ns(boundary+10)]] )
+
+    def test_window_within_bucket( self ):
+        '''
+        files that end before the window starts are not read
+        '''
+        start = 12*dmt.BUCKET + 1000
+        self.write( start-64, 64, [] )
+        path = self.write( start, 64, [(start+1, start+2)] )
+
+        index = dmt.DMTIndex( self.root )
+        self.assertEqual( index.files( start+10, start+20 ), [path] )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
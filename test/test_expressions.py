@@ -0,0 +1,91 @@
+'''
+tests for segDb2grcDb.expressions
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import unittest
+
+from segDb2grcDb import segments
+from segDb2grcDb.expressions import Expression, ExpressionCollector
+
+#-------------------------------------------------
+
+FLAGS = ['H1:READY:1', 'H1:OVERFLOW:1', 'H1:INJ_BURST:2', 'H1:INJ_CBC:2']
+
+def segs( *pairs ):
+    return segments.asarray( [[segments.gps2ns(s), segments.gps2ns(e)] for s, e in pairs] )
+
+class TestExpression(unittest.TestCase):
+
+    def setUp( self ):
+        self.results = {
+            'H1:READY:1'     : (segs( (0, 100) ), segs( (0, 50), (60, 100) )),
+            'H1:OVERFLOW:1'  : (segs( (0, 80) ), segs( (10, 20) )),
+            'H1:INJ_BURST:2' : (segs( (0, 100) ), segs( (30, 40) )),
+            'H1:INJ_CBC:2'   : (segs( (20, 100) ), segs( (35, 70) )),
+        }
+
+    def evaluate( self, text ):
+        known, active = Expression( text, FLAGS ).evaluate( self.results )
+        return (known//segments.NS).tolist(), (active//segments.NS).tolist()
+
+    def test_parse( self ):
+        '''
+        NOT binds tighter than AND, which binds tighter than OR, and wildcards match every flag
+        '''
+        expression = Expression( "H1:READY:1 or not H1:OVERFLOW:1 AND H1:INJ_BURST:2", FLAGS )
+        self.assertEqual( expression.tree, ('OR', ('FLAG', 'H1:READY:1'), ('AND', ('NOT', ('FLAG', 'H1:OVERFLOW:1')), ('FLAG', 'H1:INJ_BURST:2'))) )
+        self.assertEqual( expression.flags, ['H1:INJ_BURST:2', 'H1:OVERFLOW:1', 'H1:READY:1'] )
+
+        expression = Expression( "NOT (H1:INJ_*:2)", FLAGS )
+        self.assertEqual( expression.tree, ('NOT', ('OR', ('FLAG', 'H1:INJ_BURST:2'), ('FLAG', 'H1:INJ_CBC:2'))) )
+
+    def test_errors( self ):
+        for text in ["", "H1:READY:1 AND", "(H1:READY:1", "H1:READY:1 )", "AND H1:READY:1", "H1:OTHER:1", "H1:READY:1 H1:OVERFLOW:1"]:
+            self.assertRaises( ValueError, Expression, text, FLAGS )
+
+    def test_evaluate( self ):
+        '''
+        the result is known where every flag is known and active where the expression is true
+        '''
+        self.assertEqual( self.evaluate( "H1:READY:1" ), ([[0, 100]], [[0, 50], [60, 100]]) )
+        self.assertEqual( self.evaluate( "H1:READY:1 AND NOT H1:OVERFLOW:1" ), ([[0, 80]], [[0, 10], [20, 50], [60, 80]]) )
+        self.assertEqual( self.evaluate( "NOT H1:OVERFLOW:1" ), ([[0, 80]], [[0, 10], [20, 80]]) )
+        self.assertEqual( self.evaluate( "H1:INJ_*:2" ), ([[20, 100]], [[30, 70]]) )
+        self.assertEqual( self.evaluate( "NOT (H1:READY:1 OR H1:INJ_BURST:2)" ), ([[0, 100]], [[50, 60]]) )
+
+class TestExpressionCollector(unittest.TestCase):
+
+    def test_collect( self ):
+        '''
+        expressions are evaluated within the overlap of their flags' windows as soon as every flag is in, or reported missing
+        '''
+        reported = []
+        missing = []
+        collector = ExpressionCollector(
+            {
+                'both' : Expression( "H1:READY:1 AND NOT H1:OVERFLOW:1", FLAGS ),
+                'inj'  : Expression( "H1:INJ_*:2", FLAGS ),
+                'late' : Expression( "H1:READY:1 OR H1:INJ_CBC:2", FLAGS ),
+            },
+            lambda name, expression, start, end, known, active: reported.append( (name, start, end, (known//segments.NS).tolist(), (active//segments.NS).tolist()) ),
+            lambda name, expression, flags: missing.append( (name, flags) ),
+        )
+
+        collector.add( ['H1:READY:1'], 0, 100, {'H1:READY:1':(segs( (0, 100) ), segs( (0, 50) ))} )
+        self.assertEqual( reported, [] )
+
+        collector.add( ['H1:OVERFLOW:1', 'H1:INJ_BURST:2'], 10, 110, {'H1:OVERFLOW:1':(segs( (0, 110) ), segs( (40, 45) ))} ) ### H1:INJ_BURST:2 failed
+        self.assertEqual( reported, [('both', 10, 100, [[10, 100]], [[10, 40], [45, 50]])] )
+        self.assertEqual( missing, [] ) ### still waiting for H1:INJ_CBC:2
+
+        collector.finish()
+        self.assertEqual( missing, [('inj', ['H1:INJ_BURST:2', 'H1:INJ_CBC:2']), ('late', ['H1:INJ_CBC:2'])] )
+        self.assertEqual( len(reported), 1 )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
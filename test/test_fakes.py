@@ -0,0 +1,128 @@
+'''
+tests for segDb2grcDb.fakes, talking to the local servers over http
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import json
+import unittest
+
+try:
+    from urllib2 import urlopen, Request, HTTPError
+except ImportError:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
+
+from segDb2grcDb import fakes
+from segDb2grcDb import segments
+
+#-------------------------------------------------
+
+def request( url, method='GET', body=None, content_type=None ):
+    '''
+    returns status, the decoded JSON response
+    '''
+    req = Request( url, data=body )
+    req.get_method = lambda : method
+    if content_type:
+        req.add_header( 'Content-Type', content_type )
+    try:
+        response = urlopen( req, timeout=5.0 )
+    except HTTPError as e:
+        return e.code, json.loads(e.read().decode('utf-8'))
+    return response.getcode(), json.loads(response.read().decode('utf-8'))
+
+class TestFakeGraceDbServer(unittest.TestCase):
+
+    def setUp( self ):
+        self.server = fakes.FakeGraceDbServer()
+        self.server.addEvent( 'G1', 1187008882.4 )
+
+    def tearDown( self ):
+        self.server.close()
+
+    def test_events( self ):
+        '''
+        events are described and listed, and each request about an event is recorded
+        '''
+        status, info = request( self.server.url )
+        self.assertEqual( status, 200 )
+        url = info['templates']['event-detail-template'].format(graceid='G1')
+
+        self.assertEqual( request( url ), (200, {'graceid':'G1', 'gpstime':1187008882.4, 'labels':[], 'links':{}}) )
+        self.assertEqual( request( info['templates']['event-detail-template'].format(graceid='G2') )[0], 404 )
+        self.assertEqual( [event['graceid'] for event in request( info['links']['events'] )[1]['events']], ['G1'] )
+        self.assertEqual( [(graceid, kind) for _, graceid, kind, _ in self.server.requests], [('G1', 'event')] )
+
+    def test_labels( self ):
+        '''
+        labels are applied once, no matter how often they are written
+        '''
+        url = self.server.url + 'events/G1/labels/'
+        for _ in range(2):
+            self.assertEqual( request( url+'DQV', method='PUT' ), (201, {'name':'DQV'}) )
+        self.assertEqual( request( url ), (200, {'labels':[{'name':'DQV'}]}) )
+        self.assertEqual( [detail for _, _, kind, detail in self.server.requests if kind=='label'], ['DQV', 'DQV'] )
+
+    def test_logs( self ):
+        '''
+        log messages and uploaded files are read from the bodies ligo.gracedb.rest.GraceDb sends
+        '''
+        url = self.server.url + 'events/G1/log/'
+        body = json.dumps( {'message':'began searching', 'tagname':'data_quality', 'displayName':None} ).encode('utf-8')
+        self.assertEqual( request( url, method='POST', body=body, content_type='application/json' ), (201, {'comment':'began searching', 'filename':'', 'tag_names':['data_quality']}) )
+
+        ### the same encoding as ligo.gracedb.rest.encode_multipart_formdata
+        boundary = b'----------ThIs_Is_tHe_bouNdaRY_$'
+        body = b'\r\n'.join( [
+            b'--'+boundary, b'Content-Disposition: form-data; name="message"', b'', b'segments',
+            b'--'+boundary, b'Content-Disposition: form-data; name="tagname"', b'', b'data_quality,sig',
+            b'--'+boundary, b'Content-Disposition: form-data; name="upload"; filename="H1-A-1.xml.gz"', b'Content-Type: application/octet-stream', b'', b'\x1f\x8b\x08\r\n',
+            b'--'+boundary+b'--', b'',
+        ] )
+        status, response = request( url, method='POST', body=body, content_type='multipart/form-data; boundary=%s'%boundary.decode('utf-8') )
+        self.assertEqual( (status, response), (201, {'comment':'segments', 'filename':'H1-A-1.xml.gz', 'tag_names':['data_quality', 'sig']}) )
+
+        self.assertEqual( request( url, method='POST', body=b'comment=old+client', content_type='application/x-www-form-urlencoded' )[1]['comment'], 'old client' )
+        self.assertEqual( request( url, method='POST', body=b'<xml/>', content_type='text/xml' )[0], 400 )
+
+        logs = [detail for _, _, kind, detail in self.server.requests if kind=='log']
+        self.assertEqual( logs, [('began searching', None), ('segments', 'H1-A-1.xml.gz'), ('old client', None)] )
+
+class TestFakeSegDbServer(unittest.TestCase):
+
+    def setUp( self ):
+        self.now = 1187009000
+        self.server = fakes.FakeSegDbServer( lambda : self.now, data_latency=10.0 )
+
+    def tearDown( self ):
+        self.server.close()
+
+    def test_query( self ):
+        '''
+        flags are known up to data_latency before clock() and have syntheticSegments
+        '''
+        status, response = request( self.server.url + '/dq/H1/FLAG/1?s=1187008000&e=1187009100' )
+        self.assertEqual( status, 200 )
+        self.assertEqual( response['known'], [[1187008000, 1187008990]] )
+        self.assertEqual( response['active'], [seg for seg in fakes.syntheticSegments( 'H1:FLAG:1', 1187008000, 1187008990 )] )
+        self.assertEqual( [flag for _, flag, _, _ in self.server.queries], ['H1:FLAG:1'] )
+
+        status, response = request( self.server.url + '/dq/H1/FLAG/1?s=1187008995&e=1187009100' )
+        self.assertEqual( response['known'], [] )
+        self.assertEqual( request( self.server.url + '/other' )[0], 404 )
+
+    def test_synthetic( self ):
+        '''
+        the same times always give the same segments, however they are requested
+        '''
+        whole = fakes.syntheticSegments( 'H1:FLAG:1', 0, 1000 )
+        parts = fakes.syntheticSegments( 'H1:FLAG:1', 0, 500 ) + fakes.syntheticSegments( 'H1:FLAG:1', 500, 1000 )
+        self.assertEqual( segments.coalesce( whole ).tolist(), segments.coalesce( parts ).tolist() )
+        self.assertTrue( len(whole) > 0 )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
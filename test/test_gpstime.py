@@ -0,0 +1,61 @@
+'''
+tests for segDb2grcDb.gpstime
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import time
+import calendar
+import unittest
+
+from segDb2grcDb import gpstime
+
+#-------------------------------------------------
+
+class TestGPSTime(unittest.TestCase):
+
+    def test_epoch( self ):
+        self.assertEqual( gpstime.unix2gps( gpstime.GPS_EPOCH ), 0 )
+        self.assertEqual( gpstime.gps2unix( 0 ), gpstime.GPS_EPOCH )
+
+    def test_known( self ):
+        '''
+        GW170817 happened at 2017-08-17 12:41:04.4 UTC
+        '''
+        unix = calendar.timegm( (2017, 8, 17, 12, 41, 4) ) + 0.4
+        self.assertAlmostEqual( gpstime.unix2gps( unix ), 1187008882.4, 6 )
+        self.assertAlmostEqual( gpstime.gps2unix( 1187008882.4 ), unix, 6 )
+
+    def test_leap_seconds( self ):
+        '''
+        leap seconds count from the start of the day after they were inserted, and conversions agree on either side of them
+        '''
+        new_year = calendar.timegm( (2017, 1, 1, 0, 0, 0) )
+        self.assertEqual( gpstime.leapSeconds( new_year-1 ), 17 )
+        self.assertEqual( gpstime.leapSeconds( new_year ), 18 )
+        self.assertEqual( gpstime.leapSeconds( gpstime.GPS_EPOCH ), 0 )
+        self.assertEqual( gpstime.leapSeconds( calendar.timegm( (1981, 7, 1, 0, 0, 0) ) ), 1 )
+
+        self.assertEqual( gpstime.unix2gps( new_year ) - gpstime.unix2gps( new_year-1 ), 2 ) ### the leap second itself
+        self.assertEqual( gpstime.gps2unix( gpstime.unix2gps( new_year ) - 1 ), new_year ) ### 23:59:60 has no unix time of its own
+
+        for year, month, day in gpstime.LEAP_SECONDS:
+            leap = calendar.timegm( (year, month, day, 0, 0, 0) )
+            for unix in [leap-86400, leap-1, leap, leap+1, leap+0.5, leap+86400]:
+                self.assertEqual( gpstime.gps2unix( gpstime.unix2gps( unix ) ), unix )
+
+    def test_now( self ):
+        '''
+        the clock agrees with time.time
+        '''
+        before = time.time()
+        now = gpstime.gps_time_now()
+        after = time.time()
+        self.assertTrue( gpstime.unix2gps( before ) <= now <= gpstime.unix2gps( after ) )
+        self.assertTrue( now > 1187008882 )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
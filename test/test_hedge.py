@@ -0,0 +1,103 @@
+'''
+tests for segDb2grcDb.hedge
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import time
+import unittest
+
+from segDb2grcDb import segments
+from segDb2grcDb.hedge import Hedge, coverage
+from segDb2grcDb.query import QueryError
+
+#-------------------------------------------------
+
+FLAGS = ['H1:A:1', 'H1:B:1']
+
+def segs( *pairs ):
+    return segments.asarray( [[segments.gps2ns(s), segments.gps2ns(e)] for s, e in pairs] )
+
+class TestHedge(unittest.TestCase):
+
+    def setUp( self ):
+        self.calls = [] ### (name, whether it was cancelled)
+
+    def source( self, name, delay=0.0, known_end=100, fail=False, timeout=None ):
+        '''
+        a source that answers after delay seconds (unless it is cancelled first) knowing [0, known_end] for every flag
+        '''
+        def fetch( start, end, cancel ):
+            cancelled = cancel.wait( delay ) if (cancel is not None) and delay else False
+            self.calls.append( (name, bool(cancelled)) )
+            if fail:
+                raise QueryError( "%s failed"%name )
+            return name, dict((flag, (segs( (0, known_end) ), segs())) for flag in FLAGS)
+        return (name, fetch, timeout)
+
+    def test_coverage( self ):
+        results = {'H1:A:1':(segs( (0, 50) ), segs())}
+        self.assertEqual( coverage( results, FLAGS, 0, 100 ), 0.5 )
+        self.assertEqual( coverage( results, FLAGS, 0, 0 ), 2.0 )
+
+    def test_primary( self ):
+        '''
+        a complete answer within the budget means we never ask the secondary
+        '''
+        hedge = Hedge( [self.source( 'dmt', delay=0.05 ), self.source( 'segdb' )], FLAGS, budget=1.0 )
+        self.assertEqual( hedge( 0, 100 )[::2], ('dmt', 'dmt') )
+        self.assertEqual( self.calls, [('dmt', False)] )
+
+    def test_hedge( self ):
+        '''
+        the secondary is asked once the budget expires, and the primary is cancelled when the secondary wins
+        '''
+        hedge = Hedge( [self.source( 'dmt', delay=5.0 ), self.source( 'segdb', delay=0.05 )], FLAGS, budget=0.1 )
+        t0 = time.time()
+        self.assertEqual( hedge( 0, 100 )[::2], ('segdb', 'segdb') ) ### the winner is reported along with its answer
+        self.assertTrue( 0.1 <= time.time()-t0 < 1.0 )
+        time.sleep( 0.05 ) ### let the cancelled primary finish
+        self.assertEqual( sorted(self.calls), [('dmt', True), ('segdb', False)] )
+
+    def test_failure( self ):
+        '''
+        a failed or incomplete answer means we ask the next source right away, and the most complete answer is used if nobody knows everything
+        '''
+        hedge = Hedge( [self.source( 'dmt', fail=True ), self.source( 'segdb' )], FLAGS, budget=10.0 )
+        t0 = time.time()
+        self.assertEqual( hedge( 0, 100 )[0], 'segdb' )
+        self.assertTrue( time.time()-t0 < 1.0 )
+
+        hedge = Hedge( [self.source( 'dmt', known_end=80 ), self.source( 'segdb', known_end=50 )], FLAGS, budget=10.0 )
+        self.assertEqual( hedge( 0, 100 )[::2], ('dmt', 'dmt') )
+
+        hedge = Hedge( [self.source( 'dmt', fail=True ), self.source( 'segdb', fail=True )], FLAGS, budget=10.0 )
+        self.assertRaises( QueryError, hedge, 0, 100 )
+
+    def test_timeout( self ):
+        '''
+        we stop waiting on a source after its timeout
+        '''
+        hedge = Hedge( [self.source( 'dmt', delay=5.0, timeout=0.1 ), self.source( 'segdb', delay=5.0, timeout=0.1 )], FLAGS, budget=10.0 )
+        t0 = time.time()
+        try:
+            hedge( 0, 100 )
+        except QueryError as e:
+            self.assertTrue( 'timed out' in str(e) )
+        else:
+            self.fail( "expected QueryError" )
+        self.assertTrue( time.time()-t0 < 1.0 )
+
+    def test_single( self ):
+        '''
+        a single source is called directly
+        '''
+        hedge = Hedge( [self.source( 'segdb' )], FLAGS )
+        self.assertEqual( hedge( 0, 100 )[::2], ('segdb', 'segdb') )
+        self.assertRaises( ValueError, Hedge, [], FLAGS )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+'''
+tests for segDb2grcDb.metrics
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from segDb2grcDb import metrics
+from segDb2grcDb.fakes import FakeGraceDb
+
+#-------------------------------------------------
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+        self.jsonl = os.path.join(self.directory, 'seglogic.jsonl')
+        self.textfile = os.path.join(self.directory, 'seglogic.prom')
+
+    def tearDown( self ):
+        metrics.close()
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def read( self ):
+        return [json.loads(line) for line in open(self.jsonl)]
+
+    def test_disabled( self ):
+        '''
+        nothing is recorded until we are told where to put it
+        '''
+        m = metrics.Metrics()
+        with m.timer( 'query', flag='H1:A:1' ):
+            pass
+        self.assertFalse( m.enabled )
+        self.assertEqual( m.prometheus().count( '_count{' ), 0 )
+
+    def test_context( self ):
+        '''
+        tags from context apply to measurements made by the same thread, and failures are tagged as errors
+        '''
+        m = metrics.configure( jsonl=self.jsonl )
+        with metrics.context( graceid='G1', flag='H1:A:1' ):
+            with metrics.timer( 'query', source='segdb' ):
+                pass
+            with metrics.context( flag='H1:B:1' ):
+                metrics.record( 'parse', 0.5 )
+
+            thread = threading.Thread( target=metrics.record, args=('other', 1.0) ) ### other threads do not share our tags
+            thread.start()
+            thread.join()
+
+            try:
+                with metrics.timer( 'upload' ):
+                    raise ValueError( "fail" )
+            except ValueError:
+                pass
+        m.close()
+
+        records = self.read()
+        self.assertEqual( [(r['stage'], r.get('graceid'), r.get('flag'), r.get('source')) for r in records], [
+            ('query', 'G1', 'H1:A:1', 'segdb'),
+            ('parse', 'G1', 'H1:B:1', None),
+            ('other', None, None, None),
+            ('upload', 'G1', 'H1:A:1', None),
+        ] )
+        self.assertEqual( records[1]['seconds'], 0.5 )
+        self.assertTrue( records[3]['error'] )
+        self.assertEqual( records[3]['pid'], os.getpid() )
+
+    def test_prometheus( self ):
+        '''
+        measurements are summarized by stage, flag and source but not graceid
+        '''
+        m = metrics.configure( textfile=self.textfile )
+        for graceid, seconds in [('G1', 1.0), ('G2', 3.0)]:
+            metrics.record( 'query', seconds, graceid=graceid, flag='H1:A:1' )
+        metrics.record( 'upload', 0.25, label='say "hi"' )
+        metrics.flush()
+
+        lines = open(self.textfile).read().splitlines()
+        self.assertTrue( 'seglogic_stage_seconds_count{stage="query",flag="H1:A:1"} 2' in lines )
+        self.assertTrue( 'seglogic_stage_seconds_sum{stage="query",flag="H1:A:1"} 4.000000' in lines )
+        self.assertTrue( 'seglogic_stage_seconds_max{stage="query",flag="H1:A:1"} 3.000000' in lines )
+        self.assertTrue( 'seglogic_stage_seconds_count{stage="upload"} 1' in lines )
+        self.assertFalse( 'G1' in m.prometheus() )
+        self.assertEqual( os.listdir( self.directory ), ['seglogic.prom'] )
+
+    def test_gracedb( self ):
+        '''
+        TimedGraceDb times requests and passes everything else through
+        '''
+        metrics.configure( jsonl=self.jsonl )
+        gracedb = metrics.TimedGraceDb( FakeGraceDb( {'G1':1.0} ) )
+        self.assertEqual( gracedb.event( 'G1' ).json()['gpstime'], 1.0 )
+        gracedb.writeLog( 'G1', 'hello', tagname=['dq'] )
+        gracedb.writeLabel( 'G1', 'DQV' )
+        self.assertEqual( gracedb.logs, [('G1', 'hello', None, ['dq'])] )
+        metrics.close()
+
+        self.assertEqual( [(r['stage'], r['graceid']) for r in self.read()], [('event', 'G1'), ('writeLog', 'G1'), ('writeLabel', 'G1')] )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+'''
+tests for segDb2grcDb.plan
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from segDb2grcDb import plan
+
+#-------------------------------------------------
+
+CONFIG = '''\
+[general]
+flags = H1:A:1 H1:B:1 H1:C:1 L1:A:1
+vetoDefiners = VDEF
+expressions = EXPR
+allActive = True
+max-workers = 4
+native-dmt = True
+
+[H1:A:1]
+look_left = 10
+look_right = 20
+wait = 5
+dmt = /dmt
+
+[H1:B:1]
+look_left = 10
+look_right = 20
+wait = 5
+dmt = /dmt
+extra_tags = sig em
+extra_queryTags = query
+activeLabels = DQV
+flaggedLabels = DQV INJ
+vicinity = 2.5
+
+[H1:C:1]
+look_left = 10
+look_right = 20
+wait = 5
+
+[L1:A:1]
+look_left = 10
+look_right = 20.5
+wait = 5
+
+[VDEF]
+look_left = 1
+look_right = 2
+wait = 3
+path = /path/to/VDEF.xml
+cumulative = True
+
+[EXPR]
+expression = H1:A:1 AND NOT H1:B:1
+unflaggedLabels = ADVOK
+
+[allActive]
+look_left = 1
+look_right = 2
+wait = 3
+flags = H1:*
+humanReadable = True
+catalogue-ttl = 60
+'''
+
+def parse( text ):
+    config = plan.SafeConfigParser()
+    config.readfp( StringIO( text ) )
+    return config
+
+class TestQueryPlan(unittest.TestCase):
+
+    def test_sections( self ):
+        '''
+        options are converted to the right types once
+        '''
+        queryplan = plan.QueryPlan( parse( CONFIG ) )
+        self.assertEqual( queryplan.flags, ['H1:A:1', 'H1:B:1', 'H1:C:1', 'L1:A:1'] )
+        self.assertEqual( queryplan.max_workers, 4 )
+        self.assertTrue( queryplan.native_dmt )
+        self.assertEqual( (queryplan.poll_interval, queryplan.allActive), (0, True) )
+        self.assertEqual( sorted(queryplan.sections.keys()), ['EXPR', 'H1:A:1', 'H1:B:1', 'H1:C:1', 'L1:A:1', 'VDEF', 'allActive'] )
+
+        section = queryplan.sections['H1:B:1']
+        self.assertEqual( (section.look_left, section.look_right, section.wait, section.dmt), (10.0, 20.0, 5.0, '/dmt') )
+        self.assertEqual( (section.extra_tags, section.extra_queryTags), (['sig', 'em'], ['query']) )
+        self.assertEqual( queryplan.sections['H1:C:1'].dmt, None )
+
+        ### the window is rounded like segDb2grcDb.query.queryWindow
+        self.assertEqual( queryplan.sections['L1:A:1'].window( 100 ), (121, 126) )
+        self.assertEqual( queryplan.sections['H1:A:1'].window( 100.5 ), (121, 126) )
+
+    def test_options( self ):
+        '''
+        labels and the options for veto definers, expressions and allActive are read once, with defaults for anything that is missing
+        '''
+        queryplan = plan.QueryPlan( parse( CONFIG ) )
+
+        section = queryplan.sections['H1:B:1']
+        self.assertEqual( (section.activeLabels, section.inactiveLabels, section.flaggedLabels, section.unflaggedLabels), (['DQV'], [], ['DQV', 'INJ'], []) )
+        self.assertEqual( section.vicinity, 2.5 )
+        self.assertEqual( queryplan.sections['H1:A:1'].vicinity, None )
+
+        section = queryplan.sections['VDEF']
+        self.assertEqual( (section.path, section.cumulative), ('/path/to/VDEF.xml', True) )
+
+        section = queryplan.sections['EXPR']
+        self.assertEqual( (section.look_left, section.look_right, section.wait), (None, None, None) )
+        self.assertEqual( (section.unflaggedLabels, section.extra_queryTags), (['ADVOK'], []) )
+
+        section = queryplan.sections['allActive']
+        self.assertEqual( (section.include, section.humanReadable, section.max_workers, section.catalogue_ttl), (['H1:*'], True, 8, 60.0) )
+
+    def test_gracedbUrl( self ):
+        '''
+        the GraceDb url may be spelled gracedb-url or gracedb_url
+        '''
+        self.assertEqual( plan.gracedbUrl( parse( "[general]\ngracedb-url = https://a/api/\n" ) ), "https://a/api/" )
+        self.assertEqual( plan.gracedbUrl( parse( "[general]\ngracedb_url = https://b/api/\n" ) ), "https://b/api/" )
+        self.assertEqual( plan.gracedbUrl( parse( "[general]\nflags = H1:A:1\n" ) ), None )
+
+    def test_groups( self ):
+        '''
+        flags from the same IFO and source with the same window are only grouped when batching
+        '''
+        config = parse( CONFIG )
+        queryplan = plan.QueryPlan( config )
+        self.assertEqual( [flags for _, flags in queryplan.groups], [['H1:A:1'], ['H1:B:1'], ['H1:C:1'], ['L1:A:1']] )
+
+        queryplan = plan.QueryPlan( config, batch_queries=True )
+        self.assertEqual( [flags for _, flags in queryplan.groups], [['H1:C:1'], ['H1:A:1', 'H1:B:1'], ['L1:A:1']] )
+        self.assertEqual( [queryplan.sections[flags[0]].groupName() for _, flags in queryplan.groups], ['H1-SEGDB-10-20-5', 'H1-DMT-10-20-5', 'L1-SEGDB-10-20-5'] )
+
+        config.set( 'general', 'batch-queries', 'True' )
+        self.assertEqual( len(plan.QueryPlan( config ).groups), 3 )
+        self.assertEqual( len(plan.QueryPlan( config, batch_queries=False ).groups), 4 )
+
+    def test_loadPlan( self ):
+        '''
+        plans are only recompiled when the config file changes
+        '''
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'seglogic.ini')
+            with open(path, 'w') as file_obj:
+                file_obj.write( CONFIG )
+            queryplan = plan.loadPlan( path )
+            self.assertTrue( plan.loadPlan( path ) is queryplan )
+
+            with open(path, 'w') as file_obj:
+                file_obj.write( CONFIG.replace( 'max-workers = 4', 'max-workers = 2' ) )
+            os.utime( path, (time.time()+10, time.time()+10) )
+            self.assertEqual( plan.loadPlan( path ).max_workers, 2 )
+        finally:
+            shutil.rmtree( directory, ignore_errors=True )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
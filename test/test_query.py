@@ -0,0 +1,79 @@
+'''
+tests for segDb2grcDb.query
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import shutil
+import tempfile
+import unittest
+
+from segDb2grcDb import query
+from segDb2grcDb import segments
+from segDb2grcDb.cache import SegmentCache
+
+#-------------------------------------------------
+
+class TestQuery(unittest.TestCase):
+
+    def test_queryWindow( self ):
+        '''
+        windows are rounded outward to integer seconds
+        '''
+        self.assertEqual( query.queryWindow( 1000.5, 10, 20 ), (990, 1021, 31) )
+        self.assertEqual( query.queryWindow( 1000, 10, 20 ), (990, 1020, 30) )
+        self.assertEqual( query.queryWindow( 1000.5, 0.5, 0.5 ), (1000, 1001, 1) )
+
+    def test_flag2filename( self ):
+        self.assertEqual( query.flag2filename( "H1:DMT-ANALYSIS_READY:1", 990, 30, output_dir="out" ), "out/H1-DMT_ANALYSIS_READY_1-990-30.xml.gz" )
+
+    def test_mergeWindows( self ):
+        '''
+        every window ends up within a single span, and spans only grow up to max_span
+        '''
+        windows = [(100, 110), (0, 10), (5, 20), (25, 30), (108, 109), (300, 500)]
+        self.assertEqual( query.mergeWindows( windows ), [(0, 20), (25, 30), (100, 110), (300, 500)] )
+        self.assertEqual( query.mergeWindows( windows, gap=5 ), [(0, 30), (100, 110), (300, 500)] )
+        self.assertEqual( query.mergeWindows( windows, gap=100 ), [(0, 110), (300, 500)] )
+        self.assertEqual( query.mergeWindows( windows, gap=100, max_span=50 ), [(0, 30), (100, 110), (300, 500)] ) ### a single window may be longer than max_span
+        self.assertEqual( query.mergeWindows( [] ), [] )
+
+        spans = query.mergeWindows( windows, gap=100, max_span=50 )
+        for start, end in windows:
+            self.assertEqual( sum(1 for s, e in spans if s <= start and end <= e), 1 )
+
+    def test_allKnown( self ):
+        '''
+        flags that are missing from the results are not known
+        '''
+        known = segments.asarray( [[segments.gps2ns( 0 ), segments.gps2ns( 30 )]] )
+        results = {'H1:A:1':(known, segments.asarray( [] ))}
+        self.assertTrue( query.allKnown( results, ['H1:A:1'], 30 ) )
+        self.assertFalse( query.allKnown( results, ['H1:A:1'], 31 ) )
+        self.assertFalse( query.allKnown( results, ['H1:A:1', 'H1:B:1'], 30 ) )
+        self.assertFalse( query.allKnown( {}, ['H1:A:1'], 30 ) )
+
+    def test_fetchSegments_source( self ):
+        '''
+        results are cached under the source that answered, which a fetch may report instead of the source we asked
+        '''
+        directory = tempfile.mkdtemp()
+        try:
+            cache = SegmentCache( directory )
+            known = segments.asarray( [[segments.gps2ns( 0 ), segments.gps2ns( 100 )]] )
+            fetch = lambda start, end: (None, {'H1:A:1':(known, segments.asarray( [] ))}, 'https://segments.example.org')
+
+            _, results, origin = query.fetchSegments( fetch, ['H1:A:1'], 0, 100, cache=cache, source='/dmt' )
+            self.assertEqual( (origin, results['H1:A:1'][0].tolist()), ('query', known.tolist()) )
+            self.assertEqual( len(cache.lookup( '/dmt', ['H1:A:1'], 0, segments.gps2ns( 100 ) )['H1:A:1'][0]), 0 )
+            self.assertEqual( cache.lookup( 'https://segments.example.org', ['H1:A:1'], 0, segments.gps2ns( 100 ) )['H1:A:1'][0].tolist(), known.tolist() )
+
+            self.assertEqual( query.fetchSegments( fetch, ['H1:A:1'], 0, 100 )[2], 'query' )
+        finally:
+            shutil.rmtree( directory, ignore_errors=True )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+'''
+tests for segDb2grcDb.schedule
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import sys
+import time
+import threading
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from segDb2grcDb.schedule import DeadlineScheduler
+
+#-------------------------------------------------
+
+class TestDeadlineScheduler(unittest.TestCase):
+
+    def test_order( self ):
+        '''
+        jobs are launched in order of their deadlines, not the order in which they were submitted
+        '''
+        now = time.time()
+        order = []
+        scheduler = DeadlineScheduler( max_workers=1 )
+        for deadline, name in [(now+0.2, 'c'), (now+0.1, 'b'), (now-1, 'a'), (now+0.1, 'b2')]:
+            scheduler.submit( deadline, order.append, name )
+        scheduler.join()
+        self.assertEqual( order, ['a', 'b', 'b2', 'c'] ) ### ties are launched in the order they were submitted
+
+    def test_deadline( self ):
+        '''
+        no job is launched before its deadline
+        '''
+        launched = []
+        scheduler = DeadlineScheduler( max_workers=2 )
+        deadline = time.time() + 0.2
+        scheduler.submit( deadline, lambda : launched.append( time.time() ) )
+        self.assertEqual( len(scheduler), 1 )
+        scheduler.join()
+        self.assertEqual( len(scheduler), 0 )
+        self.assertTrue( launched[0] >= deadline )
+
+    def test_max_workers( self ):
+        '''
+        at most max_workers jobs run at the same time
+        '''
+        lock = threading.Lock()
+        state = {'running':0, 'most':0}
+        def job():
+            with lock:
+                state['running'] += 1
+                state['most'] = max(state['most'], state['running'])
+            time.sleep( 0.05 )
+            with lock:
+                state['running'] -= 1
+
+        scheduler = DeadlineScheduler( max_workers=3 )
+        for i in range(10):
+            scheduler.submit( 0, job )
+        scheduler.join()
+        self.assertEqual( state['most'], 3 )
+
+    def test_clock( self ):
+        '''
+        deadlines are measured with the clock we supply
+        '''
+        launched = []
+        scheduler = DeadlineScheduler( clock=lambda : time.time() - 1000 ) ### as if it were 1000 sec ago
+        t0 = time.time()
+        scheduler.submit( t0 - 999.8, lambda : launched.append( ('late', time.time()) ) ) ### 0.2 sec from now by our clock
+        scheduler.submit( t0 - 1500, lambda : launched.append( ('early', time.time()) ) )
+        scheduler.join()
+        self.assertEqual( [name for name, _ in launched], ['early', 'late'] )
+        self.assertTrue( launched[0][1] - t0 < 0.1 )
+        self.assertTrue( launched[1][1] - t0 >= 0.19 )
+
+    def test_errors( self ):
+        '''
+        a job that raises is recorded in errors without stopping the others
+        '''
+        def fail():
+            raise ValueError( "fail" )
+        order = []
+        scheduler = DeadlineScheduler()
+        scheduler.submit( 0, fail )
+        scheduler.submit( 1, order.append, 'after' )
+
+        stderr = sys.stderr
+        sys.stderr = StringIO() ### the traceback is printed
+        try:
+            scheduler.join()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual( order, ['after'] )
+        self.assertEqual( [name for name, _ in scheduler.errors], ['fail'] )
+        self.assertTrue( scheduler.errors[0][1][0] is ValueError )
+
+    def test_poll( self ):
+        '''
+        polled jobs run again every interval until they return something other than False, but not after stop
+        '''
+        calls = []
+        def job( n ):
+            calls.append( time.time() )
+            return False if len(calls) < n else True
+
+        now = time.time()
+        scheduler = DeadlineScheduler()
+        scheduler.poll( now, now+10, 0.05, job, 3 )
+        scheduler.join() ### polled jobs may reschedule themselves after join
+        self.assertEqual( len(calls), 3 )
+        self.assertTrue( calls[2] - calls[0] >= 0.1 )
+
+        del calls[:]
+        now = time.time()
+        scheduler = DeadlineScheduler()
+        scheduler.poll( now, now+0.2, 0.05, job, 100 )
+        scheduler.join()
+        self.assertTrue( 2 <= len(calls) < 10 )
+        self.assertTrue( calls[-1] - now < 0.3 )
+
+    def test_poll_errors( self ):
+        '''
+        errors from polled jobs are reported under the name of the function we polled
+        '''
+        def fail():
+            raise ValueError( "fail" )
+        scheduler = DeadlineScheduler()
+        scheduler.poll( 0, 1, 0.1, fail )
+
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            scheduler.join()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual( [name for name, _ in scheduler.errors], ['fail'] )
+
+    def test_join( self ):
+        '''
+        jobs cannot be submitted after join
+        '''
+        scheduler = DeadlineScheduler()
+        scheduler.join()
+        self.assertRaises( RuntimeError, scheduler.submit, 0, len, [] )
+        self.assertRaises( ValueError, DeadlineScheduler, max_workers=0 )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+'''
+tests for segDb2grcDb.segments
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import unittest
+
+import numpy as np
+
+from segDb2grcDb import segments
+
+#-------------------------------------------------
+
+def points( segs ):
+    '''
+    the integers covered by segs, treating each segment as [start, end)
+    '''
+    ans = set()
+    for start, end in segs:
+        ans.update( range(start, end) )
+    return ans
+
+def randomSegments( rng, n, span=100 ):
+    starts = rng.randint( 0, span, n )
+    return segments.asarray( np.transpose([starts, starts+rng.randint( 0, 10, n )]) )
+
+class TestSegments(unittest.TestCase):
+
+    def test_gps2ns( self ):
+        '''
+        times are converted to integer nanoseconds exactly
+        '''
+        self.assertEqual( segments.gps2ns( 1187008882, 400000000 ), 1187008882400000000 )
+        self.assertEqual( segments.gps2ns( 1187008882.4 ), 1187008882400000000 )
+        self.assertEqual( segments.ns2gps( 1187008882500000000 ), 1187008882.5 )
+        self.assertEqual( segments.asarray( [] ).shape, (0, 2) )
+
+    def test_coalesce( self ):
+        '''
+        overlapping and touching segments are merged and empty segments are dropped
+        '''
+        segs = segments.asarray( [[10, 20], [0, 5], [5, 6], [12, 15], [30, 30], [18, 25], [40, 50]] )
+        self.assertEqual( segments.coalesce( segs ).tolist(), [[0, 6], [10, 25], [40, 50]] )
+        self.assertEqual( segments.coalesce( [] ).tolist(), [] )
+
+        rng = np.random.RandomState( 0 )
+        for _ in range(20):
+            segs = randomSegments( rng, 20 )
+            ans = segments.coalesce( segs )
+            self.assertEqual( points( ans ), points( segs ) )
+            self.assertTrue( np.all(ans[1:,0] > ans[:-1,1]) )
+
+    def test_clip( self ):
+        '''
+        segments are restricted to a window
+        '''
+        segs = segments.asarray( [[0, 10], [20, 30], [40, 50]] )
+        self.assertEqual( segments.clip( segs, 5, 45 ).tolist(), [[5, 10], [20, 30], [40, 45]] )
+        self.assertEqual( segments.clip( segs, 10, 20 ).tolist(), [] )
+
+    def test_duration_count( self ):
+        '''
+        durations add up segments and count includes end points
+        '''
+        segs = segments.asarray( [[0, 10], [5, 20], [30, 40]] )
+        self.assertEqual( segments.duration( segs ), 35 )
+        self.assertEqual( [segments.count( segs, t ) for t in [0, 7, 10, 25, 40, 41]], [1, 2, 2, 0, 1, 0] )
+
+    def test_algebra( self ):
+        '''
+        union, intersection and difference agree with the same operations on the times covered
+        '''
+        rng = np.random.RandomState( 1 )
+        for n in [0, 1, 5, 20]:
+            a = randomSegments( rng, n )
+            b = randomSegments( rng, 10 )
+            self.assertEqual( points( segments.union( a, b ) ), points( a ) | points( b ) )
+            self.assertEqual( points( segments.intersection( a, b ) ), points( a ) & points( b ) )
+            self.assertEqual( points( segments.difference( a, b ) ), points( a ) - points( b ) )
+            self.assertEqual( points( segments.difference( b, a ) ), points( b ) - points( a ) )
+
+    def test_slices( self ):
+        '''
+        slices matches clip for every window
+        '''
+        rng = np.random.RandomState( 2 )
+        segs = segments.coalesce( randomSegments( rng, 30, span=1000 ) )
+        starts = rng.randint( 0, 1000, 50 )
+        ends = starts + rng.randint( 0, 100, 50 )
+        for ans, start, end in zip(segments.slices( segs, starts, ends ), starts, ends):
+            self.assertEqual( ans.tolist(), segments.clip( segs, start, end ).tolist() )
+
+    def test_complement( self ):
+        '''
+        the complement covers the known times that are not active
+        '''
+        known = segments.asarray( [[0, 100], [200, 300]] )
+        active = segments.asarray( [[50, 60], [90, 210]] )
+        self.assertEqual( segments.complement( active, known ).tolist(), [[0, 50], [60, 90], [210, 300]] )
+        self.assertEqual( segments.complement( [], known ).tolist(), known.tolist() )
+
+#-------------------------------------------------
+
+class TestSortedSegments(unittest.TestCase):
+
+    def setUp( self ):
+        rng = np.random.RandomState( 3 )
+        self.segs = randomSegments( rng, 50, span=1000 )
+        self.times = np.arange( -10, 1020 )
+
+    def test_contains( self ):
+        '''
+        contains matches count for arrays and single times
+        '''
+        index = segments.SortedSegments( self.segs )
+        expected = [segments.count( segments.coalesce( self.segs ), t ) > 0 for t in self.times]
+        self.assertEqual( index.contains( self.times ).tolist(), expected )
+        self.assertEqual( segments.contains( self.segs, self.times ).tolist(), expected )
+        self.assertEqual( index.contains( self.times[20] ), expected[20] )
+        self.assertEqual( segments.SortedSegments( [] ).contains( self.times ).tolist(), [False]*len(self.times) )
+
+    def test_within( self ):
+        '''
+        the time covered within windows matches clipping segments to each window
+        '''
+        index = segments.SortedSegments( self.segs )
+        segs = segments.coalesce( self.segs )
+        self.assertEqual( index.duration(), segments.duration( segs ) )
+        for t in [-10, 0, 17, 500, 999, 1010]:
+            self.assertEqual( index.around( t, 25 ), segments.duration( segments.clip( segs, t-25, t+25 ) ) )
+        self.assertEqual( index.within( self.times, self.times+30 ).tolist(), [segments.duration( segments.clip( segs, t, t+30 ) ) for t in self.times] )
+
+    def test_nearest_edge( self ):
+        '''
+        the distance to the nearest start or end of a segment
+        '''
+        index = segments.SortedSegments( [[10, 20], [40, 50]] )
+        self.assertEqual( index.nearestEdge( [0, 10, 14, 25, 31, 60] ).tolist(), [10, 0, 4, 5, 9, 10] )
+        self.assertEqual( segments.SortedSegments( [] ).nearestEdge( 5 ), -1 )
+
+    def test_index( self ):
+        '''
+        SegmentIndex looks up known and active times for a flag
+        '''
+        index = segments.SegmentIndex( [[0, 100]], [[10, 20]] )
+        self.assertEqual( index.isKnown( [50, 150] ).tolist(), [True, False] )
+        self.assertEqual( index.isActive( [15, 50] ).tolist(), [True, False] )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+'''
+tests for segDb2grcDb.segtables
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import unittest
+
+import numpy as np
+
+from segDb2grcDb import segments
+from segDb2grcDb.segtables import SegmentTables
+
+#-------------------------------------------------
+
+NS = segments.NS
+
+class TestSegmentTables(unittest.TestCase):
+
+    def setUp( self ):
+        self.definers = [
+            ("segment_definer:segment_def_id:0", "H1", "A", 1),
+            ("segment_definer:segment_def_id:1", "H1", "B", 2),
+            ("segment_definer:segment_def_id:2", "L1", "A", 1),
+        ]
+        summary = np.array([[0, 0, 100*NS], [1, 0, 50*NS], [1, 60*NS, 100*NS]], dtype=np.int64) ### nothing is known for L1:A:1
+        segment = np.array([[0, 10*NS, 20*NS], [1, 40*NS, 45*NS], [0, 30*NS, 31*NS], [0, 19*NS, 25*NS]], dtype=np.int64)
+        self.tables = SegmentTables( self.definers, summary, segment )
+
+    def test_lookup( self ):
+        '''
+        definers are looked up by name and their segments are returned in nanoseconds
+        '''
+        self.assertEqual( len(self.tables), 3 )
+        self.assertEqual( self.tables.index( "A" ), 0 )
+        self.assertEqual( self.tables.index( "A", ifos="L1" ), 2 )
+        self.assertEqual( self.tables.index( "B", version="2" ), 1 )
+        self.assertRaises( StopIteration, self.tables.index, "B", version=1 )
+        self.assertEqual( self.tables.flag( 1 ), "H1:B:2" )
+        self.assertEqual( (self.tables.segments( 0 )//NS).tolist(), [[10, 20], [30, 31], [19, 25]] )
+        self.assertEqual( (self.tables.segments( 1, summary=True )//NS).tolist(), [[0, 50], [60, 100]] )
+        self.assertEqual( self.tables.segments( 2 ).shape, (0, 2) )
+
+    def test_summarize( self ):
+        '''
+        every definer is summarized at once, and agrees with summarizing each of them separately
+        '''
+        for gpstime in [0, 15, 20, 20.5, 42, 200]:
+            known, active, flagged = self.tables.summarize( gpstime )
+            t = segments.gps2ns( gpstime )
+            for i in range(len(self.tables)):
+                self.assertEqual( known[i], segments.duration( self.tables.segments( i, summary=True ) ) )
+                self.assertEqual( active[i], segments.duration( self.tables.segments( i ) ) )
+                self.assertEqual( flagged[i], segments.count( self.tables.segments( i ), t ) )
+        self.assertEqual( self.tables.summarize( 20 )[2].tolist(), [2, 0, 0] ) ### overlapping segments are each counted
+
+    def test_empty( self ):
+        '''
+        tables without rows summarize to zeros
+        '''
+        tables = SegmentTables( self.definers, np.empty((0,3), dtype=np.int64), np.empty((0,3), dtype=np.int64) )
+        for ans in tables.summarize( 10 ):
+            self.assertEqual( ans.tolist(), [0, 0, 0] )
+
+    def test_fromColumns( self ):
+        '''
+        rows with a segment_def_id that is not defined are skipped
+        '''
+        tables = SegmentTables.fromColumns( {
+            'segment_definer' : {'segment_def_id':["a", "b"], 'ifos':["H1", "L1"], 'name':["A", "B"], 'version':[1, 1]},
+            'segment_summary' : {'segment_def_id':np.array(["b", "c"]), 'start_time':np.array([0, 0]), 'end_time':np.array([10, 10])},
+            'segment'         : {'segment_def_id':np.array(["a", "a"]), 'start_time':np.array([1, 5]), 'start_time_ns':np.array([0, 500000000]), 'end_time':np.array([2, 6]), 'end_time_ns':np.array([0, 0])},
+        } )
+        self.assertEqual( [tables.flag( i ) for i in range(len(tables))], ["H1:A:1", "L1:B:1"] )
+        self.assertEqual( tables.segments( 0 ).tolist(), [[1*NS, 2*NS], [5*NS+NS//2, 6*NS]] )
+        self.assertEqual( tables.segments( 1, summary=True ).tolist(), [[0, 10*NS]] )
+        self.assertEqual( tables.segments( 0, summary=True ).shape, (0, 2) )
+        self.assertEqual( len(SegmentTables.fromColumns( {} )), 0 )
+
+    #---
+
+    def randomTables( self, ndef, nrows, seed=0 ):
+        '''
+        random tables in which some definers have no rows at all
+        '''
+        rng = np.random.RandomState( seed )
+        definers = [("segment_definer:segment_def_id:%d"%i, "H1", "FLAG-%d"%i, 1) for i in range(ndef)]
+        def table():
+            starts = rng.randint( 0, 10**6, nrows ).astype(np.int64)
+            return np.transpose([rng.randint( 0, max(1, ndef-2), nrows ), starts, starts+rng.randint( 1, 100, nrows )]).astype(np.int64)
+        return SegmentTables( definers, table(), table() )
+
+    def test_split( self ):
+        '''
+        split matches segments for every definer, including the order of rows
+        '''
+        for ndef, nrows in [(0, 0), (1, 0), (1, 10), (5, 0), (5, 100), (50, 1000)]:
+            tables = self.randomTables( ndef, nrows if ndef else 0 )
+            split = tables.split()
+            self.assertEqual( len(split), ndef )
+            for i, (known, active) in enumerate(split):
+                self.assertEqual( known.tolist(), tables.segments( i, summary=True ).tolist() )
+                self.assertEqual( active.tolist(), tables.segments( i ).tolist() )
+                self.assertEqual( active.shape[1], 2 )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+'''
+tests for segDb2grcDb.segxml
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from segDb2grcDb import segxml
+from segDb2grcDb import segments
+from segDb2grcDb.segtables import SegmentTables
+
+#-------------------------------------------------
+
+NS = segments.NS
+
+class TestSegXML(unittest.TestCase):
+
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def test_tokenize( self ):
+        '''
+        rows are delimiter-terminated, quotes are removed and nulls become empty strings
+        '''
+        self.assertEqual( segxml.tokenize( '\t"a,b",1,,\n\t"c\\"d",2,3' ), ['a,b', '1', '', 'c"d', '2', '3'] )
+        self.assertEqual( segxml.column( ['1', '', '3'], 'int_4s' ).tolist(), [1, 0, 3] )
+        self.assertEqual( segxml.column( ['a', ''], 'lstring' ), ['a', ''] )
+
+    def test_segments( self ):
+        '''
+        segments survive a round trip through a (gzipped) file, including nanoseconds
+        '''
+        results = [
+            ("H1:A:1", segments.asarray( [[0, 100*NS]] ), segments.asarray( [[10*NS+1, 20*NS], [30*NS, 31*NS+NS//2]] )),
+            ("L1:B:2", segments.asarray( [[0, 50*NS]] ), segments.empty()),
+        ]
+        for filename in ["segments.xml", "segments.xml.gz"]:
+            filename = os.path.join(self.directory, filename)
+            segxml.writeSegments( filename, results, comment="a, \"quoted\" comment" )
+
+            columns = segxml.readColumns( filename, ['segment_definer', 'segment_summary', 'segment'] )
+            self.assertEqual( columns['segment_definer']['comment'], ["a, \"quoted\" comment"]*2 )
+
+            tables = SegmentTables.fromColumns( columns )
+            self.assertEqual( [tables.flag( i ) for i in range(len(tables))], ["H1:A:1", "L1:B:2"] )
+            for i, (_, known, active) in enumerate(results):
+                self.assertEqual( tables.segments( i, summary=True ).tolist(), known.tolist() )
+                self.assertEqual( tables.segments( i ).tolist(), active.tolist() )
+
+    def test_batches( self ):
+        '''
+        long streams are converted in batches without losing rows
+        '''
+        active = segments.asarray( [[i*NS, i*NS+NS//2] for i in range(25000)] )
+        filename = os.path.join(self.directory, "segments.xml")
+        segxml.writeSegments( filename, [("H1:A:1", segments.empty(), active)] )
+        tables = SegmentTables.fromColumns( segxml.readColumns( filename ) )
+        self.assertEqual( tables.segments( 0 ).tolist(), active.tolist() )
+
+    def test_veto_definer( self ):
+        '''
+        veto definers are written and read back as columns, and other tables are skipped
+        '''
+        filename = os.path.join(self.directory, "vetodef.xml")
+        segxml.writeVetoDefiner( filename, [
+            segxml.flag2vetoDefRow( "H1:A:1", category=2, start_pad=-1, end_pad=2 ),
+            segxml.flag2vetoDefRow( "L1:B:3" ),
+        ] )
+        self.assertEqual( segxml.readColumns( filename, ['segment'] ), {} )
+
+        vetodef = segxml.readColumns( filename )['veto_definer']
+        self.assertEqual( vetodef['ifo'], ["H1", "L1"] )
+        self.assertEqual( vetodef['name'], ["A", "B"] )
+        self.assertEqual( vetodef['version'].tolist(), [1, 3] )
+        self.assertEqual( vetodef['category'].tolist(), [2, 1] )
+        self.assertEqual( vetodef['start_pad'].tolist(), [-1, 0] )
+        self.assertEqual( vetodef['end_pad'].tolist(), [2, 0] )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
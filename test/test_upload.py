@@ -0,0 +1,222 @@
+'''
+tests for segDb2grcDb.upload, driving an Uploader against segDb2grcDb.fakes.FakeGraceDb and keeping connections to segDb2grcDb.fakes.FakeGraceDbServer alive
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import sys
+import json
+import unittest
+
+from contextlib import contextmanager
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    from httplib import HTTPConnection
+except ImportError:
+    from http.client import HTTPConnection
+
+from segDb2grcDb.fakes import FakeGraceDb, FakeGraceDbServer
+from segDb2grcDb.upload import Uploader, KeepAlive, keepAlive
+
+#-------------------------------------------------
+
+@contextmanager
+def quiet():
+    '''
+    swallow the tracebacks the Uploader prints for requests it gives up on
+    '''
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+        yield
+    finally:
+        sys.stderr = stderr
+
+class TestUploader(unittest.TestCase):
+
+    def upload( self, gracedb, requests, **kwargs ):
+        '''
+        queue requests (method name, args) all at once, then send them
+        the uploader lingers long enough that every request is queued before any is sent
+        '''
+        kwargs.setdefault( 'linger', 1.0 )
+        kwargs.setdefault( 'backoff', 0.0 )
+        uploader = Uploader( gracedb, **kwargs )
+        for method, args in requests:
+            getattr(uploader, method)( *args )
+        self.assertTrue( uploader.flush( timeout=10.0 ) )
+        uploader.close()
+        return uploader
+
+    #---
+
+    def test_merge( self ):
+        '''
+        consecutive messages for the same event with the same tags and no attachment are merged
+        '''
+        gracedb = FakeGraceDb( {'G1':1.0, 'G2':2.0} )
+        uploader = self.upload( gracedb, [
+            ('writeLog', ('G1', 'a', None, None, ['dq'])),
+            ('writeLog', ('G2', 'x', None, None, ['dq'])), ### other events do not interrupt a merge
+            ('writeLog', ('G1', 'b', None, None, ['dq'])),
+            ('writeLog', ('G1', 'c', None, None, ['dq', 'sig'])), ### different tags
+            ('writeLog', ('G1', 'd', 'result.xml', b'contents', ['dq'])), ### an attachment
+            ('writeLog', ('G1', 'e', None, None, ['dq'])), ### must stay after the attachment
+        ] )
+
+        self.assertEqual( [(graceid, message) for graceid, message, _, _ in gracedb.logs], [
+            ('G1', 'a<br><br>b'),
+            ('G2', 'x'),
+            ('G1', 'c'),
+            ('G1', 'd'),
+            ('G1', 'e'),
+        ] )
+        self.assertEqual( gracedb.logs[3][2], 'result.xml' )
+        self.assertEqual( uploader.counts['merged'], 1 )
+        self.assertEqual( len(uploader), 0 )
+
+    def test_label_dedup( self ):
+        '''
+        labels that were already applied (or queued) are skipped
+        '''
+        gracedb = FakeGraceDb( {'G1':1.0, 'G2':2.0} )
+        uploader = self.upload( gracedb, [
+            ('writeLabel', ('G1', 'DQV')),
+            ('writeLabel', ('G1', 'DQV')),
+            ('writeLabel', ('G2', 'DQV')),
+            ('writeLabel', ('G1', 'DQOK')),
+        ] )
+
+        self.assertEqual( sorted(gracedb.labels), [('G1', 'DQOK'), ('G1', 'DQV'), ('G2', 'DQV')] )
+        self.assertEqual( uploader.counts['skipped'], 1 )
+
+    def test_retry( self ):
+        '''
+        server errors, timeouts and rate limiting are retried
+        '''
+        for status in [503, 408, 429]:
+            gracedb = FakeGraceDb( {'G1':1.0}, failures=2, status=status )
+            uploader = self.upload( gracedb, [('writeLog', ('G1', 'a'))], retries=3 )
+
+            self.assertEqual( [message for _, message, _, _ in gracedb.logs], ['a'] )
+            self.assertEqual( gracedb.requests, 3 )
+            self.assertEqual( uploader.counts['retries'], 2 )
+            self.assertEqual( uploader.counts['failed'], 0 )
+
+    def test_give_up( self ):
+        '''
+        requests are abandoned after retries attempts
+        '''
+        gracedb = FakeGraceDb( {'G1':1.0}, failures=10 )
+        with quiet():
+            uploader = self.upload( gracedb, [('writeLog', ('G1', 'a'))], retries=2 )
+
+        self.assertEqual( gracedb.logs, [] )
+        self.assertEqual( gracedb.requests, 3 )
+        self.assertEqual( uploader.counts['failed'], 1 )
+        self.assertEqual( len(uploader.errors), 1 )
+
+    def test_no_retry( self ):
+        '''
+        other client errors are not retried, and a label that failed may be queued again
+        '''
+        gracedb = FakeGraceDb( {'G1':1.0}, failures=1, status=404 )
+        with quiet():
+            uploader = self.upload( gracedb, [('writeLabel', ('G1', 'DQV'))], retries=3 )
+
+        self.assertEqual( gracedb.labels, [] )
+        self.assertEqual( gracedb.requests, 1 )
+        self.assertEqual( uploader.counts['retries'], 0 )
+        self.assertEqual( uploader.counts['failed'], 1 )
+
+        uploader = self.upload( gracedb, [('writeLabel', ('G1', 'DQV'))] )
+        self.assertEqual( gracedb.labels, [('G1', 'DQV')] )
+
+    def test_forget_labels( self ):
+        '''
+        labels are remembered for each event until that event is flushed
+        '''
+        gracedb = FakeGraceDb( {'G1':1.0, 'G2':2.0} )
+        uploader = Uploader( gracedb, linger=0.5 )
+        try:
+            uploader.writeLabel( 'G1', 'DQV' )
+            uploader.writeLabel( 'G2', 'DQV' )
+            self.assertTrue( uploader.flush( timeout=10.0, graceid='G1' ) )
+            self.assertEqual( sorted(uploader._labels.keys()), ['G2'] )
+
+            uploader.writeLabel( 'G1', 'DQV' ) ### sent again, which GraceDb does not mind
+            uploader.writeLabel( 'G2', 'DQV' ) ### still remembered
+            self.assertTrue( uploader.flush( timeout=10.0 ) )
+            self.assertEqual( dict(uploader._labels), {} )
+            self.assertEqual( sorted(gracedb.labels), [('G1', 'DQV'), ('G1', 'DQV'), ('G2', 'DQV')] )
+            self.assertEqual( uploader.counts['skipped'], 1 )
+        finally:
+            uploader.close()
+
+#------------------------
+
+class TestKeepAlive(unittest.TestCase):
+
+    def setUp( self ):
+        self.server = FakeGraceDbServer()
+        self.server.addEvent( 'G1', 1.0 )
+        self.connector = KeepAlive( lambda : HTTPConnection( self.server.host, self.server.port, timeout=5.0 ) )
+
+    def tearDown( self ):
+        self.server.close()
+
+    def get( self, read=True ):
+        conn = self.connector()
+        conn.request( 'GET', '/api/events/G1' )
+        response = conn.getresponse()
+        if read:
+            self.assertEqual( json.loads(response.read().decode('utf-8'))['graceid'], 'G1' )
+        return response
+
+    def test_reuse( self ):
+        '''
+        a connection is reused once its response has been read
+        '''
+        for _ in range(5):
+            self.get()
+        self.assertEqual( self.server.connections, 1 )
+
+        response = self.get( read=False ) ### the next request needs a new connection
+        self.get()
+        self.assertEqual( self.server.connections, 2 )
+        response.close()
+
+    def test_idle( self ):
+        '''
+        connections that have been idle too long are replaced
+        '''
+        self.connector.max_idle = -1
+        self.get()
+        self.get()
+        self.assertEqual( self.server.connections, 2 )
+
+    def test_keepAlive( self ):
+        '''
+        only clients with a connector are changed, and only once
+        '''
+        class Client(object):
+            connector = None
+        client = keepAlive( Client() )
+        self.assertTrue( isinstance(client.connector, KeepAlive) )
+        connector = client.connector
+        self.assertTrue( keepAlive( client ).connector is connector )
+
+        gracedb = FakeGraceDb()
+        self.assertTrue( keepAlive( gracedb ) is gracedb )
+        self.assertFalse( hasattr(gracedb, 'connector') )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
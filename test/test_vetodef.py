@@ -0,0 +1,109 @@
+'''
+tests for segDb2grcDb.vetodef
+'''
+__author__ = "Reed Essick (reed.essick@ligo.org), Peter Shawhan (pshawhan@umd.edu)"
+
+#-------------------------------------------------
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from segDb2grcDb import segxml
+from segDb2grcDb import segments
+from segDb2grcDb import vetodef
+
+#-------------------------------------------------
+
+def segs( *pairs ):
+    return segments.asarray( [[segments.gps2ns(s), segments.gps2ns(e)] for s, e in pairs] )
+
+def gps( segs ):
+    return (segs//segments.NS).tolist()
+
+class TestVetoDefiner(unittest.TestCase):
+
+    def setUp( self ):
+        ### H1:C:1 only applies after 150 and L1:A:1 stops applying at 100
+        self.definer = vetodef.VetoDefiner(
+            ['H1', 'H1', 'H1', 'L1'], ['A', 'B', 'C', 'A'], [1, 1, 1, 1],
+            [1, 2, 2, 1], [0, 0, 150, 0], [0, 0, 0, 100], [-2, 0, -1, 0], [3, 0, 1, 0],
+        )
+        self.results = {
+            'H1:A:1' : (segs( (90, 210) ), segs( (110, 120), (199, 205) )),
+            'H1:B:1' : (segs( (100, 150) ), segs( (120, 130) )),
+        }
+
+    def test_window( self ):
+        '''
+        only rows that apply within the window are used, and the window is extended by their padding
+        '''
+        self.assertEqual( self.definer.flags, ['H1:A:1', 'H1:B:1', 'H1:C:1', 'L1:A:1'] )
+        self.assertEqual( self.definer.rows( 100, 200 ).tolist(), [0, 1, 2] )
+        self.assertEqual( self.definer.rows( 0, 100 ).tolist(), [0, 1, 3] )
+        self.assertEqual( self.definer.window( 100, 200 ), (97, 202) )
+        self.assertEqual( self.definer.window( 0, 100 ), (-3, 102) )
+        self.assertEqual( vetodef.VetoDefiner( [], [], [], [], [], [], [], [] ).window( 100, 200 ), (100, 200) )
+
+    def test_evaluate( self ):
+        '''
+        active segments are padded and each category is only known where all of its flags are known
+        '''
+        ans = self.definer.evaluate( self.results, 100, 200 )
+        self.assertEqual( list(ans.keys()), ['H1'] )
+        self.assertEqual( sorted(ans['H1'].keys()), ['CAT1', 'CAT2'] )
+
+        known, active, flags = ans['H1']['CAT1']
+        self.assertEqual( (gps( known ), gps( active )), ([[100, 200]], [[108, 123], [197, 200]]) )
+        self.assertEqual( sorted(flags.keys()), ['H1:A:1'] )
+
+        known, active, flags = ans['H1']['CAT2'] ### H1:C:1 is missing after 150
+        self.assertEqual( (gps( known ), gps( active )), ([[100, 150]], [[120, 130]]) )
+        self.assertEqual( sorted(flags.keys()), ['H1:B:1', 'H1:C:1'] )
+        self.assertEqual( (gps( flags['H1:C:1'][0] ), gps( flags['H1:C:1'][1] )), ([], []) )
+
+    def test_cumulative( self ):
+        '''
+        cumulative categories include every lower category
+        '''
+        known, active, flags = self.definer.evaluate( self.results, 100, 200, cumulative=True )['H1']['CAT2']
+        self.assertEqual( (gps( known ), gps( active )), ([[100, 150]], [[108, 130]]) )
+        self.assertEqual( sorted(flags.keys()), ['H1:A:1', 'H1:B:1', 'H1:C:1'] )
+
+    def test_negative_padding( self ):
+        '''
+        segments that are shorter than their (negative) padding disappear
+        '''
+        definer = vetodef.VetoDefiner( ['H1'], ['A'], [1], [1], [0], [0], [2], [-2] )
+        known, active, _ = definer.evaluate( {'H1:A:1':(segs( (0, 100) ), segs( (10, 13), (20, 30) ))}, 0, 100 )['H1']['CAT1']
+        self.assertEqual( gps( active ), [[22, 28]] )
+
+    def test_load( self ):
+        '''
+        veto definers are read from files and only parsed again when the file changes
+        '''
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'vetodef.xml')
+            segxml.writeVetoDefiner( path, [segxml.flag2vetoDefRow( 'H1:A:1', category=2, start_pad=-1, end_pad=1 )] )
+            definer = vetodef.loadVetoDefiner( path )
+            self.assertEqual( (definer.flags, definer.categories.tolist(), definer.start_pads.tolist(), definer.end_pads.tolist()), (['H1:A:1'], [2], [-1], [1]) )
+            self.assertEqual( definer.end_times.tolist(), [vetodef.FOREVER] )
+            self.assertTrue( vetodef.loadVetoDefiner( path ) is definer )
+
+            segxml.writeVetoDefiner( path, [segxml.flag2vetoDefRow( 'H1:A:1' ), segxml.flag2vetoDefRow( 'H1:B:1' )] )
+            os.utime( path, (time.time()+10, time.time()+10) )
+            self.assertEqual( len(vetodef.loadVetoDefiner( path )), 2 )
+
+            segxml.writeSegments( path, [] )
+            os.utime( path, (time.time()+20, time.time()+20) )
+            self.assertRaises( ValueError, vetodef.loadVetoDefiner, path )
+        finally:
+            shutil.rmtree( directory, ignore_errors=True )
+
+#-------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()